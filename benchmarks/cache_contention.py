@@ -0,0 +1,96 @@
+"""Бенчмарк задержки попаданий в кэш при конкурентных записях.
+
+Сравнивает прежнюю реализацию (один глобальный asyncio.Lock на get/set/delete)
+с текущим CacheService (чтение без блокировок, записи по шардам).
+
+Запуск: python -m benchmarks.cache_contention
+"""
+
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from tgbot.services.cache_service import CacheService
+
+READERS = 50
+WRITERS = 10
+HOT_KEYS = 100
+DURATION = 2.0  # секунды на один прогон
+WRITE_INTERVAL = 0.003  # ~300 записей в секунду на писателя
+
+
+class GlobalLockCache:
+    """Прежняя реализация кэша: один глобальный lock на все операции"""
+
+    def __init__(self):
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Optional[Any]:
+        async with self._lock:
+            if key in self._cache:
+                cache_item = self._cache[key]
+                if datetime.now() < cache_item['expires_at']:
+                    return cache_item['value']
+                del self._cache[key]
+            return None
+
+    async def set(self, key: str, value: Any, ttl_seconds: int = 300) -> None:
+        async with self._lock:
+            self._cache[key] = {
+                'value': value,
+                'expires_at': datetime.now() + timedelta(seconds=ttl_seconds)
+            }
+
+
+async def _reader(cache, latencies: list, deadline: float) -> None:
+    i = 0
+    while time.perf_counter() < deadline:
+        key = f"key_{i % HOT_KEYS}"
+        started = time.perf_counter()
+        await cache.get(key)
+        latencies.append(time.perf_counter() - started)
+        i += 1
+        await asyncio.sleep(0)
+
+
+async def _writer(cache, writer_id: int, deadline: float) -> None:
+    i = 0
+    while time.perf_counter() < deadline:
+        await cache.set(f"key_{(i * WRITERS + writer_id) % HOT_KEYS}", [{"value": i}])
+        i += 1
+        await asyncio.sleep(WRITE_INTERVAL)
+
+
+async def run(cache) -> Dict[str, float]:
+    for i in range(HOT_KEYS):
+        await cache.set(f"key_{i}", [{"value": i}])
+
+    latencies: list = []
+    deadline = time.perf_counter() + DURATION
+    await asyncio.gather(
+        *[_reader(cache, latencies, deadline) for _ in range(READERS)],
+        *[_writer(cache, w, deadline) for w in range(WRITERS)],
+    )
+    latencies.sort()
+    return {
+        "hits": len(latencies),
+        "p50_us": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "max_us": latencies[-1] * 1e6,
+    }
+
+
+async def main() -> None:
+    for name, cache in (("global lock (before)", GlobalLockCache()), ("lock-free reads (after)", CacheService())):
+        result = await run(cache)
+        print(
+            f"{name:<25} hits={result['hits']:>8} "
+            f"p50={result['p50_us']:.2f}us p99={result['p99_us']:.2f}us max={result['max_us']:.2f}us"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""Бенчмарк памяти: список словарей против CompactRows.
+
+Строит синтетический месяц накладных в форме результата
+get_all_sales_invoices_summary и сравнивает объём в памяти (tracemalloc)
+и оценку estimate_size, которой кэш ограничивает свой объём.
+
+Запуск: python -m benchmarks.cache_memory
+"""
+
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from tgbot.services.cache_compact import CompactRows
+from tgbot.services.cache_service import estimate_size
+
+ROWS = 5000
+
+
+def make_invoices(count: int) -> list:
+    """Строки в том виде, в каком их возвращает row._asdict()"""
+    stores = [f"Магазин №{i}" for i in range(1, 16)]
+    statuses = ["Завершен", "Новый", "В работе"]
+    customers = [f"ООО Покупатель {i}" for i in range(1, 400)]
+    start = datetime(2024, 12, 1)
+    return [
+        {
+            "Код": 100000 + i,
+            "Дата/время": start + timedelta(minutes=i * 7),
+            "Тип операции": "Продажа",
+            "Магазин/Склад": random.choice(stores),
+            "Статус документа": random.choice(statuses),
+            "Покупатель": random.choice(customers),
+            "Сумма продажи": Decimal(random.randint(10000, 50000000)) / 100,
+        }
+        for i in range(count)
+    ]
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    value = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del value
+    return allocated
+
+
+def main() -> None:
+    random.seed(42)
+    rows = make_invoices(ROWS)
+
+    # Значения строк общие, поэтому считаем только накладные расходы на контейнеры
+    dict_bytes = measure(lambda: [dict(row) for row in rows])
+    compact_bytes = measure(lambda: CompactRows.from_rows(rows))
+
+    compact = CompactRows.from_rows(rows)
+    assert compact.to_list() == rows
+
+    print(f"rows: {ROWS}")
+    print(f"list of dicts: containers {dict_bytes / 1024:>8.0f} KB, estimate_size {estimate_size(rows) / 1024:>8.0f} KB")
+    print(f"CompactRows:   containers {compact_bytes / 1024:>8.0f} KB, estimate_size {estimate_size(compact) / 1024:>8.0f} KB")
+    print(f"container overhead ratio: {dict_bytes / max(compact_bytes, 1):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Проверка планов запросов ERP с рекомендуемыми индексами.
+
+Создаёт в SQLite (в памяти) минимальную схему ERP-таблиц с индексами из
+sql/recommended_indexes.sql, выполняет запросы TGUser, перехватывает
+сгенерированный SQL и печатает EXPLAIN QUERY PLAN для каждого из них.
+Фильтр по периоду должен давать SEARCH по индексу на sls_datetime,
+а не SCAN всей doc_sales.
+
+На боевой MySQL те же запросы стоит проверить через EXPLAIN - оптимизатор
+другой, но условие вида sls_datetime >= :start AND sls_datetime < :end
+использует индекс в обеих СУБД, а EXTRACT(... FROM sls_datetime) - нет.
+
+Запуск: python -m benchmarks.query_plans
+"""
+
+import asyncio
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from tgbot.models.models import SalesSummary, TGUser
+from tgbot.services.db_base import Base
+from tgbot.services.sales_summary import sales_summary
+
+INDEXES_SQL = Path(__file__).resolve().parent.parent / "sql" / "recommended_indexes.sql"
+
+SCHEMA = """
+CREATE TABLE doc_sales (
+    sls_id INTEGER PRIMARY KEY, sls_datetime DATETIME, sls_object INTEGER, sls_status INTEGER,
+    sls_customer INTEGER, sls_performed INTEGER, sls_deleted INTEGER, sls_note TEXT
+);
+CREATE TABLE operations (
+    opr_id INTEGER PRIMARY KEY, opr_document INTEGER, opr_type INTEGER, opr_good INTEGER, opr_quantity NUMERIC
+);
+CREATE TABLE operations_additional_prop (oap_id INTEGER PRIMARY KEY, oap_operation INTEGER, oap_price1 NUMERIC);
+CREATE TABLE doc_cash_operations (
+    cop_id INTEGER PRIMARY KEY, cop_payment INTEGER, cop_type INTEGER, cop_value NUMERIC
+);
+CREATE TABLE dir_customers (
+    cstm_id INTEGER PRIMARY KEY, cstm_name TEXT,
+    cstm_phone TEXT, cstm_phone2 TEXT, cstm_phone3 TEXT, cstm_phone4 TEXT
+);
+CREATE TABLE dir_objects (obj_id INTEGER PRIMARY KEY, obj_name TEXT);
+CREATE TABLE dir_goods (gd_id INTEGER PRIMARY KEY, gd_code TEXT, gd_name TEXT);
+CREATE TABLE dir_sales_status (sords_id INTEGER PRIMARY KEY, sords_name TEXT);
+"""
+
+# Статистика для планировщика, близкая к боевой: ~1 млн продаж, ~20 тыс. покупателей.
+# Без неё SQLite на пустых таблицах выбирает индексы почти наугад.
+STATS = [
+    ("doc_sales", "idx_sls_state_datetime", "1000000 500000 500000 30 1"),
+    ("doc_sales", "idx_sls_customer_datetime", "1000000 50 2"),
+    ("operations", "idx_opr_document_type", "5000000 5 3"),
+    ("operations_additional_prop", "idx_oap_operation", "5000000 1"),
+    ("doc_cash_operations", "idx_cop_payment_type", "800000 2 1"),
+    ("dir_customers", None, "20000"),
+    ("bot_sales_summary", "ix_bot_sales_summary_period_customer", "1000000 100000 8000 50"),
+    ("bot_sales_summary", "ix_bot_sales_summary_datetime", "1000000 30 1"),
+]
+
+
+def sqlite_indexes() -> List[str]:
+    """CREATE INDEX из sql/recommended_indexes.sql (без комментариев)"""
+    statements = []
+    for statement in INDEXES_SQL.read_text(encoding="utf-8").split(";"):
+        statement = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--")).strip()
+        if statement.startswith("CREATE INDEX"):
+            statements.append(statement)
+    return statements
+
+
+def bot_tables() -> List[str]:
+    """CREATE TABLE / CREATE INDEX для таблиц бота (telegram_users, bot_sales_summary, ...) в диалекте SQLite"""
+    dialect = sqlite.dialect()
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)))
+        statements.extend(str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes)
+    return statements
+
+
+def _concat(*parts):
+    return "".join("" if part is None else str(part) for part in parts)
+
+
+async def capture_queries(database: str) -> List[Tuple[str, str, tuple]]:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    captured: List[Tuple[str, str, tuple]] = []
+    current = {"name": ""}
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def register_functions(dbapi_connection, _):
+        dbapi_connection.create_function("concat", -1, _concat)
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((current["name"], statement, tuple(parameters)))
+
+    db = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    # Планы запросов к bot_sales_summary (как после первого заполнения таблицы)
+    queries = [
+        ("get_all_sales_invoices_summary", lambda: TGUser.get_all_sales_invoices_summary(db, 2024, 12)),
+        ("get_sales_invoices_page", lambda: TGUser.get_sales_invoices_page(db, 2024, 12, 10)),
+        ("get_sales_invoices_page (after)", lambda: TGUser.get_sales_invoices_page(
+            db, 2024, 12, 10, after=(datetime(2024, 12, 20, 10, 0), 500)
+        )),
+        ("get_sales_invoices_totals", lambda: TGUser.get_sales_invoices_totals(db, 2024, 12)),
+        ("get_sales_documents_details", lambda: TGUser.get_sales_documents_details(db, [1, 2, 3])),
+        ("get_customer_sales_summary", lambda: TGUser.get_customer_sales_summary(db, [1, 2], 2024, 12)),
+        ("get_sales_years", lambda: TGUser.get_sales_years(db)),
+        ("get_sales_months", lambda: TGUser.get_sales_months(db, 2024)),
+        ("get_customers_by_period", lambda: TGUser.get_customers_by_period(db, 2024, 12)),
+        ("get_customers_by_period (year)", lambda: TGUser.get_customers_by_period(db, 2024)),
+        ("get_user_invoice", lambda: TGUser.get_user_invoice(db, [1, 2], 2024, 12)),
+        ("get_customer_phones", lambda: TGUser.get_customer_phones(db, after_id=100)),
+        ("get_customer_name", lambda: TGUser.get_customer_name(db, [1, 2])),
+        ("SalesSummary.get_source_range", lambda: SalesSummary.get_source_range(db, 1000, 2000, 500)),
+        ("SalesSummary.get_source_since", lambda: SalesSummary.get_source_since(db, datetime(2024, 11, 1), 2000)),
+        ("SalesSummary.get_source_by_ids", lambda: SalesSummary.get_source_by_ids(db, [10, 20, 30], 500)),
+        ("SalesSummary.get_since", lambda: SalesSummary.get_since(db, datetime(2024, 11, 1), 2000)),
+    ]
+    # Списки, которые до первого заполнения таблицы читают ERP (queries.ERP_FALLBACK)
+    fallback = {
+        "get_all_sales_invoices_summary", "get_sales_invoices_page", "get_sales_invoices_page (after)",
+        "get_sales_invoices_totals", "get_sales_years", "get_sales_months",
+        "get_customers_by_period", "get_customers_by_period (year)",
+    }
+    for ready, suffix in ((True, ""), (False, " (ERP fallback)")):
+        sales_summary.ready = ready
+        for name, query in queries:
+            if ready or name in fallback:
+                current["name"] = name + suffix
+                await query()
+    await engine.dispose()
+    return captured
+
+
+def main() -> None:
+    database = "file:query_plans?mode=memory&cache=shared"
+    keeper = sqlite3.connect(database, uri=True)
+    keeper.create_function("concat", -1, _concat)
+    keeper.executescript(SCHEMA)
+    for statement in sqlite_indexes() + bot_tables():
+        keeper.execute(statement)
+    keeper.execute("ANALYZE")
+    keeper.executemany("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (?, ?, ?)", STATS)
+    keeper.execute("ANALYZE sqlite_schema")
+    keeper.commit()
+
+    captured = asyncio.run(capture_queries(f"{database}&uri=true"))
+    for name, statement, parameters in captured:
+        print(f"== {name}")
+        for row in keeper.execute(f"EXPLAIN QUERY PLAN {statement}", parameters):
+            print(f"   {row[-1]}")
+    keeper.close()
+
+
+if __name__ == "__main__":
+    main()
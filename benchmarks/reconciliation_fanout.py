@@ -0,0 +1,134 @@
+"""Акт сверки: общий LEFT JOIN строк и оплат против предагрегации по документам.
+
+Заполняет SQLite (в памяти) документами продажи с несколькими строками и
+несколькими оплатами, выполняет старый запрос (один GROUP BY поверх
+operations x doc_cash_operations) и TGUser.get_customer_sales_summary,
+сверяет суммы с ожидаемыми, посчитанными в Python, и сравнивает время.
+
+Запуск: python -m benchmarks.reconciliation_fanout
+"""
+
+import asyncio
+import random
+import time
+from decimal import Decimal
+from typing import Dict, List
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.query_plans import SCHEMA, STATS, _concat, sqlite_indexes
+from tgbot.models.models import TGUser
+
+CUSTOMER_ID = 1
+DOCUMENTS = 300
+MAX_LINES = 12
+MAX_PAYMENTS = 6
+RUNS = 5
+
+LEGACY_SQL = """
+SELECT s.sls_datetime AS "Дата",
+       coalesce(sum(op.opr_quantity * a.oap_price1), 0) AS "Сумма",
+       coalesce(sum(CASE WHEN dco.cop_type IN (1, 4) THEN dco.cop_value ELSE 0 END), 0) AS "Оплачено"
+FROM doc_sales AS s
+LEFT JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2
+LEFT JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id
+LEFT JOIN doc_cash_operations AS dco ON dco.cop_payment = s.sls_id
+WHERE s.sls_customer = :customer_id AND s.sls_performed = 1 AND s.sls_deleted = 0
+GROUP BY s.sls_id, s.sls_datetime, s.sls_note
+"""
+
+
+def joined_rows_sql(query: str) -> str:
+    """Число строк до группировки - размер промежуточного результата"""
+    select_from = query[query.index("FROM"):query.index("GROUP BY")]
+    return f"SELECT COUNT(*) {select_from}"
+
+
+async def fill(engine) -> Dict[int, Dict[str, Decimal]]:
+    """Заполнить фикстуру; вернуть ожидаемые суммы по документам"""
+    random.seed(7)
+    expected: Dict[int, Dict[str, Decimal]] = {}
+    sales, operations, props, payments = [], [], [], []
+    for doc_id in range(1, DOCUMENTS + 1):
+        sales.append({"id": doc_id, "dt": f"2024-12-{doc_id % 28 + 1:02d} 10:00:00", "customer": CUSTOMER_ID})
+        amount = paid = Decimal(0)
+        # Документы без строк и без оплат тоже должны попасть в акт
+        for _ in range(random.randint(0, MAX_LINES)):
+            opr_id = len(operations) + 1
+            quantity, price = random.randint(1, 5), random.randint(1000, 90000)
+            operations.append({"id": opr_id, "doc": doc_id, "qty": quantity})
+            props.append({"id": opr_id, "opr": opr_id, "price": price})
+            amount += quantity * price
+        for _ in range(random.randint(0, MAX_PAYMENTS)):
+            cop_type, value = random.choice([1, 2, 4]), random.randint(1000, 200000)
+            payments.append({"id": len(payments) + 1, "doc": doc_id, "type": cop_type, "value": value})
+            if cop_type in (1, 4):
+                paid += value
+        expected[doc_id] = {"Сумма": amount, "Оплачено": paid}
+
+    async with engine.begin() as conn:
+        for statement in SCHEMA.split(";") + sqlite_indexes():
+            if statement.strip():
+                await conn.execute(text(statement))
+        await conn.execute(
+            text("INSERT INTO doc_sales VALUES (:id, :dt, 1, 1, :customer, 1, 0, '')"), sales
+        )
+        await conn.execute(text("INSERT INTO operations VALUES (:id, :doc, 2, 1, :qty)"), operations)
+        await conn.execute(text("INSERT INTO operations_additional_prop VALUES (:id, :opr, :price)"), props)
+        await conn.execute(text("INSERT INTO doc_cash_operations VALUES (:id, :doc, :type, :value)"), payments)
+        # Планировщик должен выбирать индексы как на боевых объёмах
+        await conn.execute(text("ANALYZE"))
+        await conn.execute(
+            text("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (:tbl, :idx, :stat)"),
+            [{"tbl": tbl, "idx": idx, "stat": stat} for tbl, idx, stat in STATS]
+        )
+        await conn.execute(text("ANALYZE sqlite_schema"))
+    return expected
+
+
+def totals(rows: List[dict]) -> Dict[str, Decimal]:
+    return {
+        "Сумма": sum(Decimal(row["Сумма"]) for row in rows),
+        "Оплачено": sum(Decimal(row["Оплачено"]) for row in rows),
+    }
+
+
+async def timed(query) -> tuple:
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        rows = await query()
+    return rows, (time.perf_counter() - started) / RUNS * 1000
+
+
+async def main() -> None:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    event.listen(engine.sync_engine, "connect", lambda conn, _: conn.create_function("concat", -1, _concat))
+    expected = await fill(engine)
+    db = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def legacy():
+        async with db() as session:
+            result = await session.execute(text(LEGACY_SQL), {"customer_id": CUSTOMER_ID})
+            return [row._asdict() for row in result.fetchall()]
+
+    legacy_rows, legacy_ms = await timed(legacy)
+    async with db() as session:
+        joined = await session.scalar(text(joined_rows_sql(LEGACY_SQL)), {"customer_id": CUSTOMER_ID})
+    rows, new_ms = await timed(lambda: TGUser.get_customer_sales_summary(db, [CUSTOMER_ID], 2024, 12))
+    await engine.dispose()
+
+    expected_totals = {key: sum(doc[key] for doc in expected.values()) for key in ("Сумма", "Оплачено")}
+    assert len(rows) == DOCUMENTS, f"expected {DOCUMENTS} rows, got {len(rows)}"
+    assert totals(rows) == expected_totals, f"{totals(rows)} != {expected_totals}"
+    assert all(Decimal(row["Долг"]) == Decimal(row["Сумма"]) - Decimal(row["Оплачено"]) for row in rows)
+
+    print(f"documents: {DOCUMENTS}, expected totals: {expected_totals}")
+    print(f"legacy join:    {joined} joined rows before GROUP BY")
+    print(f"legacy join:    {len(legacy_rows)} rows, totals {totals(legacy_rows)}, {legacy_ms:.1f} ms")
+    print(f"pre-aggregated: {len(rows)} rows, totals {totals(rows)}, {new_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
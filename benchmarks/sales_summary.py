@@ -0,0 +1,151 @@
+"""Админские списки: агрегация по ERP-таблицам против таблицы bot_sales_summary.
+
+Заполняет SQLite-файл годами продаж, строит bot_sales_summary тем же
+sales_summary (SalesSummaryRefresher), что и бот (первое заполнение = догрузка с нуля), и
+сравнивает время прежних запросов по doc_sales x operations x
+operations_additional_prop с запросами TGUser, читающими сводную таблицу.
+Результаты сверяются между собой.
+
+Запуск: python -m benchmarks.sales_summary
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+from decimal import Decimal
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.query_plans import SCHEMA, STATS, _concat, bot_tables, sqlite_indexes
+from tgbot.models.models import TGUser
+from tgbot.models.period import SalesPeriod
+from tgbot.services.sales_summary import sales_summary
+
+DOCUMENTS = 100000
+CUSTOMERS = 2000
+MAX_LINES = 5
+YEARS = (2022, 2023, 2024)
+RUNS = 5
+
+LEGACY_YEARS = """
+SELECT DISTINCT CAST(strftime('%Y', sls_datetime) AS INTEGER) AS year FROM doc_sales
+WHERE sls_performed = 1 AND sls_deleted = 0 ORDER BY year DESC
+"""
+
+LEGACY_MONTHS = """
+SELECT DISTINCT CAST(strftime('%m', sls_datetime) AS INTEGER) AS month FROM doc_sales
+WHERE sls_performed = 1 AND sls_deleted = 0
+  AND sls_datetime >= :period_start AND sls_datetime < :period_end ORDER BY month
+"""
+
+LEGACY_CUSTOMERS = """
+SELECT c.cstm_id AS id, c.cstm_name AS name, c.cstm_phone AS phone
+FROM doc_sales AS s JOIN dir_customers AS c ON s.sls_customer = c.cstm_id
+WHERE s.sls_performed = 1 AND s.sls_deleted = 0
+  AND s.sls_datetime >= :period_start AND s.sls_datetime < :period_end
+GROUP BY c.cstm_id, c.cstm_name, c.cstm_phone ORDER BY c.cstm_name
+"""
+
+LEGACY_TOTALS = """
+SELECT count(DISTINCT s.sls_id) AS count, coalesce(sum(op.opr_quantity * a.oap_price1), 0) AS total
+FROM doc_sales AS s
+JOIN dir_objects AS o ON s.sls_object = o.obj_id
+JOIN dir_sales_status AS dss ON s.sls_status = dss.sords_id
+JOIN dir_customers AS c ON s.sls_customer = c.cstm_id
+JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2
+JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id
+WHERE s.sls_performed = 1 AND s.sls_deleted = 0
+  AND s.sls_datetime >= :period_start AND s.sls_datetime < :period_end
+"""
+
+
+async def fill(engine) -> None:
+    random.seed(11)
+    sales, operations = [], []
+    for doc_id in range(1, DOCUMENTS + 1):
+        year, month, day = random.choice(YEARS), random.randint(1, 12), random.randint(1, 28)
+        sales.append({
+            "id": doc_id, "dt": f"{year}-{month:02d}-{day:02d} {random.randint(8, 20):02d}:00:00",
+            "customer": random.randint(1, CUSTOMERS), "performed": int(doc_id % 50 != 0)
+        })
+        for _ in range(random.randint(0, MAX_LINES)):
+            operations.append({"id": len(operations) + 1, "doc": doc_id, "qty": random.randint(1, 5)})
+
+    async with engine.begin() as conn:
+        for statement in SCHEMA.split(";") + sqlite_indexes() + bot_tables():
+            if statement.strip():
+                await conn.execute(text(statement))
+        await conn.execute(text("INSERT INTO dir_objects VALUES (1, 'Магазин №1')"))
+        await conn.execute(text("INSERT INTO dir_sales_status VALUES (1, 'Завершен')"))
+        await conn.execute(
+            text("INSERT INTO dir_customers VALUES (:id, :name, NULL, NULL, NULL, NULL)"),
+            [{"id": i, "name": f"Покупатель {i:05d}"} for i in range(1, CUSTOMERS + 1)]
+        )
+        await conn.execute(text("INSERT INTO doc_sales VALUES (:id, :dt, 1, 1, :customer, :performed, 0, '')"), sales)
+        await conn.execute(text("INSERT INTO operations VALUES (:id, :doc, 2, 1, :qty)"), operations)
+        await conn.execute(text("INSERT INTO operations_additional_prop VALUES (:id, :id, 12500)"), operations)
+        await conn.execute(text("ANALYZE"))
+        await conn.execute(
+            text("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (:tbl, :idx, :stat)"),
+            [{"tbl": tbl, "idx": idx, "stat": stat} for tbl, idx, stat in STATS]
+        )
+        await conn.execute(text("ANALYZE sqlite_schema"))
+
+
+async def timed(query) -> tuple:
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        result = await query()
+    return result, (time.perf_counter() - started) / RUNS * 1000
+
+
+async def main() -> None:
+    path = os.path.join(tempfile.mkdtemp(), "sales_summary.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", lambda conn, _: conn.create_function("concat", -1, _concat))
+    await fill(engine)
+    db = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    started = time.perf_counter()
+    documents = await sales_summary.refresh_new(db)
+    print(f"initial fill of bot_sales_summary: {documents} documents in {time.perf_counter() - started:.2f} s")
+
+    async def legacy(sql, params=None, shape="column"):
+        async with db() as session:
+            rows = (await session.execute(text(sql), params or {})).fetchall()
+        if shape == "column":
+            return [row[0] for row in rows]
+        return [row._asdict() for row in rows] if shape == "rows" else rows[0]._asdict()
+
+    year, month = YEARS[-1], 6
+    year_params, month_params = SalesPeriod(year).params(), SalesPeriod(year, month).params()
+    cases = [
+        ("sales years", lambda: legacy(LEGACY_YEARS), lambda: TGUser.get_sales_years(db)),
+        ("sales months", lambda: legacy(LEGACY_MONTHS, year_params), lambda: TGUser.get_sales_months(db, year)),
+        ("customers by period", lambda: legacy(LEGACY_CUSTOMERS, month_params, shape="rows"),
+         lambda: TGUser.get_customers_by_period(db, year, month)),
+        ("invoice totals", lambda: legacy(LEGACY_TOTALS, month_params, shape="row"),
+         lambda: TGUser.get_sales_invoices_totals(db, year, month)),
+    ]
+    print(f"{'query':<22}{'ERP aggregate':>16}{'summary':>12}   (ms per call)")
+    for name, old, new in cases:
+        old_result, old_ms = await timed(old)
+        new_result, new_ms = await timed(new)
+        if name == "customers by period":
+            # Порядок покупателей с одинаковым названием не определён
+            old_result, new_result = sorted(row["id"] for row in old_result), sorted(row["id"] for row in new_result)
+        if name == "invoice totals":
+            old_result["total"], new_result["total"] = Decimal(old_result["total"]), Decimal(new_result["total"])
+        assert old_result == new_result, f"{name}: {old_result} != {new_result}"
+        print(f"{name:<22}{old_ms:>16.1f}{new_ms:>12.1f}")
+
+    await engine.dispose()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
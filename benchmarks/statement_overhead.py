@@ -0,0 +1,104 @@
+"""Накладные расходы Python на один вызов запроса ERP.
+
+Сравнивает построение дерева select(literal_column(...)).select_from(text(...))
+при каждом вызове (как было в TGUser) с готовыми выражениями из
+tgbot/models/queries.py. Запросы выполняются на пустых таблицах SQLite в
+памяти, поэтому время почти целиком - работа SQLAlchemy: построение
+выражения, вычисление ключа кэша компиляции, поиск в кэше и выполнение.
+
+Запуск: python -m benchmarks.statement_overhead
+"""
+
+import statistics
+import time
+
+from sqlalchemy import create_engine, event, literal_column, select, text
+
+from benchmarks.query_plans import SCHEMA, _concat, bot_tables
+from tgbot.models import queries
+from tgbot.models.period import SalesPeriod
+
+CALLS = 2000
+ROUNDS = 5
+
+
+def build_document_details():
+    """Построение запроса деталей накладной так, как это делалось при каждом вызове"""
+    return select(
+        literal_column("g.gd_code").label("Код товара"),
+        literal_column("g.gd_name").label("Наименование"),
+        literal_column("op.opr_quantity").label("Количество"),
+        literal_column("a.oap_price1").label("Цена"),
+        (literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма"),
+        literal_column("o.obj_name").label("Магазин/Склад"),
+        literal_column("s.sls_datetime").label("Дата/Время"),
+        literal_column("s.sls_id").label("ID Док")
+    ).select_from(
+        text(
+            "doc_sales AS s "
+            "JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
+            "JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id "
+            "JOIN dir_goods AS g ON g.gd_id = op.opr_good "
+            "JOIN dir_objects AS o ON s.sls_object = o.obj_id"
+        )
+    ).where(
+        text("s.sls_id = :sales_id"),
+        text("s.sls_performed = 1"),
+        text("s.sls_deleted = 0")
+    ).order_by(
+        text("op.opr_id")
+    )
+
+
+def build_invoices_summary():
+    """Построение сводки накладных за период при каждом вызове (тем же построителем, что в queries.py)"""
+    return queries._sales_invoices_summary(queries._SUMMARY, with_period=True)
+
+
+def per_call_us(connection, statement_factory, params) -> float:
+    """Медиана по раундам времени одного вызова (мкс)"""
+    results = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for _ in range(CALLS):
+            connection.execute(statement_factory(), params).fetchall()
+        results.append((time.perf_counter() - started) / CALLS * 1e6)
+    return statistics.median(results)
+
+
+def build_only_us(statement_factory) -> float:
+    """Время одного построения выражения без выполнения (мкс)"""
+    started = time.perf_counter()
+    for _ in range(CALLS):
+        statement_factory()
+    return (time.perf_counter() - started) / CALLS * 1e6
+
+
+def main() -> None:
+    engine = create_engine("sqlite://")
+    event.listen(engine, "connect", lambda conn, _: conn.create_function("concat", -1, _concat))
+    period = SalesPeriod(2024, 12).params()
+    cases = [
+        ("get_sales_document_details", build_document_details, lambda: queries.SALES_DOCUMENT_DETAILS,
+         {"sales_id": 1}),
+        ("get_all_sales_invoices_summary", build_invoices_summary,
+         lambda: queries.SALES_INVOICES_SUMMARY_BY_PERIOD, period),
+    ]
+    with engine.connect() as connection:
+        for statement in SCHEMA.split(";") + bot_tables():
+            if statement.strip():
+                connection.exec_driver_sql(statement)
+
+        print(f"{'query':<32}{'build per call':>16}{'module-level':>14}{'ratio':>8}   (µs per call, {CALLS} calls)")
+        for name, build, prebuilt, params in cases:
+            rebuilt_us = per_call_us(connection, build, params)
+            prebuilt_us = per_call_us(connection, prebuilt, params)
+            print(f"{name:<32}{rebuilt_us:>16.1f}{prebuilt_us:>14.1f}{rebuilt_us / prebuilt_us:>7.1f}x")
+
+        build_us = statistics.median(build_only_us(build_invoices_summary) for _ in range(ROUNDS))
+        print(f"building the summary tree alone: {build_us:.1f} µs")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Пиковая память: полная выборка против потокового чтения.
+
+Заполняет SQLite-файл годом накладных и обходит их двумя способами:
+get_all_sales_invoices_summary (fetchall + список словарей) и
+stream_sales_invoices_summary (серверный курсор, fetch_size строк за раз).
+Пик памяти Python измеряется tracemalloc.
+
+Запуск: python -m benchmarks.stream_memory
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.query_plans import SCHEMA, _concat, bot_tables
+from tgbot.models.models import TGUser
+from tgbot.services.sales_summary import sales_summary
+
+INVOICES = 50000
+FETCH_SIZE = 500
+
+
+async def fill(engine) -> None:
+    async with engine.begin() as conn:
+        for statement in SCHEMA.split(";") + bot_tables():
+            if statement.strip():
+                await conn.execute(text(statement))
+        await conn.execute(text("INSERT INTO dir_objects VALUES (1, 'Магазин №1')"))
+        await conn.execute(text("INSERT INTO dir_sales_status VALUES (1, 'Завершен')"))
+        await conn.execute(text("INSERT INTO dir_customers VALUES (1, 'ООО Покупатель', NULL, NULL, NULL, NULL)"))
+        await conn.execute(
+            text("INSERT INTO doc_sales VALUES (:id, :dt, 1, 1, 1, 1, 0, '')"),
+            [{"id": i, "dt": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d} 10:00:00"} for i in range(1, INVOICES + 1)]
+        )
+        await conn.execute(
+            text("INSERT INTO operations VALUES (:id, :id, 2, 1, 2)"), [{"id": i} for i in range(1, INVOICES + 1)]
+        )
+        await conn.execute(
+            text("INSERT INTO operations_additional_prop VALUES (:id, :id, 15000)"),
+            [{"id": i} for i in range(1, INVOICES + 1)]
+        )
+
+
+async def measure(consume) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    total = await consume()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total, peak, elapsed
+
+
+async def main() -> None:
+    path = os.path.join(tempfile.mkdtemp(), "stream_memory.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", lambda conn, _: conn.create_function("concat", -1, _concat))
+    await fill(engine)
+    db = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    # Сводка накладных читается из bot_sales_summary
+    await sales_summary.refresh_new(db)
+
+    async def fetch_all():
+        rows = await TGUser.get_all_sales_invoices_summary(db, 2024)
+        return sum(row["Сумма продажи"] for row in rows)
+
+    async def stream():
+        total = 0
+        async for row in TGUser.stream_sales_invoices_summary(db, 2024, fetch_size=FETCH_SIZE):
+            total += row["Сумма продажи"]
+        return total
+
+    full_total, full_peak, full_time = await measure(fetch_all)
+    stream_total, stream_peak, stream_time = await measure(stream)
+    await engine.dispose()
+    os.remove(path)
+
+    assert full_total == stream_total
+    print(f"invoices: {INVOICES}, fetch_size: {FETCH_SIZE}")
+    print(f"fetchall: peak {full_peak / 1024 / 1024:>6.1f} MB, {full_time:.2f} s")
+    print(f"stream:   peak {stream_peak / 1024 / 1024:>6.1f} MB, {stream_time:.2f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -13,7 +13,13 @@ from tgbot.handlers.group import register_group
 from tgbot.handlers.users import register_users
 from tgbot.middlewares.db import DbMiddleware
 from tgbot.middlewares.throttling import ThrottlingMiddleware
+from tgbot.services.cache_backends import RedisCacheBackend
+from tgbot.services.cache_service import cache_service, user_cache
+from tgbot.services.cache_warmup import CacheWarmer
 from tgbot.services.database import create_db_session
+from tgbot.services.phone_directory import phone_directory
+from tgbot.services.sales_summary import sales_summary
+from tgbot.services.user_writer import user_writer
 
 config = load_config(".env")
 
@@ -43,9 +49,10 @@ def init_logger():
 
 def register_all_middlewares(dp: Dispatcher):
     """Register all middlewares"""
-    dp.update.middleware(DbMiddleware())
+    # Only messages and callbacks carry a bot user; handlers ask for it with the db_user flag
+    dp.message.middleware(DbMiddleware())
+    dp.callback_query.middleware(DbMiddleware())
     dp.message.middleware(ThrottlingMiddleware(limit=1.0)) # 1 message per second
-    # dp.message.middleware(DbMiddleware())
 
 
 def register_all_filters(dp: Dispatcher):
@@ -81,6 +88,30 @@ async def on_startup():
     bot.config = config
     bot.db = await create_db_session(config)
 
+    # Start background cache sweepers and shared L2 cache if configured
+    cache_service.start()
+    user_cache.start()
+    if config.cache.redis_url:
+        await cache_service.set_backend(RedisCacheBackend(config.cache.redis_url))
+        # Bot users stay in local memory; only their deletions are broadcast through Redis
+        await user_cache.set_backend(
+            RedisCacheBackend(config.cache.redis_url, prefix="tgbot:users:", channel="tgbot:users:invalidate")
+        )
+
+    # Load phone -> customer id directory and keep it refreshed
+    await phone_directory.start(bot.db.read)
+
+    # Fill the bot-owned sales summary table in the background and keep it refreshed
+    # (admin lists read the ERP aggregate until it has caught up)
+    sales_summary.start(bot.db)
+
+    # Write new users and profile changes in batches
+    user_writer.start(bot.db)
+
+    # Warm up cache with current period data (at startup and on schedule)
+    bot.cache_warmer = CacheWarmer(bot.db)
+    bot.cache_warmer.start()
+
     register_all_middlewares(dp)
     # register_all_filters(dp)
     register_all_handlers(dp)
@@ -109,6 +140,15 @@ async def on_shutdown():
     #     except Exception as e:
     #         logger.error(f"Error while sending message to admin {admin_id}: {e}")
 
+    # write buffered users, stop cache warm-up, phone directory and sales summary refresh,
+    # background cache sweeper and close shared cache
+    await user_writer.stop()
+    await bot.cache_warmer.stop()
+    await phone_directory.stop()
+    await sales_summary.stop()
+    await cache_service.stop()
+    await user_cache.stop()
+
     # close all connections
     await dp.storage.close()
     await bot.session.close()
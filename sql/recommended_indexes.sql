@@ -0,0 +1,42 @@
+-- Рекомендуемые индексы ERP для запросов TGUser (tgbot/models/models.py).
+--
+-- Фильтры по периоду задаются диапазоном (SalesPeriod):
+--   s.sls_datetime >= :period_start AND s.sls_datetime < :period_end
+-- поэтому индекс, заканчивающийся на sls_datetime, используется для
+-- range-сканирования вместо полного просмотра doc_sales.
+-- Проверка планов: python -m benchmarks.query_plans, на MySQL - EXPLAIN.
+
+-- Проведённые неудалённые документы за период: равенства по статусу документа,
+-- затем диапазон по дате и сортировка по дате и id. Используют:
+--   SalesSummary.get_source_since - догрузка и пересчёт bot_sales_summary;
+--   get_customer_sales_summary - акт сверки, документы покупателя за период;
+--   get_all_sales_invoices_summary, get_sales_invoices_page, get_sales_invoices_totals,
+--   get_sales_months, get_sales_years (только этот индекс, covering index scan) -
+--   пока bot_sales_summary не заполнена впервые (запросы *_ERP в queries.py).
+CREATE INDEX idx_sls_state_datetime ON doc_sales (sls_performed, sls_deleted, sls_datetime, sls_id);
+
+-- get_customer_sales_summary, get_user_invoice: продажи покупателя за период
+-- (s.sls_customer IN (...) по id из справочника телефонов PhoneDirectory);
+-- get_customers_by_period до первого заполнения bot_sales_summary.
+CREATE INDEX idx_sls_customer_datetime ON doc_sales (sls_customer, sls_datetime);
+
+-- Строки документа продажи (opr_type = 2) для всех запросов с суммами.
+CREATE INDEX idx_opr_document_type ON operations (opr_document, opr_type);
+
+CREATE INDEX idx_oap_operation ON operations_additional_prop (oap_operation);
+
+-- Оплаты по документу в акте сверки.
+CREATE INDEX idx_cop_payment_type ON doc_cash_operations (cop_payment, cop_type);
+
+-- Поиск покупателя по телефону выполняется в памяти (tgbot/services/phone_directory.py):
+-- справочник читает dir_customers целиком и догружает новые строки по cstm_id > :after_id,
+-- для чего хватает первичного ключа. Индексы по cstm_phone..cstm_phone4 не нужны.
+
+-- Таблица бота bot_sales_summary (SalesSummary в tgbot/models/models.py) создаётся
+-- вместе с индексами через Base.metadata.create_all, здесь они перечислены для справки:
+--   ix_bot_sales_summary_period_customer (sls_year, sls_month, customer_id) -
+--     get_sales_years, get_sales_months, get_customers_by_period (covering index);
+--   ix_bot_sales_summary_datetime (sls_datetime, sls_id) -
+--     get_all_sales_invoices_summary, get_sales_invoices_page, get_sales_invoices_totals
+--     (диапазон ss.sls_datetime по SalesPeriod и сортировка по дате и id),
+--     SalesSummary.get_since при пересчёте последних месяцев.
@@ -12,6 +12,9 @@ MAX_INVOICE_ITEMS_DISPLAY = 10
 MAX_INVOICE_ITEMS_SHORT = 5
 MAX_MESSAGE_LENGTH = 4000
 MAX_CUSTOMER_NAME_LENGTH = 50
+INVOICES_PAGE_SIZE = 10  # накладных на одной странице списка
+STREAM_FETCH_SIZE = 500  # строк за одну выборку при потоковом чтении больших результатов
+DETAILS_BATCH_SIZE = 500  # документов в одном запросе пакетной загрузки деталей накладных
 
 # TTL для кэширования (в секундах)
 CACHE_TTL = {
@@ -22,8 +25,68 @@ CACHE_TTL = {
     "SALES_MONTHS": 3600,  # 1 час
     "CUSTOMERS": 1800,  # 30 минут
     "CUSTOMER_NAME": 3600,  # 1 час
+    "CUSTOMER_NAME_NOT_FOUND": 300,  # 5 минут для номеров без покупателя в ERP
     "USER_INVOICE": 600,  # 10 минут
     "USER_RECONCILIATION": 600,  # 10 минут
+    "NEGATIVE": 120,  # 2 минуты для отсутствующих результатов (None)
+    "TG_USER": 300,  # 5 минут для пользователя бота в DbMiddleware
+}
+
+# Окно stale-while-revalidate (в секундах): сколько после истечения TTL
+# можно отдавать устаревшее значение, обновляя его в фоне
+CACHE_STALE_TTL = {
+    "INVOICES": 300,  # 5 минут
+    "CUSTOMERS": 900,  # 15 минут
+    "USER_RECONCILIATION": 300,  # 5 минут
+}
+
+# Прогрев кэша
+CACHE_WARMUP = {
+    "INTERVAL": 300,  # период повторного прогрева (сек), меньше TTL накладных
+    "CONCURRENCY": 2,  # максимум одновременных запросов к ERP при прогреве
+    "MIN_TTL_LEFT": 360,  # ключи с меньшим остатком TTL (сек) обновляются, остальные не трогаются
+}
+
+# Лимиты кэша
+CACHE_LIMITS = {
+    "MAX_ENTRIES": 5000,  # максимум ключей в кэше
+    "MAX_BYTES": 64 * 1024 * 1024,  # ~64 МБ приблизительного объёма
+    "SWEEP_INTERVAL": 60,  # период фоновой очистки просроченных ключей (сек)
+    "LOCK_SHARDS": 16,  # количество шардов блокировок на запись
+}
+
+# Общий кэш L2 (Redis): переподписка на канал инвалидаций после обрыва соединения
+CACHE_BACKEND = {
+    "RECONNECT_MIN_DELAY": 1,  # пауза перед первой попыткой переподписки (сек)
+    "RECONNECT_MAX_DELAY": 30,  # максимальная пауза, пауза удваивается после каждой неудачи (сек)
+}
+
+# Кэш пользователей бота (DbMiddleware), отдельный от кэша отчётов
+USER_CACHE = {
+    "MAX_ENTRIES": 20000,  # максимум пользователей в кэше
+    "MAX_BYTES": 32 * 1024 * 1024,  # ~32 МБ приблизительного объёма
+}
+
+# Справочник телефонов покупателей (телефон -> cstm_id)
+PHONE_DIRECTORY = {
+    "COUNTRY_CODE": "998",  # код страны для номеров из 9 цифр
+    "REFRESH_INTERVAL": 60,  # догрузка новых покупателей (сек)
+    "FULL_REFRESH_INTERVAL": 3600,  # полная перезагрузка, чтобы учесть изменённые телефоны (сек)
+    "MISS_REFRESH_INTERVAL": 10,  # минимальный интервал внеочередной догрузки при промахе (сек)
+}
+
+# Сводная таблица продаж bot_sales_summary (одна строка на документ)
+SALES_SUMMARY = {
+    "REFRESH_INTERVAL": 60,  # догрузка новых документов по sls_id (сек)
+    "RESYNC_INTERVAL": 900,  # пересчёт последних месяцев, чтобы учесть изменённые документы (сек)
+    "RESYNC_MONTHS": 2,  # сколько последних месяцев пересчитывать (текущий и предыдущий)
+    "BATCH_SIZE": 5000,  # документов за один запрос при догрузке и первичном заполнении
+}
+
+# Отложенная запись пользователей (регистрация и обновление профиля) пачками
+USER_WRITE_BEHIND = {
+    "FLUSH_INTERVAL": 0.2,  # максимальная задержка записи (сек)
+    "MAX_BATCH": 500,  # пользователей в одном INSERT; при накоплении запись не ждёт интервала
 }
 
 # Названия месяцев
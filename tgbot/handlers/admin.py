@@ -9,6 +9,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from tgbot.filters.admin import AdminFilter
 from tgbot.models.models import TGUser
 from tgbot.services.admin_service import AdminService
+from tgbot.services.unit_of_work import UnitOfWork
 from tgbot.keyboards.factory import KeyboardFactory
 from tgbot.states import AdminInvoicesFilter, ReconciliationActStates
 from tgbot.misc.slope_tempalte import generate_invoice_excel, generate_reconciliation_act_excel
@@ -24,13 +25,27 @@ async def admin_start(msg: types.Message, state: FSMContext):
     await msg.answer("👋 Привет, админ! Выберите действие:", reply_markup=KeyboardFactory.admin_menu())
 
 
-async def admin_get_user_count(msg: types.Message):
+async def admin_get_user_count(msg: types.Message, uow: UnitOfWork):
     logger.info(f"Admin {msg.from_user.id} requested user count")
-    admin_service = AdminService(msg.bot.db)
+    admin_service = uow.service(AdminService)
     users_count = await admin_service.get_users_count()
     await msg.answer(f"📊 Всего пользователей: {users_count}")
 
 
+async def admin_cache_stats(msg: types.Message, uow: UnitOfWork):
+    """Показать статистику кэша по семействам ключей"""
+    logger.info(f"Admin {msg.from_user.id} requested cache stats")
+    admin_service = uow.service(AdminService)
+    await msg.answer(admin_service.format_cache_stats())
+
+
+async def admin_db_stats(msg: types.Message, uow: UnitOfWork):
+    """Показать состояние пула соединений с БД"""
+    logger.info(f"Admin {msg.from_user.id} requested DB pool stats")
+    admin_service = uow.service(AdminService)
+    await msg.answer(admin_service.format_db_pool_stats())
+
+
 async def admin_menu(call: types.CallbackQuery, state: FSMContext):
     """Показать главное админское меню"""
     logger.info(f"Admin {call.from_user.id} opened admin menu")
@@ -56,7 +71,42 @@ async def admin_year_selected(call: types.CallbackQuery, state: FSMContext):
                                 reply_markup=KeyboardFactory.months_selection())
 
 
-async def admin_month_selected(call: types.CallbackQuery, state: FSMContext):
+async def show_invoices_page(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork,
+                             year: int, month: int, page: int):
+    """Показать страницу списка накладных: итоги месяца и только накладные этой страницы
+
+    Курсоры страниц (последняя накладная предыдущей страницы) хранятся в FSM,
+    поэтому каждая страница загружается отдельным запросом по ключу сортировки.
+    """
+    data = await state.get_data()
+    page_cursors = data.get('page_cursors') or [None]
+    if page >= len(page_cursors):
+        # Курсор страницы неизвестен (например, после перезапуска) - начинаем с первой
+        page, page_cursors = 0, [None]
+    
+    admin_service = uow.service(AdminService)
+    totals = await admin_service.get_invoices_totals(year, month, allow_stale=True)
+    if not totals["count"]:
+        await call.message.edit_text(
+            f"❌ За {month}/{year} накладные не найдены",
+            reply_markup=KeyboardFactory.months_selection()
+        )
+        return
+    
+    invoices = await admin_service.get_invoices_page(year, month, page_cursors[page], allow_stale=True)
+    total_pages = admin_service.total_pages(totals)
+    page_cursors = page_cursors[:page + 1]
+    if invoices and page + 1 < total_pages:
+        page_cursors.append(admin_service.invoice_cursor(invoices[-1]))
+    await state.update_data(page_cursors=page_cursors, current_page=page)
+    
+    await call.message.edit_text(
+        admin_service.format_invoice_summary(totals, year, month),
+        reply_markup=KeyboardFactory.invoices_list(invoices, page=page, total_pages=total_pages)
+    )
+
+
+async def admin_month_selected(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Обработка выбора месяца и показа списка накладных"""
     month = call.data.split('_')[-1]
     data = await state.get_data()
@@ -71,27 +121,9 @@ async def admin_month_selected(call: types.CallbackQuery, state: FSMContext):
     await call.message.edit_text("🔄 Загружаем накладные...")
     
     try:
-        admin_service = AdminService(call.bot.db)
-        
-        # Получаем накладные за выбранный период (оптимизированная версия)
-        filtered_invoices = await admin_service.get_invoices_by_period(int(year), int(month))
-        
-        await state.update_data(filtered_invoices=filtered_invoices, current_page=0)
-        
-        if not filtered_invoices:
-            await call.message.edit_text(
-                f"❌ За {month}/{year} накладные не найдены",
-                reply_markup=KeyboardFactory.months_selection()
-            )
-            return
-        
-        # Формируем текст с общей информацией
-        header_text = admin_service.format_invoice_summary(filtered_invoices, int(year), int(month))
-        
-        await call.message.edit_text(
-            header_text,
-            reply_markup=KeyboardFactory.invoices_list(filtered_invoices, page=0)
-        )
+        # Итоги месяца и первая страница накладных, без загрузки всего месяца
+        await state.update_data(page_cursors=[None], current_page=0)
+        await show_invoices_page(call, state, uow, int(year), int(month), page=0)
         
     except Exception as e:
         logger.error(f"Error loading invoices: {e}")
@@ -101,7 +133,7 @@ async def admin_month_selected(call: types.CallbackQuery, state: FSMContext):
         )
 
 
-async def admin_invoice_details(call: types.CallbackQuery, state: FSMContext):
+async def admin_invoice_details(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Показать детали конкретной накладной"""
     sales_id = int(call.data.split('_')[-1])
     
@@ -111,7 +143,7 @@ async def admin_invoice_details(call: types.CallbackQuery, state: FSMContext):
     await call.message.edit_text("🔄 Загружаем детали накладной...")
     
     try:
-        admin_service = AdminService(call.bot.db)
+        admin_service = uow.service(AdminService)
         
         # Получаем детали накладной
         details = await admin_service.get_invoice_details(sales_id)
@@ -139,53 +171,38 @@ async def admin_invoice_details(call: types.CallbackQuery, state: FSMContext):
         )
 
 
-async def admin_back_to_invoices_list(call: types.CallbackQuery, state: FSMContext):
+async def admin_back_to_invoices_list(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Вернуться к списку накладных"""
     data = await state.get_data()
-    filtered_invoices = data.get('filtered_invoices', [])
     current_page = data.get('current_page', 0)
     year = data.get('selected_year')
     month = data.get('selected_month')
     
-    if not filtered_invoices:
+    if not year or not month:
         await call.message.edit_text("❌ Список накладных пуст", reply_markup=KeyboardFactory.months_selection())
         return
     
-    admin_service = AdminService(call.bot.db)
-    header_text = admin_service.format_invoice_summary(filtered_invoices, int(year), int(month))
-    
-    await call.message.edit_text(
-        header_text,
-        reply_markup=KeyboardFactory.invoices_list(filtered_invoices, page=current_page)
-    )
+    await show_invoices_page(call, state, uow, int(year), int(month), page=current_page)
 
 
-async def admin_page_navigation(call: types.CallbackQuery, state: FSMContext):
+async def admin_page_navigation(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Навигация по страницам списка накладных"""
     page = int(call.data.split('_')[-1])
     data = await state.get_data()
-    filtered_invoices = data.get('filtered_invoices', [])
     year = data.get('selected_year')
     month = data.get('selected_month')
     
-    await state.update_data(current_page=page)
-    
-    admin_service = AdminService(call.bot.db)
-    header_text = admin_service.format_invoice_summary(filtered_invoices, int(year), int(month))
-    
-    await call.message.edit_text(
-        header_text,
-        reply_markup=KeyboardFactory.invoices_list(filtered_invoices, page=page)
-    )
+    # Загружается только запрошенная страница
+    await show_invoices_page(call, state, uow, int(year), int(month), page=page)
 
 
-async def admin_stats(call: types.CallbackQuery, state: FSMContext):
+async def admin_stats(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Показать статистику"""
     logger.info(f"Admin {call.from_user.id} requested stats")
     await state.clear()
     
     try:
-        admin_service = AdminService(call.bot.db)
+        admin_service = uow.service(AdminService)
         users_count = await admin_service.get_users_count()
         
         stats_text = (
@@ -205,7 +222,7 @@ async def admin_stats(call: types.CallbackQuery, state: FSMContext):
         )
 
 
-async def admin_download_invoice(call: types.CallbackQuery, state: FSMContext):
+async def admin_download_invoice(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Скачать накладную в Excel формате"""
     sales_id = int(call.data.split('_')[-1])
     
@@ -215,7 +232,7 @@ async def admin_download_invoice(call: types.CallbackQuery, state: FSMContext):
     await call.message.edit_text("📊 Генерируем Excel файл...")
     
     try:
-        admin_service = AdminService(call.bot.db)
+        admin_service = uow.service(AdminService)
         
         # Получаем детали накладной
         details = await admin_service.get_invoice_details(sales_id)
@@ -291,14 +308,14 @@ async def admin_reconciliation_year(call: types.CallbackQuery, state: FSMContext
     )
 
 
-async def admin_reconciliation_month(call: types.CallbackQuery, state: FSMContext):
+async def admin_reconciliation_month(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     month = call.data.split('recon_month_')[-1]
     data = await state.get_data()
     year = int(data.get('recon_year'))
     await state.update_data(recon_month=month, customers_page=0)
     await state.set_state(ReconciliationActStates.confirm)
-    admin_service = AdminService(call.bot.db)
-    customers = await admin_service.get_customers_by_period(year, int(month))
+    admin_service = uow.service(AdminService)
+    customers = await admin_service.get_customers_by_period(year, int(month), allow_stale=True)
     if not customers:
         await call.message.edit_text(
             f"❌ Нет покупателей за {month}/{year}",
@@ -313,11 +330,11 @@ async def admin_reconciliation_month(call: types.CallbackQuery, state: FSMContex
     )
 
 
-async def admin_reconciliation_customers_page(call: types.CallbackQuery, state: FSMContext):
+async def admin_reconciliation_customers_page(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     _, _, _, year, month, page = call.data.split('_')
     year, month, page = int(year), int(month), int(page)
-    admin_service = AdminService(call.bot.db)
-    customers = await admin_service.get_customers_by_period(year, month)
+    admin_service = uow.service(AdminService)
+    customers = await admin_service.get_customers_by_period(year, month, allow_stale=True)
     header = f"👥 <b>Покупатели за {month:02d}.{year}</b>\n\nНайдено: {len(customers)} покупателей\nВыберите покупателя для акта сверки:"
     await call.message.edit_text(
         header,
@@ -326,11 +343,11 @@ async def admin_reconciliation_customers_page(call: types.CallbackQuery, state:
     )
 
 
-async def admin_reconciliation_customer(call: types.CallbackQuery, state: FSMContext):
+async def admin_reconciliation_customer(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Показать акт сверки для выбранного покупателя (оптимизировано)"""
     _, _, year, month, phone = call.data.split("_", 4)
     year, month = int(year), int(month)
-    admin_service = AdminService(call.bot.db)
+    admin_service = uow.service(AdminService)
     summary = await admin_service.get_reconciliation_data(phone, year, month)
     if not summary:
         await call.message.edit_text(
@@ -350,13 +367,13 @@ async def admin_reconciliation_customer(call: types.CallbackQuery, state: FSMCon
     await call.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
 
-async def admin_reconciliation_download_excel(call: types.CallbackQuery, state: FSMContext):
+async def admin_reconciliation_download_excel(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Скачать Excel файл акта сверки (оптимизировано)"""
     _, _, _, year, month, phone = call.data.split("_", 5)
     year, month = int(year), int(month)
     await call.message.edit_text("📄 Генерируем Excel файл акта сверки...")
     try:
-        admin_service = AdminService(call.bot.db)
+        admin_service = uow.service(AdminService)
         summary = await admin_service.get_reconciliation_data(phone, year, month)
         customers = await admin_service.get_customers_by_period(year, month)
         customer = next((c for c in customers if c['phone'] == phone), None)
@@ -383,13 +400,13 @@ async def admin_reconciliation_download_excel(call: types.CallbackQuery, state:
         await call.message.edit_text(f"❌ Ошибка при генерации акта сверки: {e}")
 
 
-async def admin_reconciliation_back_customers(call: types.CallbackQuery, state: FSMContext):
+async def admin_reconciliation_back_customers(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     """Вернуться к списку покупателей"""
     _, _, _, year, month = call.data.split("_", 4)
     year, month = int(year), int(month)
     
-    admin_service = AdminService(call.bot.db)
-    customers = await admin_service.get_customers_by_period(year, month)
+    admin_service = uow.service(AdminService)
+    customers = await admin_service.get_customers_by_period(year, month, allow_stale=True)
     
     await call.message.edit_text(
         f"📅 Год: {year}, Месяц: {month}\nВыберите покупателя для акта сверки:",
@@ -399,36 +416,36 @@ async def admin_reconciliation_back_customers(call: types.CallbackQuery, state:
 
 # Стартовый хендлер для акта сверки
 @router.message(Command("act_sverki"), AdminFilter())
-async def act_sverki_start(message: types.Message):
-    admin_service = AdminService(message.bot.db)
+async def act_sverki_start(message: types.Message, uow: UnitOfWork):
+    admin_service = uow.service(AdminService)
     years = await admin_service.get_sales_years()
     await message.answer("Выберите год:", reply_markup=KeyboardFactory.act_years(years))
 
 # Хендлер для выбора года
 @router.callback_query(lambda c: c.data.startswith("act_year_"), AdminFilter())
-async def act_sverki_choose_year(call: types.CallbackQuery, state: FSMContext):
+async def act_sverki_choose_year(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     year = int(call.data.split("_")[-1])
-    admin_service = AdminService(call.bot.db)
+    admin_service = uow.service(AdminService)
     months = await admin_service.get_sales_months(year)
     await call.message.edit_text(f"Год: {year}\nВыберите месяц:", reply_markup=KeyboardFactory.act_months(months, year))
     await state.update_data(act_year=year)
 
 # Хендлер для выбора месяца
 @router.callback_query(lambda c: c.data.startswith("act_month_"), AdminFilter())
-async def act_sverki_choose_month(call: types.CallbackQuery, state: FSMContext):
+async def act_sverki_choose_month(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     _, _, year, month = call.data.split("_")
     year, month = int(year), int(month)
-    admin_service = AdminService(call.bot.db)
-    customers = await admin_service.get_customers_by_period(year, month)
+    admin_service = uow.service(AdminService)
+    customers = await admin_service.get_customers_by_period(year, month, allow_stale=True)
     await call.message.edit_text(f"Год: {year}, Месяц: {month}\nВыберите покупателя:", reply_markup=KeyboardFactory.act_customers(customers, year, month))
     await state.update_data(act_month=month)
 
 # Хендлер для выбора покупателя и показа акта сверки
 @router.callback_query(lambda c: c.data.startswith("act_customer_"), AdminFilter())
-async def act_sverki_show(call: types.CallbackQuery, state: FSMContext):
+async def act_sverki_show(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     _, _, year, month, phone = call.data.split("_", 4)
     year, month = int(year), int(month)
-    admin_service = AdminService(call.bot.db)
+    admin_service = uow.service(AdminService)
     summary = await admin_service.get_reconciliation_data(phone, year, month)
     customers = await admin_service.get_customers_by_period(year, month)
     customer = next((c for c in customers if c['phone'] == phone), None)
@@ -438,10 +455,10 @@ async def act_sverki_show(call: types.CallbackQuery, state: FSMContext):
 
 # Хендлер для скачивания акта сверки
 @router.callback_query(lambda c: c.data.startswith("act_download_"), AdminFilter())
-async def act_sverki_download(call: types.CallbackQuery, state: FSMContext):
+async def act_sverki_download(call: types.CallbackQuery, state: FSMContext, uow: UnitOfWork):
     _, _, year, month, phone = call.data.split("_", 4)
     year, month = int(year), int(month)
-    admin_service = AdminService(call.bot.db)
+    admin_service = uow.service(AdminService)
     summary = await admin_service.get_reconciliation_data(phone, year, month)
     customers = await admin_service.get_customers_by_period(year, month)
     customer = next((c for c in customers if c['phone'] == phone), None)
@@ -487,6 +504,16 @@ def register_admin():
         Command("stats"),
         AdminFilter()
     )
+    router.message.register(
+        admin_cache_stats,
+        Command("cache_stats"),
+        AdminFilter()
+    )
+    router.message.register(
+        admin_db_stats,
+        Command("db_stats"),
+        AdminFilter()
+    )
     
     # Admin callback handlers
     router.callback_query.register(
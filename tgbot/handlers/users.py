@@ -1,4 +1,5 @@
 import re
+from datetime import datetime
 from pprint import pprint
 import os
 
@@ -9,23 +10,24 @@ from loguru import logger
 
 from tgbot.keyboards.inline import user_menu_kb_inline, month_kb_inline, user_reconciliation_years_kb_inline, user_reconciliation_months_kb_inline, user_invoices_years_kb_inline, user_invoices_months_kb_inline
 from tgbot.keyboards.reply import phone_number_kb
+from tgbot.middlewares.db import LazyUser
 from tgbot.models.models import TGUser
 from tgbot.states import GetPhone, UserReconciliationStates, UserInvoicesStates
 from tgbot.misc.slope_tempalte import generate_invoice_excel, generate_reconciliation_act_excel
 from tgbot.services.user_service import UserService
+from tgbot.services.unit_of_work import UnitOfWork
 
 router = Router(name=__name__)
 
 
-async def user_start(msg: types.Message, state: FSMContext):
+async def user_start(msg: types.Message, state: FSMContext, db_user: LazyUser):
     logger.info(f"User {msg.from_user.id} started the bot")
 
     # state clear
     if await state.get_state():
         await state.clear()
 
-    user_service = UserService(msg.bot.db)
-    user = await user_service.get_user_by_telegram_id(msg.from_user.id)
+    user = await db_user
     print('user', user)
     print('user', user.phone)
 
@@ -39,7 +41,7 @@ async def user_start(msg: types.Message, state: FSMContext):
         await msg.answer(f"Добро пожаловать, {msg.from_user.full_name}!", reply_markup=await user_menu_kb_inline())
 
 
-async def get_user_phone(msg: types.Message, state: FSMContext):
+async def get_user_phone(msg: types.Message, state: FSMContext, uow: UnitOfWork):
     logger.info(f"User {msg.from_user.id} send phone number")
 
     user_phone = msg.text
@@ -75,7 +77,7 @@ async def get_user_phone(msg: types.Message, state: FSMContext):
 
     # save phone number to db
     if user_phone:
-        user_service = UserService(msg.bot.db)
+        user_service = uow.service(UserService)
         user = await user_service.update_user_phone(msg.from_user.id, user_phone)
         await msg.answer(f"Ваш номер телефона сохранен: {user_phone}")
 
@@ -137,7 +139,7 @@ async def user_reconciliation_year(call: types.CallbackQuery, state: FSMContext)
                                 reply_markup=await user_reconciliation_months_kb_inline())
 
 
-async def user_reconciliation_month(call: types.CallbackQuery, state: FSMContext):
+async def user_reconciliation_month(call: types.CallbackQuery, state: FSMContext, db_user: LazyUser, uow: UnitOfWork):
     """Обработка выбора месяца и генерация акта сверки пользователя"""
     month = call.data.split('_')[-1]
     data = await state.get_data()
@@ -146,8 +148,7 @@ async def user_reconciliation_month(call: types.CallbackQuery, state: FSMContext
     logger.info(f"User {call.from_user.id} selected month: {month} for year: {year}")
     
     # Получаем пользователя
-    user_service = UserService(call.bot.db)
-    user = await user_service.get_user_by_telegram_id(call.from_user.id)
+    user = await db_user
     
     if not user.phone:
         await call.message.edit_text("❌ Номер телефона не найден. Обратитесь к администратору.")
@@ -156,6 +157,7 @@ async def user_reconciliation_month(call: types.CallbackQuery, state: FSMContext
     # Показываем загрузку
     await call.message.edit_text("🔄 Генерируем акт сверки...")
     
+    user_service = uow.service(UserService)
     try:
         # Получаем данные акта сверки для пользователя
         summary = await user_service.get_user_reconciliation(user.phone, int(year), int(month))
@@ -220,17 +222,17 @@ async def user_invoices_year(call: types.CallbackQuery, state: FSMContext):
                                 reply_markup=await user_invoices_months_kb_inline())
 
 
-async def user_invoices_month(call: types.CallbackQuery, state: FSMContext):
+async def user_invoices_month(call: types.CallbackQuery, state: FSMContext, db_user: LazyUser, uow: UnitOfWork):
     """Обработка выбора месяца и генерация накладной пользователя"""
     month = call.data.split('_')[-1]
     data = await state.get_data()
-    year = data.get('user_invoice_year')
+    # Год нужен для фильтра по диапазону дат; если состояние потеряно - текущий год
+    year = data.get('user_invoice_year') or str(datetime.now().year)
     
     logger.info(f"User {call.from_user.id} selected month: {month} for year: {year}")
     
     # Получаем пользователя
-    user_service = UserService(call.bot.db)
-    user = await user_service.get_user_by_telegram_id(call.from_user.id)
+    user = await db_user
     
     if not user.phone:
         await call.message.edit_text("❌ Номер телефона не найден. Обратитесь к администратору.")
@@ -249,7 +251,8 @@ async def user_invoices_month(call: types.CallbackQuery, state: FSMContext):
     )
 
     # Получаем данные по счету
-    res = await user_service.get_user_invoice(user.phone, month)
+    user_service = uow.service(UserService)
+    res = await user_service.get_user_invoice(user.phone, year, month)
 
     if not res:
         await call.message.answer(
@@ -289,6 +292,7 @@ def register_users():
     router.message.register(
         user_start,
         F.text == "/start",
+        flags={"db_user": True},
     )
     router.message.register(
         get_user_phone,
@@ -317,7 +321,8 @@ def register_users():
     )
     router.callback_query.register(
         user_reconciliation_month,
-        F.data.startswith('btn_user_recon_month_')
+        F.data.startswith('btn_user_recon_month_'),
+        flags={"db_user": True},
     )
     router.callback_query.register(
         user_invoices_year,
@@ -325,7 +330,8 @@ def register_users():
     )
     router.callback_query.register(
         user_invoices_month,
-        F.data.startswith('btn_user_invoice_month_')
+        F.data.startswith('btn_user_invoice_month_'),
+        flags={"db_user": True},
     )
     router.callback_query.register(
         user_invoices_start,
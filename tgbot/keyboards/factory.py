@@ -48,12 +48,12 @@ class KeyboardFactory:
         return kb.adjust(3).as_markup()
     
     @staticmethod
-    def invoices_list(invoices_data: List[Dict[str, Any]], page: int = 0, per_page: int = 10) -> InlineKeyboardMarkup:
-        """Список накладных с пагинацией"""
+    def invoices_list(page_invoices: List[Dict[str, Any]], page: int = 0, total_pages: int = 1) -> InlineKeyboardMarkup:
+        """Страница списка накладных с пагинацией
+
+        page_invoices - только накладные текущей страницы (AdminService.get_invoices_page)
+        """
         kb = InlineKeyboardBuilder()
-        start_idx = page * per_page
-        end_idx = start_idx + per_page
-        page_invoices = invoices_data[start_idx:end_idx]
         for invoice in page_invoices:
             customer_name = invoice['Покупатель'][:20]
             if len(invoice['Покупатель']) > 20:
@@ -65,7 +65,6 @@ class KeyboardFactory:
                     callback_data=f"btn_admin_invoice_details_{invoice['Код']}"
                 )
             )
-        total_pages = (len(invoices_data) + per_page - 1) // per_page
         pagination_row = []
         if total_pages > 1:
             if page > 0:
@@ -1,42 +1,105 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import Message, User, CallbackQuery
 
+from tgbot.constants import CACHE_TTL
 from tgbot.models.models import TGUser
+from tgbot.services.cache_service import user_cache
+from tgbot.services.unit_of_work import UnitOfWork
+from tgbot.services.user_writer import user_writer
 
 
-class DbMiddleware(BaseMiddleware):
-    """Middleware for adding user into DB if they don't exist"""
+def _profile_changed(user: TGUser, telegram_user: User) -> bool:
+    """Whether the Telegram profile differs from the stored one (and must be written to the DB)"""
+    return (
+        user.firstname != telegram_user.first_name
+        or user.lastname != telegram_user.last_name
+        or user.username != telegram_user.username
+        or user.lang_code != telegram_user.language_code
+    )
 
-    async def __call__(self, handler, event: Message | CallbackQuery, data: Dict[str, Any]):
-        """Override the __call__ method to add DB logic"""
-        # Retrieve db session from the data dictionary
-        db_session = event.bot.db
 
-        if event.message:
-            telegram_user: User = event.message.from_user
-        elif event.callback_query:
-            telegram_user: User = event.callback_query.from_user
+def _detached(user: TGUser) -> TGUser:
+    """Copy of the user without SQLAlchemy instance state (keeps user_cache entries small)"""
+    return TGUser(**{column.key: getattr(user, column.key) for column in TGUser.__table__.columns})
 
-        # Check if the user exists in the DB
-        user = await TGUser.get_user(db_session=db_session, telegram_id=telegram_user.id)
 
-        if not user:
-            # If the user does not exist, add them to the DB
-            await TGUser.add_user(
-                db_session=db_session,
+async def resolve_user(db_session, telegram_user: User) -> TGUser:
+    """Get the bot user, adding them or refreshing their profile if needed"""
+    # Known users with an unchanged profile are served from the identity cache without DB queries
+    cache_key = TGUser.cache_key(telegram_user.id)
+    user = user_cache.get_nowait(cache_key)
+    if user is None or _profile_changed(user, telegram_user):
+        if user is None:
+            # Users waiting for the write-behind flush are not in the DB yet
+            user = user_writer.get(telegram_user.id) or await TGUser.get_user(db_session, telegram_user.id)
+        if user is None or _profile_changed(user, telegram_user):
+            # New users and profile changes are written in batches; handlers get the in-memory copy
+            user = TGUser(
                 telegram_id=telegram_user.id,
                 firstname=telegram_user.first_name,
                 lastname=telegram_user.last_name,
                 username=telegram_user.username,
+                phone=user.phone if user is not None else None,
                 lang_code=telegram_user.language_code,
             )
-            user = await TGUser.get_user(db_session=db_session, telegram_id=telegram_user.id)
+            await user_writer.add(db_session, user)
+        await user_cache.set(cache_key, _detached(user), ttl_seconds=CACHE_TTL["TG_USER"])
+    return user
+
+
+class LazyUser:
+    """
+    Bot user that is resolved on the first await
+
+        user = await db_user
+
+    The result is memoised in the update's UnitOfWork, so later awaits (and
+    UserService.get_user_by_telegram_id in the same update) make no queries.
+    """
+
+    def __init__(self, uow: UnitOfWork, telegram_user: User):
+        self._uow = uow
+        self._telegram_user = telegram_user
+
+    async def get(self) -> TGUser:
+        return await self._uow.memo(
+            TGUser.cache_key(self._telegram_user.id), lambda: resolve_user(self._uow, self._telegram_user)
+        )
+
+    def __await__(self):
+        return self.get().__await__()
+
+
+class DbMiddleware(BaseMiddleware):
+    """
+    Middleware for adding user into DB if they don't exist
+
+    Registered on message and callback_query, so other update types (chat_member, ...)
+    never reach it. Every update gets its own UnitOfWork in data['uow'] (also passed
+    as data['db_session']): one lazily opened session per pool, memoised lookups and
+    services built with uow.service(...). The user is given only to handlers registered
+    with the db_user flag:
+
+        router.message.register(user_start, F.text == "/start", flags={"db_user": True})
+
+    as a LazyUser in data['db_user'], which queries the DB on the first await only.
+    """
+
+    async def __call__(self, handler, event: Message | CallbackQuery, data: Dict[str, Any]):
+        """Override the __call__ method to add DB logic"""
+        uow = UnitOfWork(event.bot.db)
+        data['uow'] = uow
+        data['db_session'] = uow
 
-        # Add both db_session and user to the data for access in the handler
-        data['db_session'] = db_session
-        data['db_user'] = user
+        telegram_user: Optional[User] = event.from_user
+        if telegram_user is not None and get_flag(data, "db_user"):
+            data['db_user'] = LazyUser(uow, telegram_user)
 
-        # Now call the handler function
-        return await handler(event, data)
+        try:
+            # Now call the handler function
+            return await handler(event, data)
+        finally:
+            await uow.close()
@@ -1,7 +1,27 @@
-from sqlalchemy import Column, BigInteger, String, select, func, insert, update, literal_column, text, case
+from contextlib import aclosing
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, BigInteger, DateTime, Index, Integer, Numeric, SmallInteger, String, select, func, insert, update, delete
+)
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
 
+from tgbot.constants import DETAILS_BATCH_SIZE, STREAM_FETCH_SIZE, USER_WRITE_BEHIND
+from tgbot.models import queries
+from tgbot.models.period import SalesPeriod
+from tgbot.services.cache_service import user_cache
 from tgbot.services.db_base import Base
+from tgbot.services.sales_summary import sales_summary
+from tgbot.services.user_writer import user_writer
+
+
+def _summary(statement):
+    """Statement reading bot_sales_summary, or the range-filtered ERP query until the table is first filled"""
+    return statement if sales_summary.ready else queries.ERP_FALLBACK[statement]
 
 
 class TGUser(Base):
@@ -16,6 +36,25 @@ class TGUser(Base):
     def __repr__(self):
         return f"<TGUser {self.firstname} {self.lastname}>"
 
+    @staticmethod
+    async def _stream(db_session: sessionmaker, stmt, params: dict = None, fetch_size: int = STREAM_FETCH_SIZE,
+                      scalars: bool = False) -> AsyncIterator[Any]:
+        """
+        Yield rows of stmt from a server-side cursor, fetch_size rows at a time.
+
+        The session stays open until the generator is exhausted or closed, so
+        consumers that may stop early should wrap it in contextlib.aclosing().
+        A UnitOfWork gives the stream its own session (isolated()): other queries
+        of the update must not share a connection with an open server-side cursor.
+        """
+        async with getattr(db_session, "isolated", db_session)() as session:
+            result = await session.stream(stmt, params or {}, execution_options={"yield_per": fetch_size})
+            if scalars:
+                result = result.scalars()
+            async for partition in result.partitions():
+                for row in partition:
+                    yield row
+
     @classmethod
     async def get_user(cls, db_session: sessionmaker, telegram_id: int) -> 'TGUser':
         """
@@ -51,18 +90,60 @@ class TGUser(Base):
             await session.commit()
             return result
 
+    @classmethod
+    async def upsert_users(cls, db_session: sessionmaker, users: Iterable['TGUser'],
+                           batch_size: int = USER_WRITE_BEHIND["MAX_BATCH"]) -> int:
+        """
+        Add users or refresh their Telegram profile with multi-row inserts, batch_size rows per statement
+
+        INSERT INTO telegram_users (telegram_id, firstname, lastname, username, lang_code) VALUES (...), (...)
+        ON DUPLICATE KEY UPDATE firstname = VALUES(firstname), ...;   -- ON CONFLICT DO UPDATE elsewhere
+
+        phone is never overwritten.
+        """
+        profile = ('firstname', 'lastname', 'username', 'lang_code')
+        rows = [
+            {'telegram_id': user.telegram_id, **{key: getattr(user, key) for key in profile}}
+            for user in users
+        ]
+        async with db_session() as session:
+            dialect = session.bind.dialect
+            for start in range(0, len(rows), batch_size):
+                if dialect.name == 'mysql':
+                    sql = mysql_insert(cls).values(rows[start:start + batch_size])
+                    sql = sql.on_duplicate_key_update({key: sql.inserted[key] for key in profile})
+                else:
+                    sql = postgresql_insert(cls) if dialect.name == 'postgresql' else sqlite_insert(cls)
+                    sql = sql.values(rows[start:start + batch_size])
+                    sql = sql.on_conflict_do_update(
+                        index_elements=[cls.telegram_id], set_={key: sql.excluded[key] for key in profile}
+                    )
+                await session.execute(sql)
+                await session.commit()
+        return len(rows)
+
+    @staticmethod
+    def cache_key(telegram_id: int) -> str:
+        """Key of the user in user_cache (identity cache of DbMiddleware)"""
+        return f"tg_user_{int(telegram_id)}"
+
     @classmethod
     async def update_user(cls, db_session: sessionmaker, telegram_id: int, **kwargs):
         """
-        Update user by telegram_id
+        Update user by telegram_id and drop them from the identity cache
 
         UPDATE telegram_users SET key1=value1, key2=value2 WHERE telegram_id = :telegram_id;
         """
+        if user_writer.get(telegram_id) is not None:
+            # The row may not be inserted yet: write the buffered users first
+            await user_writer.flush()
         async with db_session() as session:
             sql = update(cls).where(cls.telegram_id == telegram_id).values(**kwargs)
             result = await session.execute(sql)
             await session.commit()
-            return result
+        # The next update re-reads the row; the deletion is also broadcast to other replicas
+        await user_cache.delete(cls.cache_key(telegram_id))
+        return result
 
     @classmethod
     async def get_all_users(cls, db_session: sessionmaker):
@@ -77,6 +158,18 @@ class TGUser(Base):
             users: list = result.fetchall()
         return users
 
+    @classmethod
+    async def stream_users(cls, db_session: sessionmaker, fetch_size: int = STREAM_FETCH_SIZE) -> AsyncIterator['TGUser']:
+        """
+        Iterate over all users without loading them at once (e.g. for broadcasts)
+
+        SELECT * FROM telegram_users ORDER BY telegram_id;
+        """
+        users = cls._stream(db_session, select(cls).order_by(cls.telegram_id), fetch_size=fetch_size, scalars=True)
+        async with aclosing(users):
+            async for user in users:
+                yield user
+
     @classmethod
     async def get_users_count(cls, db_session: sessionmaker) -> int:
         """
@@ -96,11 +189,13 @@ class TGUser(Base):
             user = await session.execute(sql)
             return user.scalar_one_or_none()
 
-    # get user invoice eby phone number and chosen month
+    # get user invoice by customer ids (resolved from phone number) and chosen month
     @classmethod
-    async def get_user_invoice(cls, db_session: sessionmaker, phone: str, month: str):
+    async def get_user_invoice(cls, db_session: sessionmaker, customer_ids: List[int], year: int, month: int):
         """
-        Get user invoice by phone number and chosen month
+        Get user invoice by customer ids and chosen month of the year
+
+        customer_ids are resolved from the user's phone by PhoneDirectory.
 
         SELECT
             o.obj_name AS "Магазин/Склад",
@@ -121,48 +216,22 @@ class TGUser(Base):
             ON g.gd_id = op.opr_good
         JOIN dir_objects o
             ON o.obj_id = s.sls_object
-        JOIN dir_customers c
-            ON c.cstm_id = s.sls_customer
         JOIN dir_sales_status dss
             ON dss.sords_id = s.sls_status
-        WHERE s.sls_datetime BETWEEN '2015-01-01' AND '2044-06-15'
+        WHERE s.sls_datetime >= :period_start AND s.sls_datetime < :period_end
             AND s.sls_performed = 1
             AND s.sls_deleted = 0
-            AND %s IN (c.cstm_phone, c.cstm_phone2, c.cstm_phone3, c.cstm_phone4)
+            AND s.sls_customer IN (:customer_ids)
             AND dss.sords_name != 'Завершен'
-            AND EXTRACT(MONTH FROM s.sls_datetime) = %s"
             ORDER BY s.sls_datetime DESC
         """
+        if not customer_ids:
+            return []
+        period = SalesPeriod(int(year), int(month))
         async with db_session() as session:
-            stmt = select(
-                literal_column("o.obj_name").label("Магазин/Склад"),
-                literal_column("g.gd_code").label("Код"),
-                literal_column("g.gd_name").label("Номенклатура"),
-                literal_column("s.sls_datetime").label("Дата/Время"),
-                literal_column("'Продажа'").label("Тип"),
-                literal_column("op.opr_quantity").label("Количество"),
-                literal_column("a.oap_price1").label("Цена"),
-                (literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма"),
-                literal_column("dss.sords_name").label("Статус оплаты")
-            ).select_from(
-                text(
-                    "doc_sales s "
-                    "JOIN operations op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
-                    "JOIN operations_additional_prop a ON a.oap_operation = op.opr_id "
-                    "JOIN dir_goods g ON g.gd_id = op.opr_good "
-                    "JOIN dir_objects o ON o.obj_id = s.sls_object "
-                    "JOIN dir_customers c ON c.cstm_id = s.sls_customer "
-                    "JOIN dir_sales_status dss ON dss.sords_id = s.sls_status"
-                )
-            ).where(
-                text("s.sls_datetime BETWEEN '2015-01-01' AND '2044-06-15'"),
-                text("s.sls_performed = 1"),
-                text("s.sls_deleted = 0"),
-                text(":phone IN (c.cstm_phone, c.cstm_phone2, c.cstm_phone3, c.cstm_phone4)"),
-                text("dss.sords_name != 'Завершен'"),
-                text("EXTRACT(MONTH FROM s.sls_datetime) = :month")
-            ).order_by(text("s.sls_datetime DESC"))
-            result = await session.execute(stmt, {"phone": phone, "month": month})
+            result = await session.execute(
+                queries.USER_INVOICE, {"customer_ids": list(customer_ids), **period.params()}
+            )
             return result.fetchall()
 
     @classmethod
@@ -174,63 +243,19 @@ class TGUser(Base):
         Args:
             db_session: The SQLAlchemy sessionmaker object for database interaction.
             year: Optional year filter
-            month: Optional month filter
+            month: Optional month filter (requires year)
 
         Returns:
             A list of dictionaries, where each dictionary represents a row from the
             query result, containing the summarized sales invoice data.
         """
+        period = SalesPeriod.from_filters(year, month)
         async with db_session() as session:
-            # Базовые условия WHERE
-            where_conditions = [
-                text("s.sls_performed = 1"),
-                text("s.sls_deleted = 0")
-            ]
-            
-            # Добавляем фильтры по году и месяцу если переданы
-            if year is not None:
-                where_conditions.append(text("EXTRACT(YEAR FROM s.sls_datetime) = :year"))
-            if month is not None:
-                where_conditions.append(text("EXTRACT(MONTH FROM s.sls_datetime) = :month"))
-            
-            stmt = select(
-                literal_column("s.sls_id").label("Код"),
-                literal_column("s.sls_datetime").label("Дата/время"),
-                literal_column("'Продажа'").label("Тип операции"),
-                literal_column("o.obj_name").label("Магазин/Склад"),
-                literal_column("dss.sords_name").label("Статус документа"),
-                literal_column("c.cstm_name").label("Покупатель"),
-                func.sum(literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма продажи")
-            ).select_from(
-                text(
-                    "doc_sales AS s "
-                    "JOIN dir_objects AS o ON s.sls_object = o.obj_id "
-                    "JOIN dir_sales_status AS dss ON s.sls_status = dss.sords_id "
-                    "JOIN dir_customers AS c ON s.sls_customer = c.cstm_id "
-                    "JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
-                    "JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id"
-                )
-            ).where(
-                *where_conditions
-            ).group_by(
-                text("s.sls_id"),
-                text("s.sls_datetime"),
-                text("o.obj_name"),
-                text("dss.sords_name"),
-                text("c.cstm_name")
-            ).order_by(
-                text("s.sls_datetime DESC"),
-                text("s.sls_id DESC")
-            )
-            
-            # Параметры для фильтров
-            params = {}
-            if year is not None:
-                params["year"] = year
-            if month is not None:
-                params["month"] = month
-            
-            result = await session.execute(stmt, params)
+            # Фильтр по периоду - диапазон по sls_datetime, чтобы работал индекс
+            if period is not None:
+                result = await session.execute(_summary(queries.SALES_INVOICES_SUMMARY_BY_PERIOD), period.params())
+            else:
+                result = await session.execute(_summary(queries.SALES_INVOICES_SUMMARY))
             # Fetch all results and convert rows to dictionaries for easier consumption
             return [row._asdict() for row in result.fetchall()]
     
@@ -240,6 +265,55 @@ class TGUser(Base):
         Получить накладные за конкретный период (оптимизированная версия)
         """
         return await cls.get_all_sales_invoices_summary(db_session, year=year, month=month)
+
+    @classmethod
+    async def get_sales_invoices_page(cls, db_session: sessionmaker, year: int, month: int, page_size: int,
+                                      after: Optional[Tuple[datetime, int]] = None) -> List[Dict[str, Any]]:
+        """
+        One page of the invoice list for a month, ordered by (sls_datetime DESC, sls_id DESC).
+
+        Keyset pagination: after is the (Дата/время, Код) of the last invoice of
+        the previous page, None for the first page. Only page_size documents
+        are read and aggregated, whatever the size of the month.
+        """
+        period = SalesPeriod(int(year), int(month))
+        params = {"page_size": int(page_size), **period.params()}
+        async with db_session() as session:
+            if after is None:
+                result = await session.execute(_summary(queries.INVOICES_PAGE_FIRST), params)
+            else:
+                after_datetime, after_id = after
+                result = await session.execute(
+                    _summary(queries.INVOICES_PAGE_AFTER), {**params, "after_datetime": after_datetime, "after_id": after_id}
+                )
+            return [row._asdict() for row in result.fetchall()]
+
+    @classmethod
+    async def get_sales_invoices_totals(cls, db_session: sessionmaker, year: int, month: int) -> Dict[str, Any]:
+        """
+        Number of invoices and their total amount for a month, without fetching the invoices.
+        """
+        period = SalesPeriod(int(year), int(month))
+        async with db_session() as session:
+            result = await session.execute(_summary(queries.INVOICES_PERIOD_TOTALS), period.params())
+            row = result.fetchone()
+            return {"count": int(row.count or 0), "total": row.total or 0}
+
+    @classmethod
+    async def stream_sales_invoices_summary(cls, db_session: sessionmaker, year: int = None, month: int = None,
+                                            fetch_size: int = STREAM_FETCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of get_all_sales_invoices_summary for large exports:
+        yields one dictionary per invoice, holding at most fetch_size rows in memory.
+        """
+        period = SalesPeriod.from_filters(year, month)
+        if period is not None:
+            rows = cls._stream(db_session, _summary(queries.SALES_INVOICES_SUMMARY_BY_PERIOD), period.params(), fetch_size)
+        else:
+            rows = cls._stream(db_session, _summary(queries.SALES_INVOICES_SUMMARY), fetch_size=fetch_size)
+        async with aclosing(rows):
+            async for row in rows:
+                yield row._asdict()
     
     @classmethod
     async def get_sales_document_details(cls, db_session: sessionmaker, sales_id: int):
@@ -259,106 +333,57 @@ class TGUser(Base):
             query result, containing the detailed sales document data.
         """
         async with db_session() as session:
-            stmt = select(
-                literal_column("g.gd_code").label("Код товара"),
-                literal_column("g.gd_name").label("Наименование"),
-                literal_column("op.opr_quantity").label("Количество"),
-                literal_column("a.oap_price1").label("Цена"),
-                (literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма"),
-                literal_column("o.obj_name").label("Магазин/Склад"),
-                literal_column("s.sls_datetime").label("Дата/Время"),
-                literal_column("s.sls_id").label("ID Док")
-            ).select_from(
-                text(
-                    "doc_sales AS s "
-                    "JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
-                    "JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id "
-                    "JOIN dir_goods AS g ON g.gd_id = op.opr_good "
-                    "JOIN dir_objects AS o ON s.sls_object = o.obj_id"
-                )
-            ).where(
-                text("s.sls_id = :sales_id"),
-                text("s.sls_performed = 1"),
-                text("s.sls_deleted = 0")
-            ).order_by(
-                text("op.opr_id")
-            )
-
-            result = await session.execute(stmt, {"sales_id": sales_id})
+            result = await session.execute(queries.SALES_DOCUMENT_DETAILS, {"sales_id": sales_id})
             # Fetch all results and convert rows to dictionaries for easier consumption
             return [row._asdict() for row in result.fetchall()]
+
+    @classmethod
+    async def get_sales_documents_details(cls, db_session: sessionmaker, sales_ids: List[int],
+                                          batch_size: int = DETAILS_BATCH_SIZE) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        Line items for several sales documents, grouped by document id.
+
+        Same rows as get_sales_document_details, but fetched with one
+        sls_id IN (...) query per batch_size documents instead of one query
+        per document. Every requested id is present in the result; documents
+        without lines (or not performed / deleted) map to an empty list.
+        """
+        sales_ids = list(dict.fromkeys(int(sales_id) for sales_id in sales_ids))
+        details: Dict[int, List[Dict[str, Any]]] = {sales_id: [] for sales_id in sales_ids}
+        if not sales_ids:
+            return details
+        async with db_session() as session:
+            for start in range(0, len(sales_ids), batch_size):
+                result = await session.execute(
+                    queries.SALES_DOCUMENTS_DETAILS, {"sales_ids": sales_ids[start:start + batch_size]}
+                )
+                for row in result.fetchall():
+                    details[int(row._mapping["ID Док"])].append(row._asdict())
+        return details
     
     
     @classmethod
-    async def get_customer_sales_summary(cls, db_session: sessionmaker, phone_number: str, year: int = None, month: int = None):
+    async def get_customer_sales_summary(cls, db_session: sessionmaker, customer_ids: List[int], year: int = None,
+                                         month: int = None):
         """
-        Retrieves a summary of sales for a given customer phone number,
-        including the total sales amount, paid amount, and remaining debt.
+        Retrieves a summary of sales for the given customer ids (resolved from
+        a phone number by PhoneDirectory), including the total sales amount,
+        paid amount, and remaining debt.
         Фильтрует по году и месяцу, если переданы.
+
+        Sales lines and payments are aggregated per document in separate
+        subqueries, so each document yields exactly one row regardless of
+        how many lines and payments it has.
         """
+        if not customer_ids:
+            return []
+        period = SalesPeriod.from_filters(year or None, month or None)
         async with db_session() as session:
-            sales_sum_col = func.coalesce(
-                func.sum(literal_column("op.opr_quantity") * literal_column("a.oap_price1")),
-                0
-            ).label("Сумма")
-            paid_sum_col = func.coalesce(
-                func.sum(
-                    case(
-                        (literal_column("dco.cop_type").in_([1, 4]), literal_column("dco.cop_value")),
-                        else_=0
-                    )
-                ),
-                0
-            ).label("Оплачено")
-
-            where_clauses = [
-                text(
-                    "c.cstm_phone = :phone_number OR "
-                    "c.cstm_phone2 = :phone_number OR "
-                    "c.cstm_phone3 = :phone_number OR "
-                    "c.cstm_phone4 = :phone_number"
-                ),
-                text("s.sls_performed = 1"),
-                text("s.sls_deleted = 0")
-            ]
-            if year:
-                where_clauses.append(text("EXTRACT(YEAR FROM s.sls_datetime) = :year"))
-            if month:
-                where_clauses.append(text("EXTRACT(MONTH FROM s.sls_datetime) = :month"))
-
-            stmt = select(
-                literal_column("s.sls_datetime").label("Дата"),
-                func.concat(literal_column("'Реализация №'"), literal_column("s.sls_id")).label("Документ"),
-                sales_sum_col,
-                paid_sum_col,
-                (sales_sum_col - paid_sum_col).label("Долг"),
-                literal_column("s.sls_note").label("Примечание")
-            ).select_from(
-                text(
-                    "doc_sales AS s "
-                    "LEFT JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
-                    "LEFT JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id "
-                    "LEFT JOIN doc_cash_operations AS dco ON dco.cop_payment = s.sls_id "
-                    "JOIN dir_customers AS c ON s.sls_customer = c.cstm_id"
-                )
-            ).where(
-                *where_clauses
-            ).group_by(
-                text("s.sls_id"),
-                text("s.sls_datetime"),
-                text("s.sls_note")
-            ).order_by(
-                text("s.sls_datetime DESC"),
-                text("s.sls_id DESC")
-            )
-
-            params = {"phone_number": phone_number}
-            if year:
-                params["year"] = year
-            if month:
-                params["month"] = month
-
-            result = await session.execute(stmt, params)
+            params = {"customer_ids": list(customer_ids)}
+            if period is not None:
+                result = await session.execute(queries.CUSTOMER_SALES_SUMMARY_BY_PERIOD, {**params, **period.params()})
+            else:
+                result = await session.execute(queries.CUSTOMER_SALES_SUMMARY, params)
             return [row._asdict() for row in result.fetchall()]
 
     @classmethod
@@ -367,11 +392,7 @@ class TGUser(Base):
         Получить список уникальных годов, в которых были продажи.
         """
         async with db_session() as session:
-            stmt = select(func.extract('year', literal_column('sls_datetime')).label('year')).select_from(text('doc_sales')).where(
-                text('sls_performed = 1'),
-                text('sls_deleted = 0')
-            ).group_by(text('year')).order_by(text('year DESC'))
-            result = await session.execute(stmt)
+            result = await session.execute(_summary(queries.SALES_YEARS))
             return [int(row.year) for row in result.fetchall() if row.year]
 
     @classmethod
@@ -380,12 +401,8 @@ class TGUser(Base):
         Получить список уникальных месяцев, в которых были продажи за указанный год.
         """
         async with db_session() as session:
-            stmt = select(func.extract('month', literal_column('sls_datetime')).label('month')).select_from(text('doc_sales')).where(
-                text('sls_performed = 1'),
-                text('sls_deleted = 0'),
-                text('EXTRACT(YEAR FROM sls_datetime) = :year')
-            ).group_by(text('month')).order_by(text('month'))
-            result = await session.execute(stmt, {'year': year})
+            params = {"year": int(year), **SalesPeriod(int(year)).params()}
+            result = await session.execute(_summary(queries.SALES_MONTHS), params)
             return [int(row.month) for row in result.fetchall() if row.month]
 
     @classmethod
@@ -394,50 +411,204 @@ class TGUser(Base):
         Получить список покупателей, у которых были продажи за указанный год и (опционально) месяц.
         """
         async with db_session() as session:
-            where_clauses = [
-                text('s.sls_performed = 1'),
-                text('s.sls_deleted = 0'),
-                text('EXTRACT(YEAR FROM s.sls_datetime) = :year')
-            ]
-            params = {'year': year}
+            # year/month - для сводной таблицы, границы периода - для запроса к ERP
+            params = SalesPeriod(int(year), int(month) if month else None).params()
             if month:
-                where_clauses.append(text('EXTRACT(MONTH FROM s.sls_datetime) = :month'))
-                params['month'] = month
-            stmt = select(
-                literal_column('c.cstm_id').label('id'),
-                literal_column('c.cstm_name').label('name'),
-                literal_column('c.cstm_phone').label('phone')
-            ).select_from(
-                text('doc_sales AS s JOIN dir_customers AS c ON s.sls_customer = c.cstm_id')
-            ).where(
-                *where_clauses
-            ).group_by(
-                text('c.cstm_id'),
-                text('c.cstm_name'),
-                text('c.cstm_phone')
-            ).order_by(text('c.cstm_name'))
-            result = await session.execute(stmt, params)
+                result = await session.execute(
+                    _summary(queries.CUSTOMERS_BY_PERIOD), {"year": int(year), "month": int(month), **params}
+                )
+            else:
+                result = await session.execute(_summary(queries.CUSTOMERS_BY_YEAR), {"year": int(year), **params})
             return [row._asdict() for row in result.fetchall()]
 
     @classmethod
-    async def get_customer_name_by_phone(cls, db_session: sessionmaker, phone_number: str):
+    async def get_customer_phones(cls, db_session: sessionmaker, after_id: int = None):
         """
-        Получить название покупателя по номеру телефона.
+        Получить телефоны покупателей для справочника PhoneDirectory.
+        after_id - только покупатели с cstm_id больше указанного (инкрементальная догрузка).
+
+        SELECT cstm_id, cstm_phone, cstm_phone2, cstm_phone3, cstm_phone4 FROM dir_customers
+        WHERE cstm_id > :after_id ORDER BY cstm_id;
         """
         async with db_session() as session:
-            stmt = select(
-                literal_column('c.cstm_name').label('name')
-            ).select_from(
-                text('dir_customers AS c')
-            ).where(
-                text(
-                    "c.cstm_phone = :phone_number OR "
-                    "c.cstm_phone2 = :phone_number OR "
-                    "c.cstm_phone3 = :phone_number OR "
-                    "c.cstm_phone4 = :phone_number"
-                )
-            ).limit(1)
-            
-            result = await session.execute(stmt, {"phone_number": phone_number})
+            if after_id is not None:
+                result = await session.execute(queries.CUSTOMER_PHONES_AFTER, {'after_id': after_id})
+            else:
+                result = await session.execute(queries.CUSTOMER_PHONES)
+            return [tuple(row) for row in result.fetchall()]
+
+    @classmethod
+    async def get_customer_name(cls, db_session: sessionmaker, customer_ids: List[int]):
+        """
+        Получить название покупателя по id (из PhoneDirectory).
+        Возвращает None, если покупатель не найден.
+        """
+        if not customer_ids:
+            return None
+        async with db_session() as session:
+            result = await session.execute(queries.CUSTOMER_NAME, {"customer_ids": list(customer_ids)})
             row = result.fetchone()
-            return row.name if row else phone_number
\ No newline at end of file
+            return row.name if row else None
+
+
+class SyncState(Base):
+    """Named high-water marks of background synchronisation jobs"""
+    __tablename__ = "bot_sync_state"
+    name = Column(String(length=64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+    @classmethod
+    async def get_value(cls, db_session: sessionmaker, name: str) -> int:
+        """
+        SELECT value FROM bot_sync_state WHERE name = :name;
+        """
+        async with db_session() as session:
+            value = await session.scalar(select(cls.value).where(cls.name == name))
+            return int(value or 0)
+
+
+class SalesSummary(Base):
+    """
+    One row per performed, not deleted sales document, maintained by the bot.
+
+    Holds what the admin lists need (period, customer, object, status, amount
+    and number of sale lines) so that years, months, customers by period and
+    the invoice list are read from this table instead of aggregating
+    doc_sales x operations x operations_additional_prop on every request.
+    Refreshed by tgbot/services/sales_summary.py.
+    """
+    __tablename__ = "bot_sales_summary"
+    __table_args__ = (
+        Index("ix_bot_sales_summary_period_customer", "sls_year", "sls_month", "customer_id"),
+        Index("ix_bot_sales_summary_datetime", "sls_datetime", "sls_id"),
+    )
+    sls_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    sls_year = Column(SmallInteger, nullable=False)
+    sls_month = Column(SmallInteger, nullable=False)
+    sls_datetime = Column(DateTime, nullable=False)
+    customer_id = Column(BigInteger)
+    object_id = Column(BigInteger)
+    status_id = Column(BigInteger)
+    amount = Column(Numeric(20, 4), nullable=False, default=0)
+    line_count = Column(Integer, nullable=False, default=0)
+
+    HIGH_WATER_MARK = "sales_summary.sls_id"
+
+    @staticmethod
+    def _summary_rows(rows) -> List[Dict[str, Any]]:
+        summary = []
+        for row in rows:
+            values = row._asdict()
+            values["sls_year"], values["sls_month"] = values["sls_datetime"].year, values["sls_datetime"].month
+            summary.append(values)
+        return summary
+
+    @classmethod
+    async def get_erp_max_id(cls, db_session: sessionmaker) -> int:
+        """
+        SELECT max(sls_id) FROM doc_sales;
+        """
+        async with db_session() as session:
+            return int(await session.scalar(queries.SALES_MAX_ID) or 0)
+
+    @classmethod
+    async def get_source_range(cls, db_session: sessionmaker, after_id: int, upto_id: int,
+                               batch_size: int) -> List[Dict[str, Any]]:
+        """
+        Aggregate up to batch_size ERP documents with after_id < sls_id <= upto_id, ordered by sls_id.
+        """
+        async with db_session() as session:
+            result = await session.execute(
+                queries.SALES_SUMMARY_SOURCE_RANGE,
+                {"after_id": after_id, "upto_id": upto_id, "batch_size": batch_size}
+            )
+            return cls._summary_rows(result.fetchall())
+
+    @classmethod
+    async def get_source_since(cls, db_session: sessionmaker, since: datetime, upto_id: int) -> List[Dict[str, Any]]:
+        """
+        Aggregate ERP documents dated since the given moment with sls_id <= upto_id.
+        """
+        async with db_session() as session:
+            result = await session.execute(queries.SALES_SUMMARY_SOURCE_SINCE, {"since": since, "upto_id": upto_id})
+            return cls._summary_rows(result.fetchall())
+
+    @classmethod
+    async def replace_range(cls, db_session: sessionmaker, rows: List[Dict[str, Any]], after_id: int,
+                            upto_id: int) -> None:
+        """
+        Replace summary rows with after_id < sls_id <= upto_id and move the
+        high-water mark to upto_id, in one transaction.
+        """
+        async with db_session() as session:
+            await session.execute(delete(cls).where(cls.sls_id > after_id, cls.sls_id <= upto_id))
+            if rows:
+                await session.execute(insert(cls), rows)
+            await cls._set_high_water_mark(session, upto_id)
+            await session.commit()
+
+    @classmethod
+    async def get_source_by_ids(cls, db_session: sessionmaker, sales_ids: List[int],
+                                batch_size: int) -> List[Dict[str, Any]]:
+        """
+        Aggregate the given ERP documents (those still performed and not deleted), batch_size ids per query.
+        """
+        rows = []
+        async with db_session() as session:
+            for start in range(0, len(sales_ids), batch_size):
+                result = await session.execute(
+                    queries.SALES_SUMMARY_SOURCE_IDS, {"sales_ids": sales_ids[start:start + batch_size]}
+                )
+                rows.extend(cls._summary_rows(result.fetchall()))
+        return rows
+
+    @classmethod
+    async def get_since(cls, db_session: sessionmaker, since: datetime, upto_id: int) -> Dict[int, Dict[str, Any]]:
+        """
+        Stored summary rows dated since the given moment with sls_id <= upto_id, by sls_id.
+
+        SELECT * FROM bot_sales_summary WHERE sls_datetime >= :since AND sls_id <= :upto_id;
+        """
+        async with db_session() as session:
+            result = await session.execute(
+                select(*cls.__table__.columns).where(cls.sls_datetime >= since, cls.sls_id <= upto_id)
+            )
+            return {row.sls_id: row._asdict() for row in result.fetchall()}
+
+    @classmethod
+    async def get_by_ids(cls, db_session: sessionmaker, sales_ids: List[int],
+                         batch_size: int) -> Dict[int, Dict[str, Any]]:
+        """
+        Stored summary rows of the given documents, by sls_id.
+
+        SELECT * FROM bot_sales_summary WHERE sls_id IN (...);
+        """
+        rows = {}
+        async with db_session() as session:
+            for start in range(0, len(sales_ids), batch_size):
+                result = await session.execute(
+                    select(*cls.__table__.columns).where(cls.sls_id.in_(sales_ids[start:start + batch_size]))
+                )
+                rows.update((row.sls_id, row._asdict()) for row in result.fetchall())
+        return rows
+
+    @classmethod
+    async def replace_ids(cls, db_session: sessionmaker, rows: List[Dict[str, Any]], sales_ids: List[int],
+                          batch_size: int) -> None:
+        """
+        Delete summary rows of the given documents and insert rows, in one transaction.
+        """
+        async with db_session() as session:
+            for start in range(0, len(sales_ids), batch_size):
+                await session.execute(delete(cls).where(cls.sls_id.in_(sales_ids[start:start + batch_size])))
+            if rows:
+                await session.execute(insert(cls), rows)
+            await session.commit()
+
+    @classmethod
+    async def _set_high_water_mark(cls, session, value: int) -> None:
+        updated = await session.execute(
+            update(SyncState).where(SyncState.name == cls.HIGH_WATER_MARK).values(value=value)
+        )
+        if not updated.rowcount:
+            await session.execute(insert(SyncState).values(name=cls.HIGH_WATER_MARK, value=value))
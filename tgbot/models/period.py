@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+
+@dataclass(frozen=True)
+class SalesPeriod:
+    """
+    Period filter for ERP queries: a whole year or a single month.
+
+    Compiles to a half-open range on the raw column
+    (``col >= :period_start AND col < :period_end``) instead of
+    ``EXTRACT(YEAR/MONTH FROM col) = ...``, so MySQL can use an index on
+    ``sls_datetime`` rather than scanning all of ``doc_sales``.
+    """
+    year: int
+    month: Optional[int] = None
+
+    def __post_init__(self):
+        if self.month is not None and not 1 <= int(self.month) <= 12:
+            raise ValueError(f"Invalid month: {self.month}")
+
+    @classmethod
+    def from_filters(cls, year: Optional[int] = None, month: Optional[int] = None) -> Optional['SalesPeriod']:
+        """
+        Build a period from optional year/month filters.
+
+        Returns None when no filter is given. A month without a year cannot be
+        expressed as one range and is rejected.
+        """
+        if year is None:
+            if month is not None:
+                raise ValueError("Month filter requires a year")
+            return None
+        return cls(int(year), int(month) if month is not None else None)
+
+    @property
+    def start(self) -> datetime:
+        return datetime(self.year, self.month or 1, 1)
+
+    @property
+    def end(self) -> datetime:
+        if self.month is None or self.month == 12:
+            return datetime(self.year + 1, 1, 1)
+        return datetime(self.year, self.month + 1, 1)
+
+    @staticmethod
+    def clause(column: str = "s.sls_datetime") -> TextClause:
+        """WHERE fragment with :period_start / :period_end placeholders"""
+        return text(f"{column} >= :period_start AND {column} < :period_end")
+
+    def params(self) -> Dict[str, Any]:
+        """Bound values for clause()"""
+        return {"period_start": self.start, "period_end": self.end}
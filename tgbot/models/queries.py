@@ -0,0 +1,525 @@
+"""
+ERP query catalogue.
+
+Every statement used by TGUser and SalesSummary against the ERP tables and the
+bot-owned bot_sales_summary table is built once at import time and only
+parameterised at execution (``session.execute(STMT, params)``).
+Rebuilding the ``select(literal_column(...)).select_from(text(...))`` tree on
+every call cost more Python time than fetching a cached row, and each new tree
+had to be walked again to compute its compiled-cache key. Module-level
+statements keep that work to a single cache lookup per call.
+
+Optional filters are expressed as separate statements (e.g. with and without a
+period) rather than by appending clauses at call time.
+"""
+from sqlalchemy import DateTime, Integer, Numeric, Select, bindparam, case, func, literal_column, select, table, text
+
+from tgbot.models.period import SalesPeriod
+
+
+def _customer_ids_clause(column: str = "s.sls_customer"):
+    return text(f"{column} IN :customer_ids").bindparams(bindparam("customer_ids", expanding=True))
+
+
+def _document_filters(with_customers: bool = False, with_period: bool = False) -> list:
+    """Common doc_sales filters: performed, not deleted, optionally customer ids and period"""
+    clauses = [
+        text("s.sls_performed = 1"),
+        text("s.sls_deleted = 0")
+    ]
+    if with_customers:
+        clauses.insert(0, _customer_ids_clause())
+    if with_period:
+        clauses.append(SalesPeriod.clause("s.sls_datetime"))
+    return clauses
+
+
+# Params: customer_ids, period_start, period_end
+USER_INVOICE = select(
+    literal_column("o.obj_name").label("Магазин/Склад"),
+    literal_column("g.gd_code").label("Код"),
+    literal_column("g.gd_name").label("Номенклатура"),
+    literal_column("s.sls_datetime").label("Дата/Время"),
+    literal_column("'Продажа'").label("Тип"),
+    literal_column("op.opr_quantity").label("Количество"),
+    literal_column("a.oap_price1").label("Цена"),
+    (literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма"),
+    literal_column("dss.sords_name").label("Статус оплаты")
+).select_from(
+    text(
+        "doc_sales s "
+        "JOIN operations op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
+        "JOIN operations_additional_prop a ON a.oap_operation = op.opr_id "
+        "JOIN dir_goods g ON g.gd_id = op.opr_good "
+        "JOIN dir_objects o ON o.obj_id = s.sls_object "
+        "JOIN dir_sales_status dss ON dss.sords_id = s.sls_status"
+    )
+).where(
+    SalesPeriod.clause("s.sls_datetime"),
+    text("s.sls_performed = 1"),
+    text("s.sls_deleted = 0"),
+    _customer_ids_clause(),
+    text("dss.sords_name != 'Завершен'")
+).order_by(text("s.sls_datetime DESC"))
+
+
+def _sales_summary_source(*documents) -> Select:
+    # Одна строка на документ: суммы строк продажи (0 и line_count = 0 для
+    # документов без строк - они нужны спискам годов, месяцев и покупателей)
+    return select(
+        literal_column("s.sls_id").label("sls_id"),
+        literal_column("s.sls_datetime", DateTime).label("sls_datetime"),
+        literal_column("s.sls_customer").label("customer_id"),
+        literal_column("s.sls_object").label("object_id"),
+        literal_column("s.sls_status").label("status_id"),
+        func.coalesce(
+            func.sum(literal_column("op.opr_quantity") * literal_column("a.oap_price1")), 0, type_=Numeric
+        ).label("amount"),
+        func.count(literal_column("a.oap_operation")).label("line_count")
+    ).select_from(
+        text(
+            "doc_sales AS s "
+            "LEFT JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
+            "LEFT JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id"
+        )
+    ).where(
+        *_document_filters(),
+        *documents
+    ).group_by(
+        text("s.sls_id"),
+        text("s.sls_datetime"),
+        text("s.sls_customer"),
+        text("s.sls_object"),
+        text("s.sls_status")
+    ).order_by(
+        text("s.sls_id")
+    )
+
+
+# Накладные админских списков читаются из таблицы бота bot_sales_summary
+# (одна строка на документ, см. SalesSummary), а не агрегируются заново по
+# doc_sales x operations x operations_additional_prop. Справочники
+# присоединяются при чтении, чтобы переименования были видны сразу.
+_SUMMARY = table("bot_sales_summary").alias("ss")
+
+
+def _summary_documents(summary):
+    return summary.join(
+        table("dir_objects").alias("o"), text("ss.object_id = o.obj_id")
+    ).join(
+        table("dir_sales_status").alias("dss"), text("ss.status_id = dss.sords_id")
+    ).join(
+        table("dir_customers").alias("c"), text("ss.customer_id = c.cstm_id")
+    )
+
+
+_SUMMARY_INVOICE_COLUMNS = (
+    literal_column("ss.sls_id").label("Код"),
+    literal_column("ss.sls_datetime").label("Дата/время"),
+    literal_column("'Продажа'").label("Тип операции"),
+    literal_column("o.obj_name").label("Магазин/Склад"),
+    literal_column("dss.sords_name").label("Статус документа"),
+    literal_column("c.cstm_name").label("Покупатель"),
+    literal_column("ss.amount").label("Сумма продажи")
+)
+
+# В списке накладных только документы со строками продажи
+_HAS_SALE_LINES = text("ss.line_count > 0")
+
+# Ключ сортировки списка накладных (sls_datetime DESC, sls_id DESC): строки после курсора
+_AFTER_CURSOR = text(
+    "(ss.sls_datetime < :after_datetime OR (ss.sls_datetime = :after_datetime AND ss.sls_id < :after_id))"
+)
+
+
+def _sales_invoices_summary(summary, with_period: bool, after_cursor: bool = False) -> Select:
+    filters = [_HAS_SALE_LINES]
+    if with_period:
+        filters.append(SalesPeriod.clause("ss.sls_datetime"))
+    if after_cursor:
+        filters.append(_AFTER_CURSOR)
+    return select(
+        *_SUMMARY_INVOICE_COLUMNS
+    ).select_from(
+        _summary_documents(summary)
+    ).where(
+        *filters
+    ).order_by(
+        text("ss.sls_datetime DESC"),
+        text("ss.sls_id DESC")
+    )
+
+
+def _invoices_page(summary, after_cursor: bool) -> Select:
+    return _sales_invoices_summary(
+        summary, with_period=True, after_cursor=after_cursor
+    ).limit(bindparam("page_size", type_=Integer))
+
+
+def _invoices_period_totals(summary) -> Select:
+    return select(
+        func.count().label("count"),
+        func.coalesce(func.sum(literal_column("ss.amount")), 0).label("total")
+    ).select_from(
+        _summary_documents(summary)
+    ).where(
+        _HAS_SALE_LINES,
+        SalesPeriod.clause("ss.sls_datetime")
+    )
+
+
+# No params / params: period_start, period_end
+SALES_INVOICES_SUMMARY = _sales_invoices_summary(_SUMMARY, with_period=False)
+SALES_INVOICES_SUMMARY_BY_PERIOD = _sales_invoices_summary(_SUMMARY, with_period=True)
+
+# Params: period_start, period_end, page_size / + after_datetime, after_id
+INVOICES_PAGE_FIRST = _invoices_page(_SUMMARY, after_cursor=False)
+INVOICES_PAGE_AFTER = _invoices_page(_SUMMARY, after_cursor=True)
+
+# Params: period_start, period_end
+INVOICES_PERIOD_TOTALS = _invoices_period_totals(_SUMMARY)
+
+
+# Пока таблица не заполнена впервые (SalesSummaryRefresher.ready), списки
+# читают ERP прежними запросами (*_ERP, те же столбцы и параметры): период
+# задаётся диапазоном sls_datetime прямо по doc_sales, поэтому запросы
+# используют индекс (sls_performed, sls_deleted, sls_datetime)
+_ERP_INVOICE_DOCUMENTS = (
+    "doc_sales AS s "
+    "JOIN dir_objects AS o ON s.sls_object = o.obj_id "
+    "JOIN dir_sales_status AS dss ON s.sls_status = dss.sords_id "
+    "JOIN dir_customers AS c ON s.sls_customer = c.cstm_id"
+)
+
+_ERP_SALE_LINES = (
+    "JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
+    "JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id"
+)
+
+_ERP_AFTER_CURSOR = text(
+    "(s.sls_datetime < :after_datetime OR (s.sls_datetime = :after_datetime AND s.sls_id < :after_id))"
+)
+
+_ERP_HAS_SALE_LINES = text(
+    "EXISTS (SELECT 1 FROM operations AS po "
+    "JOIN operations_additional_prop AS pa ON pa.oap_operation = po.opr_id "
+    "WHERE po.opr_document = s.sls_id AND po.opr_type = 2)"
+)
+
+
+def _erp_sales_invoices_summary(with_period: bool) -> Select:
+    return select(
+        literal_column("s.sls_id").label("Код"),
+        literal_column("s.sls_datetime").label("Дата/время"),
+        literal_column("'Продажа'").label("Тип операции"),
+        literal_column("o.obj_name").label("Магазин/Склад"),
+        literal_column("dss.sords_name").label("Статус документа"),
+        literal_column("c.cstm_name").label("Покупатель"),
+        func.sum(literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма продажи")
+    ).select_from(
+        text(f"{_ERP_INVOICE_DOCUMENTS} {_ERP_SALE_LINES}")
+    ).where(
+        *_document_filters(with_period=with_period)
+    ).group_by(
+        text("s.sls_id"),
+        text("s.sls_datetime"),
+        text("o.obj_name"),
+        text("dss.sords_name"),
+        text("c.cstm_name")
+    ).order_by(
+        text("s.sls_datetime DESC"),
+        text("s.sls_id DESC")
+    )
+
+
+def _erp_invoices_page(after_cursor: bool) -> Select:
+    # Сначала по индексу выбираются только документы страницы, затем суммы считаются для них
+    page_filters = [*_document_filters(with_period=True), _ERP_HAS_SALE_LINES]
+    if after_cursor:
+        page_filters.append(_ERP_AFTER_CURSOR)
+    page = select(
+        literal_column("s.sls_id").label("sls_id"),
+        literal_column("s.sls_datetime").label("sls_datetime"),
+        literal_column("o.obj_name").label("obj_name"),
+        literal_column("dss.sords_name").label("sords_name"),
+        literal_column("c.cstm_name").label("cstm_name")
+    ).select_from(
+        text(_ERP_INVOICE_DOCUMENTS)
+    ).where(
+        *page_filters
+    ).order_by(
+        text("s.sls_datetime DESC"),
+        text("s.sls_id DESC")
+    ).limit(bindparam("page_size", type_=Integer)).subquery("page")
+
+    return select(
+        literal_column("page.sls_id").label("Код"),
+        literal_column("page.sls_datetime").label("Дата/время"),
+        literal_column("'Продажа'").label("Тип операции"),
+        literal_column("page.obj_name").label("Магазин/Склад"),
+        literal_column("page.sords_name").label("Статус документа"),
+        literal_column("page.cstm_name").label("Покупатель"),
+        func.sum(literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма продажи")
+    ).select_from(
+        page.join(
+            table("operations").alias("op"), text("op.opr_document = page.sls_id AND op.opr_type = 2")
+        ).join(
+            table("operations_additional_prop").alias("a"), text("a.oap_operation = op.opr_id")
+        )
+    ).group_by(
+        text("page.sls_id"),
+        text("page.sls_datetime"),
+        text("page.obj_name"),
+        text("page.sords_name"),
+        text("page.cstm_name")
+    ).order_by(
+        text("page.sls_datetime DESC"),
+        text("page.sls_id DESC")
+    )
+
+
+# No params / params: period_start, period_end
+SALES_INVOICES_SUMMARY_ERP = _erp_sales_invoices_summary(with_period=False)
+SALES_INVOICES_SUMMARY_BY_PERIOD_ERP = _erp_sales_invoices_summary(with_period=True)
+
+# Params: period_start, period_end, page_size / + after_datetime, after_id
+INVOICES_PAGE_FIRST_ERP = _erp_invoices_page(after_cursor=False)
+INVOICES_PAGE_AFTER_ERP = _erp_invoices_page(after_cursor=True)
+
+# Params: period_start, period_end
+INVOICES_PERIOD_TOTALS_ERP = select(
+    func.count(func.distinct(literal_column("s.sls_id"))).label("count"),
+    func.coalesce(func.sum(literal_column("op.opr_quantity") * literal_column("a.oap_price1")), 0).label("total")
+).select_from(
+    text(f"{_ERP_INVOICE_DOCUMENTS} {_ERP_SALE_LINES}")
+).where(
+    *_document_filters(with_period=True)
+)
+
+
+# Params: after_id, upto_id, batch_size
+SALES_SUMMARY_SOURCE_RANGE = _sales_summary_source(
+    text("s.sls_id > :after_id AND s.sls_id <= :upto_id")
+).limit(bindparam("batch_size", type_=Integer))
+
+# Params: since, upto_id
+SALES_SUMMARY_SOURCE_SINCE = _sales_summary_source(text("s.sls_datetime >= :since AND s.sls_id <= :upto_id"))
+
+# Params: sales_ids
+SALES_SUMMARY_SOURCE_IDS = _sales_summary_source(
+    text("s.sls_id IN :sales_ids").bindparams(bindparam("sales_ids", expanding=True))
+)
+
+# No params
+SALES_MAX_ID = select(func.max(literal_column("s.sls_id")).label("max_id")).select_from(text("doc_sales AS s"))
+
+
+def _document_details(documents, *order_by) -> Select:
+    return select(
+        literal_column("g.gd_code").label("Код товара"),
+        literal_column("g.gd_name").label("Наименование"),
+        literal_column("op.opr_quantity").label("Количество"),
+        literal_column("a.oap_price1").label("Цена"),
+        (literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("Сумма"),
+        literal_column("o.obj_name").label("Магазин/Склад"),
+        literal_column("s.sls_datetime").label("Дата/Время"),
+        literal_column("s.sls_id").label("ID Док")
+    ).select_from(
+        text(
+            "doc_sales AS s "
+            "JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
+            "JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id "
+            "JOIN dir_goods AS g ON g.gd_id = op.opr_good "
+            "JOIN dir_objects AS o ON s.sls_object = o.obj_id"
+        )
+    ).where(
+        documents,
+        text("s.sls_performed = 1"),
+        text("s.sls_deleted = 0")
+    ).order_by(
+        *order_by
+    )
+
+
+# Params: sales_id
+SALES_DOCUMENT_DETAILS = _document_details(text("s.sls_id = :sales_id"), text("op.opr_id"))
+
+# Params: sales_ids (expanding); строки сгруппированы по документу
+SALES_DOCUMENTS_DETAILS = _document_details(
+    text("s.sls_id IN :sales_ids").bindparams(bindparam("sales_ids", expanding=True)),
+    text("s.sls_id"),
+    text("op.opr_id")
+)
+
+
+def _customer_sales_summary(with_period: bool) -> Select:
+    # Суммы продаж и оплат считаются отдельно по каждому документу и
+    # присоединяются по одной строке на документ: общий LEFT JOIN строк
+    # продажи и оплат дал бы N x M строк и завысил бы обе суммы.
+    sales_totals = select(
+        literal_column("op.opr_document").label("sls_id"),
+        func.sum(literal_column("op.opr_quantity") * literal_column("a.oap_price1")).label("amount")
+    ).select_from(
+        text(
+            "doc_sales AS s "
+            "JOIN operations AS op ON op.opr_document = s.sls_id AND op.opr_type = 2 "
+            "JOIN operations_additional_prop AS a ON a.oap_operation = op.opr_id"
+        )
+    ).where(
+        *_document_filters(with_customers=True, with_period=with_period)
+    ).group_by(text("op.opr_document")).subquery("st")
+
+    payment_totals = select(
+        literal_column("dco.cop_payment").label("sls_id"),
+        func.sum(
+            case(
+                (literal_column("dco.cop_type").in_([1, 4]), literal_column("dco.cop_value")),
+                else_=0
+            )
+        ).label("paid")
+    ).select_from(
+        text("doc_sales AS s JOIN doc_cash_operations AS dco ON dco.cop_payment = s.sls_id")
+    ).where(
+        *_document_filters(with_customers=True, with_period=with_period)
+    ).group_by(text("dco.cop_payment")).subquery("pt")
+
+    sales_sum_col = func.coalesce(sales_totals.c.amount, 0)
+    paid_sum_col = func.coalesce(payment_totals.c.paid, 0)
+
+    return select(
+        literal_column("s.sls_datetime").label("Дата"),
+        func.concat(literal_column("'Реализация №'"), literal_column("s.sls_id")).label("Документ"),
+        sales_sum_col.label("Сумма"),
+        paid_sum_col.label("Оплачено"),
+        (sales_sum_col - paid_sum_col).label("Долг"),
+        literal_column("s.sls_note").label("Примечание")
+    ).select_from(
+        table("doc_sales").alias("s").outerjoin(
+            sales_totals, text("st.sls_id = s.sls_id")
+        ).outerjoin(
+            payment_totals, text("pt.sls_id = s.sls_id")
+        )
+    ).where(
+        *_document_filters(with_customers=True, with_period=with_period)
+    ).order_by(
+        text("s.sls_datetime DESC"),
+        text("s.sls_id DESC")
+    )
+
+
+# Params: customer_ids / customer_ids, period_start, period_end
+CUSTOMER_SALES_SUMMARY = _customer_sales_summary(with_period=False)
+CUSTOMER_SALES_SUMMARY_BY_PERIOD = _customer_sales_summary(with_period=True)
+
+def _sales_years(summary) -> Select:
+    return select(
+        literal_column('ss.sls_year').label('year')
+    ).select_from(summary).group_by(text('ss.sls_year')).order_by(text('ss.sls_year DESC'))
+
+
+def _sales_months(summary) -> Select:
+    return select(
+        literal_column('ss.sls_month').label('month')
+    ).select_from(summary).where(
+        text('ss.sls_year = :year')
+    ).group_by(text('ss.sls_month')).order_by(text('ss.sls_month'))
+
+
+def _customers_by_period(summary, with_month: bool) -> Select:
+    # Покупатели периода берутся из индекса (sls_year, sls_month, customer_id)
+    # без чтения строк сводной таблицы, справочник - по одной строке на покупателя
+    filters = [text('ss.sls_year = :year')]
+    if with_month:
+        filters.append(text('ss.sls_month = :month'))
+    customers = select(
+        literal_column('ss.customer_id').label('customer_id')
+    ).select_from(
+        summary
+    ).where(
+        *filters
+    ).distinct().subquery('pc')
+    return select(
+        literal_column('c.cstm_id').label('id'),
+        literal_column('c.cstm_name').label('name'),
+        literal_column('c.cstm_phone').label('phone')
+    ).select_from(
+        customers.join(table('dir_customers').alias('c'), text('c.cstm_id = pc.customer_id'))
+    ).order_by(text('c.cstm_name'))
+
+
+# No params
+SALES_YEARS = _sales_years(_SUMMARY)
+
+# Params: year
+SALES_MONTHS = _sales_months(_SUMMARY)
+
+# Params: year / year, month
+CUSTOMERS_BY_YEAR = _customers_by_period(_SUMMARY, with_month=False)
+CUSTOMERS_BY_PERIOD = _customers_by_period(_SUMMARY, with_month=True)
+
+# No params
+SALES_YEARS_ERP = select(
+    func.extract('year', literal_column('sls_datetime')).label('year')
+).select_from(text('doc_sales')).where(
+    text('sls_performed = 1'),
+    text('sls_deleted = 0')
+).group_by(text('year')).order_by(text('year DESC'))
+
+# Params: period_start, period_end
+SALES_MONTHS_ERP = select(
+    func.extract('month', literal_column('sls_datetime')).label('month')
+).select_from(text('doc_sales')).where(
+    text('sls_performed = 1'),
+    text('sls_deleted = 0'),
+    SalesPeriod.clause('sls_datetime')
+).group_by(text('month')).order_by(text('month'))
+
+# Params: period_start, period_end (год или месяц)
+CUSTOMERS_BY_PERIOD_ERP = select(
+    literal_column('c.cstm_id').label('id'),
+    literal_column('c.cstm_name').label('name'),
+    literal_column('c.cstm_phone').label('phone')
+).select_from(
+    text('doc_sales AS s JOIN dir_customers AS c ON s.sls_customer = c.cstm_id')
+).where(
+    *_document_filters(with_period=True)
+).group_by(
+    text('c.cstm_id'),
+    text('c.cstm_name'),
+    text('c.cstm_phone')
+).order_by(text('c.cstm_name'))
+
+# Статементы по сводной таблице -> запросы к ERP до её первого заполнения.
+# Вызывающий код передаёт параметры обоих вариантов (year/month и period_start/period_end)
+ERP_FALLBACK = {
+    SALES_INVOICES_SUMMARY: SALES_INVOICES_SUMMARY_ERP,
+    SALES_INVOICES_SUMMARY_BY_PERIOD: SALES_INVOICES_SUMMARY_BY_PERIOD_ERP,
+    INVOICES_PAGE_FIRST: INVOICES_PAGE_FIRST_ERP,
+    INVOICES_PAGE_AFTER: INVOICES_PAGE_AFTER_ERP,
+    INVOICES_PERIOD_TOTALS: INVOICES_PERIOD_TOTALS_ERP,
+    SALES_YEARS: SALES_YEARS_ERP,
+    SALES_MONTHS: SALES_MONTHS_ERP,
+    CUSTOMERS_BY_YEAR: CUSTOMERS_BY_PERIOD_ERP,
+    CUSTOMERS_BY_PERIOD: CUSTOMERS_BY_PERIOD_ERP,
+}
+
+# No params / params: after_id
+CUSTOMER_PHONES = select(
+    literal_column('c.cstm_id').label('id'),
+    literal_column('c.cstm_phone').label('phone'),
+    literal_column('c.cstm_phone2').label('phone2'),
+    literal_column('c.cstm_phone3').label('phone3'),
+    literal_column('c.cstm_phone4').label('phone4')
+).select_from(
+    text('dir_customers AS c')
+).order_by(text('c.cstm_id'))
+CUSTOMER_PHONES_AFTER = CUSTOMER_PHONES.where(text('c.cstm_id > :after_id'))
+
+# Params: customer_ids
+CUSTOMER_NAME = select(
+    literal_column('c.cstm_name').label('name')
+).select_from(
+    text('dir_customers AS c')
+).where(
+    _customer_ids_clause('c.cstm_id')
+).order_by(text('c.cstm_id')).limit(1)
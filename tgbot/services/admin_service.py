@@ -1,8 +1,11 @@
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional
 from datetime import datetime
 from loguru import logger
 from tgbot.services.base_service import BaseService
-from tgbot.services.cache_service import cache_service
+from tgbot.services.cache_compact import CompactRows
+from tgbot.services.cache_service import cache_service, period_tag, phone_tag, sales_tag, user_cache
+from tgbot.services.db_pool import pool_status
+from tgbot.constants import CACHE_STALE_TTL, INVOICES_PAGE_SIZE, STREAM_FETCH_SIZE
 
 
 class AdminService(BaseService):
@@ -17,34 +20,132 @@ class AdminService(BaseService):
             self.db
         )
     
-    async def get_invoices_by_period(self, year: int, month: int) -> List[Dict[str, Any]]:
-        """Получить накладные за период с кэшированием"""
+    async def get_invoices_by_period(self, year: int, month: int, allow_stale: bool = False) -> List[Dict[str, Any]]:
+        """Получить накладные за период с кэшированием
+
+        allow_stale - вернуть устаревшие данные сразу и обновить их в фоне
+        """
         from tgbot.models.models import TGUser
         cache_key = f"admin_invoices_{year}_{month}"
         return await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_sales_invoices_by_period(self.db, year, month),
-            ttl_seconds=600
+            lambda: TGUser.get_sales_invoices_by_period(self.read_db, year, month),
+            ttl_seconds=600,
+            stale_ttl=CACHE_STALE_TTL["INVOICES"] if allow_stale else 0,
+            tags=lambda invoices: [
+                "invoices", period_tag(year, month), *(sales_tag(invoice['Код']) for invoice in invoices or ())
+            ],
+            compact=True
+        )
+    
+    async def get_invoices_totals(self, year: int, month: int, allow_stale: bool = False) -> Dict[str, Any]:
+        """Количество и общая сумма накладных за месяц (без загрузки самих накладных)"""
+        from tgbot.models.models import TGUser
+        year, month = int(year), int(month)
+        cache_key = f"admin_invoices_totals_{year}_{month}"
+        return await self.get_cached_data(
+            cache_key,
+            lambda: TGUser.get_sales_invoices_totals(self.read_db, year, month),
+            ttl_seconds=600,
+            stale_ttl=CACHE_STALE_TTL["INVOICES"] if allow_stale else 0,
+            tags=["invoices", period_tag(year, month)]
+        )
+    
+    async def get_invoices_page(self, year: int, month: int, cursor: Optional[List] = None,
+                                allow_stale: bool = False) -> List[Dict[str, Any]]:
+        """Страница списка накладных за месяц (keyset-пагинация)
+
+        cursor - результат invoice_cursor() для последней накладной предыдущей
+        страницы, None для первой страницы
+        """
+        from tgbot.models.models import TGUser
+        year, month = int(year), int(month)
+        after = (datetime.fromisoformat(cursor[0]), int(cursor[1])) if cursor else None
+        cache_key = f"admin_invoices_page_{year}_{month}_{cursor[0]}_{cursor[1]}" if cursor \
+            else f"admin_invoices_page_{year}_{month}_first"
+        return await self.get_cached_data(
+            cache_key,
+            lambda: TGUser.get_sales_invoices_page(self.read_db, year, month, INVOICES_PAGE_SIZE, after),
+            ttl_seconds=600,
+            stale_ttl=CACHE_STALE_TTL["INVOICES"] if allow_stale else 0,
+            tags=lambda invoices: [
+                "invoices", period_tag(year, month), *(sales_tag(invoice['Код']) for invoice in invoices or ())
+            ],
+            compact=True
         )
     
+    @staticmethod
+    def invoice_cursor(invoice: Dict[str, Any]) -> List:
+        """Курсор страницы после указанной накладной, пригодный для хранения в FSM"""
+        created = invoice['Дата/время']
+        return [created.isoformat() if hasattr(created, 'isoformat') else str(created), int(invoice['Код'])]
+    
+    @staticmethod
+    def total_pages(totals: Dict[str, Any]) -> int:
+        """Количество страниц списка накладных"""
+        return max(1, (totals["count"] + INVOICES_PAGE_SIZE - 1) // INVOICES_PAGE_SIZE)
+    
+    def stream_invoices(self, year: int, month: int = None,
+                        fetch_size: int = STREAM_FETCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+        """Потоковое чтение накладных за год или месяц без кэша (для больших выгрузок)"""
+        from tgbot.models.models import TGUser
+        return TGUser.stream_sales_invoices_summary(self.read_db, year, month, fetch_size)
+    
+    def stream_users(self, fetch_size: int = STREAM_FETCH_SIZE) -> AsyncIterator[Any]:
+        """Потоковое чтение всех пользователей бота (для рассылок)"""
+        from tgbot.models.models import TGUser
+        return TGUser.stream_users(self.db, fetch_size)
+    
     async def get_invoice_details(self, sales_id: int) -> Optional[List[Dict[str, Any]]]:
         """Получить детали накладной с кэшированием"""
         from tgbot.models.models import TGUser
         cache_key = f"admin_invoice_details_{sales_id}"
         return await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_sales_document_details(self.db, sales_id),
-            ttl_seconds=300
+            lambda: TGUser.get_sales_document_details(self.read_db, sales_id),
+            ttl_seconds=300,
+            tags=["invoices", sales_tag(sales_id)],
+            compact=True
         )
     
+    async def get_invoices_details(self, sales_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Детали нескольких накладных: отсутствующие в кэше загружаются одним запросом
+
+        Результат раскладывается по тем же записям кэша admin_invoice_details_{id},
+        что и у get_invoice_details
+        """
+        from tgbot.models.models import TGUser
+        sales_ids = list(dict.fromkeys(int(sales_id) for sales_id in sales_ids))
+        details: Dict[int, List[Dict[str, Any]]] = {}
+        missing = []
+        for sales_id in sales_ids:
+            cached = await self.get_cached_value(f"admin_invoice_details_{sales_id}", ttl_seconds=300)
+            if cached is None:
+                missing.append(sales_id)
+            else:
+                details[sales_id] = cached
+
+        if missing:
+            fetched = await TGUser.get_sales_documents_details(self.read_db, missing)
+            for sales_id, rows in fetched.items():
+                rows = CompactRows.from_rows(rows)
+                await cache_service.set(
+                    f"admin_invoice_details_{sales_id}", rows, ttl_seconds=300,
+                    tags=["invoices", sales_tag(sales_id)]
+                )
+                details[sales_id] = rows
+        return {sales_id: details[sales_id] for sales_id in sales_ids}
+    
     async def get_reconciliation_data(self, phone: str, year: int, month: int) -> List[Dict[str, Any]]:
         """Получить данные для акта сверки с кэшированием"""
         from tgbot.models.models import TGUser
         cache_key = f"admin_reconciliation_{phone}_{year}_{month}"
         return await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_customer_sales_summary(self.db, phone, year, month),
-            ttl_seconds=600
+            lambda: self.query_by_phone(TGUser.get_customer_sales_summary, phone, year, month),
+            ttl_seconds=600,
+            tags=[phone_tag(phone), period_tag(year, month)],
+            compact=True
         )
     
     async def get_sales_years(self) -> List[int]:
@@ -52,7 +153,7 @@ class AdminService(BaseService):
         from tgbot.models.models import TGUser
         return await self.get_cached_data(
             "admin_sales_years",
-            lambda: TGUser.get_sales_years(self.db),
+            lambda: TGUser.get_sales_years(self.read_db),
             ttl_seconds=3600
         )
     
@@ -62,18 +163,24 @@ class AdminService(BaseService):
         cache_key = f"admin_sales_months_{year}"
         return await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_sales_months(self.db, year),
+            lambda: TGUser.get_sales_months(self.read_db, year),
             ttl_seconds=3600
         )
     
-    async def get_customers_by_period(self, year: int, month: int) -> List[Dict[str, Any]]:
-        """Получить список покупателей за период с кэшированием"""
+    async def get_customers_by_period(self, year: int, month: int, allow_stale: bool = False) -> List[Dict[str, Any]]:
+        """Получить список покупателей за период с кэшированием
+
+        allow_stale - вернуть устаревшие данные сразу и обновить их в фоне
+        """
         from tgbot.models.models import TGUser
         cache_key = f"admin_customers_{year}_{month}"
         return await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_customers_by_period(self.db, year, month),
-            ttl_seconds=1800
+            lambda: TGUser.get_customers_by_period(self.read_db, year, month),
+            ttl_seconds=1800,
+            stale_ttl=CACHE_STALE_TTL["CUSTOMERS"] if allow_stale else 0,
+            tags=[period_tag(year, month)],
+            compact=True
         )
     
     async def get_all_customers_with_sales(self) -> List[Dict[str, Any]]:
@@ -82,7 +189,7 @@ class AdminService(BaseService):
         from sqlalchemy import text
         async def _get_all_customers():
             # Получаем всех покупателей с продажами (без фильтра по периоду)
-            async with self.db() as session:
+            async with self.read_db() as session:
                 stmt = text("""
                     SELECT DISTINCT 
                         c.cstm_id as id,
@@ -98,16 +205,15 @@ class AdminService(BaseService):
         
         return await self.get_cached_data("all_customers", _get_all_customers, ttl_seconds=3600)
     
-    def format_invoice_summary(self, invoices: List[Dict[str, Any]], year: int, month: int) -> str:
-        """Форматировать сводку накладных"""
-        if not invoices:
+    def format_invoice_summary(self, totals: Dict[str, Any], year: int, month: int) -> str:
+        """Форматировать сводку накладных по итогам месяца (get_invoices_totals)"""
+        if not totals["count"]:
             return f"❌ За {month}/{year} накладные не найдены"
         
-        total_sum = sum(invoice['Сумма продажи'] for invoice in invoices)
         return (
             f"📦 <b>Накладные за {month}/{year}</b>\n\n"
-            f"📊 Найдено: {len(invoices)} накладных\n"
-            f"💰 Общая сумма: {self.format_currency(total_sum)}\n\n"
+            f"📊 Найдено: {totals['count']} накладных\n"
+            f"💰 Общая сумма: {self.format_currency(totals['total'])}\n\n"
             f"Выберите накладную для детального просмотра:"
         )
     
@@ -179,27 +285,77 @@ class AdminService(BaseService):
         header += "\n(подробности — в Excel)"
         return header
     
+    def format_cache_stats(self) -> str:
+        """Форматировать статистику кэша по семействам ключей"""
+        totals = cache_service.stats()
+        users = user_cache.stats()
+        families = {**cache_service.family_stats(), **user_cache.family_stats()}
+        header = (
+            f"🗄 <b>Кэш</b>\n"
+            f"Ключей: {totals['entries']} | Объём: {totals['bytes'] / 1024:,.0f} КБ\n"
+            f"Попаданий: {totals['hits']} (+{totals['negative_hits']} отриц.) | Промахов: {totals['misses']}\n"
+            f"Пользователи: {users['entries']} | Попаданий: {users['hits']} | Промахов: {users['misses']}\n"
+        )
+        if not families:
+            return header + "\nДанных пока нет"
+
+        rows = [f"{'Семейство':<20} {'hit%':>4} {'hit':>5} {'miss':>4} {'coal':>4} {'evic':>4} {'exp':>4} "
+                f"{'p95ms':>5} {'KB':>5}"]
+        for name, stats in families.items():
+            rows.append(
+                f"{name[:20]:<20} {stats.hit_ratio * 100:>3.0f}% {stats.hits + stats.negative_hits:>5} "
+                f"{stats.misses:>4} {stats.coalesced:>4} {stats.evictions:>4} {stats.expired:>4} "
+                f"{stats.getter_latency.quantile(0.95):>5.0f} {stats.bytes / 1024:>5.0f}"
+            )
+        return header + "\n<pre>" + "\n".join(rows) + "</pre>"
+
+    def format_db_pool_stats(self) -> str:
+        """Форматировать состояние и счётчики пулов соединений с БД (запись и чтение ERP)"""
+        engines = getattr(self.db, "engines", None) or {"write": self.db.kw["bind"]}
+        sections = []
+        for name, engine in engines.items():
+            status = pool_status(engine)
+            text = (
+                f"🔌 <b>Пул соединений БД ({name})</b>\n"
+                f"Размер: {status['size']} | Выдано: {status['checked_out']} | Свободно: {status['idle']} | "
+                f"Overflow: {status['overflow']}\n"
+            )
+            if "checkouts" in status:
+                text += (
+                    f"Выдач: {status['checkouts']} (сверх pool_size: {status['overflow_checkouts']}) | "
+                    f"Таймаутов: {status['timeouts']}\n"
+                    f"Пик выдано: {status['peak_checked_out']} | Пик overflow: {status['peak_overflow']}\n"
+                    f"Ожидание, мс: avg {status['acquire_avg_ms']:.1f} | p95 {status['acquire_p95_ms']:.0f} | "
+                    f"max {status['acquire_max_ms']:.0f}"
+                )
+            sections.append(text)
+        return "\n\n".join(sections)
+
     async def clear_cache(self) -> None:
         """Очистить кэш"""
         await cache_service.clear()
+        await user_cache.clear()
         logger.info("Cache cleared")
     
     async def invalidate_invoice_cache(self, year: int = None, month: int = None) -> None:
         """Инвалидировать кэш накладных"""
         if year and month:
-            key = cache_service._generate_key("invoices", year=year, month=month)
-            await cache_service.delete(key)
+            removed = await cache_service.invalidate_tags(period_tag(year, month))
         else:
             # Удаляем все ключи, связанные с накладными
-            keys_to_delete = []
-            for key in cache_service._cache.keys():
-                if key.startswith("invoices_"):
-                    keys_to_delete.append(key)
-            
-            for key in keys_to_delete:
-                await cache_service.delete(key)
-        
-        logger.info(f"Invoice cache invalidated for year={year}, month={month}")
+            removed = await cache_service.invalidate_tags("invoices")
+
+        logger.info(f"Invoice cache invalidated for year={year}, month={month}: {removed} keys")
+
+    async def invalidate_document_cache(self, sales_id: int) -> None:
+        """Инвалидировать кэш, содержащий документ продажи (детали и списки накладных)"""
+        removed = await cache_service.invalidate_tags(sales_tag(sales_id))
+        logger.info(f"Document cache invalidated for sales_id={sales_id}: {removed} keys")
+
+    async def invalidate_customer_cache(self, phone: str) -> None:
+        """Инвалидировать кэш покупателя (акты сверки, накладные, название)"""
+        removed = await cache_service.invalidate_tags(phone_tag(phone))
+        logger.info(f"Customer cache invalidated for phone={phone}: {removed} keys")
 
     def filter_reconciliation_data_by_period(self, summary: list, year: int, month: int) -> list:
         """Фильтрует данные акта сверки по году и месяцу"""
@@ -1,13 +1,20 @@
 from typing import Any, Dict, List, Optional
 from loguru import logger
-from tgbot.services.cache_service import cache_service
+from tgbot.constants import CACHE_TTL, CACHE_WARMUP
+from tgbot.services.cache_service import cache_service, CacheTags
+from tgbot.services.db_sessions import read_sessions
+from tgbot.services.phone_directory import phone_directory
 
 
 class BaseService:
     """Базовый сервис с общей функциональностью"""
     
-    def __init__(self, db_session):
+    def __init__(self, db_session, refresh_cache: bool = False):
         self.db = db_session
+        # Запросы к ERP идут через отдельный пул чтения (реплику, если настроена)
+        self.read_db = read_sessions(db_session)
+        # Прогрев: обновлять ключи, которых нет в кэше (L1 и L2) или которые скоро истекут
+        self.refresh_cache = refresh_cache
     
     async def safe_execute(self, operation_name: str, operation_func, *args, **kwargs) -> Optional[Any]:
         """Безопасное выполнение операций с обработкой ошибок"""
@@ -17,6 +24,22 @@ class BaseService:
             logger.error(f"Error in {operation_name}: {e}")
             raise
     
+    async def memoized(self, key, getter):
+        """Результат getter, общий для всех сервисов апдейта, если сервис создан из UnitOfWork"""
+        memo = getattr(self.db, "memo", None)
+        return await memo(key, getter) if memo else await getter()
+    
+    def forget(self, *keys) -> None:
+        """Забыть запомненные в апдейте результаты"""
+        forget = getattr(self.db, "forget", None)
+        if forget:
+            forget(*keys)
+    
+    async def query_by_phone(self, query, phone: str, *args):
+        """Выполнить запрос к ERP по id покупателей, найденным по номеру телефона"""
+        customer_ids = await phone_directory.customer_ids(self.read_db, phone)
+        return await query(self.read_db, customer_ids, *args)
+    
     def format_currency(self, amount: float) -> str:
         """Форматирование валюты"""
         return f"{amount:,.0f} сум"
@@ -33,6 +56,32 @@ class BaseService:
             return text
         return text[:max_length-3] + "..."
     
-    async def get_cached_data(self, cache_key: str, getter_func, ttl_seconds: int = 300):
-        """Получение данных с кэшированием"""
-        return await cache_service.get_or_set(cache_key, getter_func, ttl_seconds) 
\ No newline at end of file
+    async def get_cached_data(self, cache_key: str, getter_func, ttl_seconds: int = 300, stale_ttl: int = 0,
+                              tags: CacheTags = None, negative_ttl: int = CACHE_TTL["NEGATIVE"],
+                              compact: bool = False):
+        """Получение данных с кэшированием
+
+        stale_ttl > 0 включает stale-while-revalidate, compact=True хранит
+        список строк по столбцам (CompactRows)
+        """
+        if self.refresh_cache:
+            return await cache_service.warm(
+                cache_key, getter_func, ttl_seconds, stale_ttl=stale_ttl, tags=tags, negative_ttl=negative_ttl,
+                compact=compact, min_ttl=self._warm_min_ttl(ttl_seconds)
+            )
+        return await cache_service.get_or_set(
+            cache_key, getter_func, ttl_seconds, stale_ttl=stale_ttl, tags=tags, negative_ttl=negative_ttl,
+            compact=compact
+        )
+
+    async def get_cached_value(self, cache_key: str, ttl_seconds: int = 300) -> Optional[Any]:
+        """Значение из кэша без загрузки (при прогреве - только с запасом TTL)"""
+        if self.refresh_cache:
+            return await cache_service.get_fresh(cache_key, self._warm_min_ttl(ttl_seconds))
+        return await cache_service.get(cache_key)
+
+    @staticmethod
+    def _warm_min_ttl(ttl_seconds: int) -> float:
+        """Остаток TTL, при котором прогрев обновляет ключ (не больше половины TTL,
+        иначе короткоживущие ключи обновлялись бы при каждом прогреве)"""
+        return min(CACHE_WARMUP["MIN_TTL_LEFT"], ttl_seconds / 2) 
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""Бэкенды второго уровня (L2) для CacheService.
+
+L1 - словарь внутри процесса (сам CacheService), L2 - общее хранилище,
+доступное всем репликам бота. Через L2 также рассылаются инвалидации,
+чтобы L1 каждой реплики оставался согласованным.
+"""
+
+import asyncio
+import pickle
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from tgbot.constants import CACHE_BACKEND
+
+MessageHandler = Callable[[bytes], Awaitable[None]]
+ReconnectHandler = Callable[[], Awaitable[None]]
+
+
+class CacheBackend(ABC):
+    """Интерфейс бэкенда L2"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Tuple[Any, Tuple[str, ...], float]]:
+        """Получить (значение, теги, оставшийся TTL в секундах) или None"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl_seconds: float, tags: Iterable[str] = ()) -> None:
+        """Сохранить значение с TTL и тегами"""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """Удалить ключи"""
+
+    @abstractmethod
+    async def invalidate_tags(self, *tags: str) -> int:
+        """Удалить ключи, помеченные тегами; вернуть количество удалённых"""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Удалить все ключи бэкенда"""
+
+    @abstractmethod
+    async def publish(self, message: bytes) -> None:
+        """Разослать сообщение об инвалидации всем репликам"""
+
+    @abstractmethod
+    async def subscribe(self, handler: MessageHandler, on_reconnect: Optional[ReconnectHandler] = None) -> None:
+        """Подписаться на сообщения об инвалидации.
+
+        on_reconnect вызывается после восстановления подписки, оборванной
+        ошибкой соединения: сообщения, отправленные за время обрыва, потеряны.
+        """
+
+    async def close(self) -> None:
+        """Закрыть соединения"""
+
+
+class MemoryCacheServer:
+    """Общее in-memory хранилище, имитирующее Redis для нескольких бэкендов (реплик)"""
+
+    def __init__(self):
+        self.data: Dict[str, Tuple[bytes, float]] = {}
+        self.tags: Dict[str, Set[str]] = {}
+        self.subscribers: List[MessageHandler] = []
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-memory бэкенд L2 для локального запуска и проверки нескольких реплик в одном процессе"""
+
+    def __init__(self, server: Optional[MemoryCacheServer] = None):
+        self.server = server or MemoryCacheServer()
+        self._handler: Optional[MessageHandler] = None
+
+    async def get(self, key: str) -> Optional[Tuple[Any, Tuple[str, ...], float]]:
+        item = self.server.data.get(key)
+        if item is None:
+            return None
+        payload, expires_at = item
+        ttl_left = expires_at - time.monotonic()
+        if ttl_left <= 0:
+            del self.server.data[key]
+            return None
+        value, tags = pickle.loads(payload)
+        return value, tags, ttl_left
+
+    async def set(self, key: str, value: Any, ttl_seconds: float, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        self.server.data[key] = (pickle.dumps((value, tags)), time.monotonic() + ttl_seconds)
+        for tag in tags:
+            self.server.tags.setdefault(tag, set()).add(key)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.server.data.pop(key, None)
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        keys = set()
+        for tag in tags:
+            keys.update(self.server.tags.pop(tag, ()))
+        await self.delete(*keys)
+        return len(keys)
+
+    async def clear(self) -> None:
+        self.server.data.clear()
+        self.server.tags.clear()
+
+    async def publish(self, message: bytes) -> None:
+        for handler in list(self.server.subscribers):
+            await handler(message)
+
+    async def subscribe(self, handler: MessageHandler, on_reconnect: Optional[ReconnectHandler] = None) -> None:
+        # Доставка в памяти не обрывается, on_reconnect не нужен
+        self._handler = handler
+        self.server.subscribers.append(handler)
+
+    async def close(self) -> None:
+        if self._handler in self.server.subscribers:
+            self.server.subscribers.remove(self._handler)
+        self._handler = None
+
+
+class RedisCacheBackend(CacheBackend):
+    """Бэкенд L2 поверх Redis (redis.asyncio).
+
+    Значения сериализуются pickle вместе с тегами; для каждого тега хранится
+    множество ключей, инвалидации рассылаются через pub/sub.
+    """
+
+    def __init__(self, url: str, prefix: str = "tgbot:cache:", channel: str = "tgbot:cache:invalidate"):
+        from redis import asyncio as aioredis
+
+        self._redis = aioredis.from_url(url)
+        self.prefix = prefix
+        self.channel = channel
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    async def get(self, key: str) -> Optional[Tuple[Any, Tuple[str, ...], float]]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            payload, ttl_ms = await pipe.get(self._key(key)).pttl(self._key(key)).execute()
+        if payload is None or ttl_ms is None or ttl_ms <= 0:
+            return None
+        value, tags = pickle.loads(payload)
+        return value, tags, ttl_ms / 1000
+
+    async def set(self, key: str, value: Any, ttl_seconds: float, tags: Iterable[str] = ()) -> None:
+        tags = tuple(tags)
+        ttl_ms = max(int(ttl_seconds * 1000), 1)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._key(key), pickle.dumps((value, tags)), px=ttl_ms)
+            for tag in tags:
+                pipe.sadd(self._tag_key(tag), key)
+                # Множество тега живёт не меньше самого долгого из его ключей (Redis >= 7.0)
+                pipe.pexpire(self._tag_key(tag), ttl_ms, nx=True)
+                pipe.pexpire(self._tag_key(tag), ttl_ms, gt=True)
+            await pipe.execute()
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self._redis.delete(*(self._key(key) for key in keys))
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        keys = set()
+        for tag in tags:
+            members = await self._redis.smembers(self._tag_key(tag))
+            keys.update(member.decode() if isinstance(member, bytes) else member for member in members)
+        await self.delete(*keys)
+        if tags:
+            await self._redis.delete(*(self._tag_key(tag) for tag in tags))
+        return len(keys)
+
+    async def clear(self) -> None:
+        keys = [key async for key in self._redis.scan_iter(match=f"{self.prefix}*")]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def publish(self, message: bytes) -> None:
+        await self._redis.publish(self.channel, message)
+
+    async def subscribe(self, handler: MessageHandler, on_reconnect: Optional[ReconnectHandler] = None) -> None:
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(handler, on_reconnect))
+
+    async def _listen(self, handler: MessageHandler, on_reconnect: Optional[ReconnectHandler]) -> None:
+        """Читать канал инвалидаций; при обрыве переподписываться с нарастающей паузой"""
+        delay = CACHE_BACKEND["RECONNECT_MIN_DELAY"]
+        while True:
+            try:
+                if self._pubsub is None:
+                    self._pubsub = self._redis.pubsub()
+                    await self._pubsub.subscribe(self.channel)
+                    logger.info(f"Cache invalidation channel {self.channel} resubscribed")
+                    delay = CACHE_BACKEND["RECONNECT_MIN_DELAY"]
+                    if on_reconnect is not None:
+                        try:
+                            await on_reconnect()
+                        except Exception as e:
+                            logger.error(f"Error handling cache invalidation reconnect: {e}")
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        await handler(message["data"])
+                    except Exception as e:
+                        logger.error(f"Error handling cache invalidation message: {e}")
+                error = "subscription closed"
+            except Exception as e:
+                error = e
+            logger.warning(f"Cache invalidation channel {self.channel} lost: {error}; resubscribing in {delay}s")
+            await self._drop_pubsub()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, CACHE_BACKEND["RECONNECT_MAX_DELAY"])
+
+    async def _drop_pubsub(self) -> None:
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is None:
+            return
+        try:
+            await pubsub.aclose()
+        except Exception as e:
+            logger.debug(f"Error closing cache invalidation subscription: {e}")
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self._drop_pubsub()
+        await self._redis.aclose()
@@ -0,0 +1,81 @@
+from collections.abc import Sequence
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Общие схемы (кортежи имён столбцов), чтобы записи кэша не хранили свои копии
+_SCHEMAS: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def _intern_schema(columns: Tuple[str, ...]) -> Tuple[str, ...]:
+    return _SCHEMAS.setdefault(columns, columns)
+
+
+class CompactRows(Sequence):
+    """Результат запроса, хранящийся по столбцам с общей схемой.
+
+    Вместо списка словарей, в каждом из которых повторяются ключи вроде
+    'Сумма продажи', хранится один кортеж имён столбцов и по кортежу значений
+    на столбец. Для кода, ожидающего список словарей, строки
+    материализуются лениво: при индексации, срезе или итерации.
+    """
+
+    __slots__ = ("columns", "_data", "_length")
+
+    def __init__(self, columns: Tuple[str, ...], data: Tuple[tuple, ...], length: int):
+        self.columns = _intern_schema(columns)
+        self._data = data
+        self._length = length
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]):
+        """Упаковать список словарей с одинаковыми ключами; иначе вернуть rows как есть"""
+        if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+            return rows
+        columns = tuple(rows[0].keys())
+        if any(len(row) != len(columns) or tuple(row.keys()) != columns for row in rows):
+            return rows
+        data = tuple(zip(*(tuple(row.values()) for row in rows)))
+        return cls(columns, data, len(rows))
+
+    def _row(self, index: int) -> Dict[str, Any]:
+        return dict(zip(self.columns, (column[index] for column in self._data)))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("CompactRows index out of range")
+        return self._row(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self._length):
+            yield self._row(i)
+
+    def column(self, name: str) -> tuple:
+        """Значения одного столбца без материализации строк"""
+        return self._data[self.columns.index(name)]
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Материализовать все строки в список словарей"""
+        return list(self)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CompactRows):
+            return self.columns == other.columns and self._data == other._data
+        if isinstance(other, list):
+            return self.to_list() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"<CompactRows {self._length} rows x {len(self.columns)} columns>"
+
+    def __getstate__(self):
+        return self.columns, self._data, self._length
+
+    def __setstate__(self, state):
+        columns, self._data, self._length = state
+        self.columns = _intern_schema(columns)
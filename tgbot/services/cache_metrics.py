@@ -0,0 +1,73 @@
+import bisect
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+# Границы корзин гистограммы задержки getter-ов (в миллисекундах)
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def family_of(key: str) -> str:
+    """Семейство ключа кэша - префикс до первой части с цифрами.
+
+    admin_invoices_2024_12 -> admin_invoices,
+    user_reconciliation_998901234567_2024_12 -> user_reconciliation,
+    customer_name_998901234567 -> customer_name
+    """
+    parts = []
+    for part in key.split("_"):
+        if any(ch.isdigit() for ch in part) or part.startswith("+"):
+            break
+        parts.append(part)
+    return "_".join(parts) or key
+
+
+@dataclass
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами"""
+    counts: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    total: int = 0
+    sum_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.total += 1
+        self.sum_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    @property
+    def avg_ms(self) -> float:
+        return self.sum_ms / self.total if self.total else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Приблизительный квантиль - верхняя граница корзины"""
+        if not self.total:
+            return 0.0
+        threshold = q * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+@dataclass
+class FamilyStats:
+    """Счётчики кэша для одного семейства ключей"""
+    hits: int = 0
+    negative_hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+    expired: int = 0
+    getter_errors: int = 0
+    entries: int = 0
+    bytes: int = 0
+    getter_latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
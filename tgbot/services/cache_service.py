@@ -1,94 +1,646 @@
 import asyncio
-from typing import Any, Optional, Dict, List
-from datetime import datetime, timedelta
+import json
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 from loguru import logger
 
+from tgbot.constants import CACHE_LIMITS, CACHE_TTL, USER_CACHE
+from tgbot.services.cache_backends import CacheBackend
+from tgbot.services.cache_compact import CompactRows
+from tgbot.services.cache_metrics import FamilyStats, family_of
+from tgbot.services.phone_directory import normalize_phone
+
+
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """Приблизительный размер объекта в байтах (с учётом вложенных контейнеров)"""
+    if _seen is None:
+        _seen = set()
+    obj_id = id(value)
+    if obj_id in _seen:
+        return 0
+    _seen.add(obj_id)
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k, _seen) + estimate_size(v, _seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item, _seen)
+    elif hasattr(value, '__dict__'):
+        size += estimate_size(vars(value), _seen)
+    elif hasattr(value, '__slots__'):
+        for slot in value.__slots__:
+            size += estimate_size(getattr(value, slot, None), _seen)
+    return size
+
+
+def _compacting(getter_func):
+    """Обернуть getter так, чтобы список словарей возвращался как CompactRows"""
+    async def _getter():
+        return CompactRows.from_rows(await getter_func())
+    return _getter
+
+
+def period_tag(year: int, month: int) -> str:
+    """Тег периода (год и месяц)"""
+    return f"period:{int(year)}-{int(month):02d}"
+
+
+def phone_tag(phone: str) -> str:
+    """Тег покупателя по номеру телефона.
+
+    Номер нормализуется (998XXXXXXXXX): ключи пользователя строятся по номеру
+    из Telegram, ключи админа - по cstm_phone из ERP, и форматы могут различаться
+    """
+    return f"phone:{normalize_phone(phone) or phone}"
+
+
+def sales_tag(sales_id: int) -> str:
+    """Тег документа продажи"""
+    return f"sales:{int(sales_id)}"
+
+
+# Теги можно передать списком или функцией, вычисляющей их по сохраняемому значению
+CacheTags = Union[Iterable[str], Callable[[Any], Iterable[str]], None]
+
+
+class _NegativeResult:
+    """Маркер закэшированного отсутствия результата (getter вернул None)"""
+
+    def __repr__(self) -> str:
+        return "NEGATIVE"
+
+    def __reduce__(self):
+        # При распаковке из L2 восстанавливается тот же единственный экземпляр
+        return "NEGATIVE"
+
+
+NEGATIVE = _NegativeResult()
+_MISSING = object()
+
+# Операции L2 над значениями (без рассылки инвалидаций)
+_VALUE_OPERATIONS = frozenset({"get", "set", "delete", "invalidate_tags", "clear"})
+
+
+class _LoadCancelled(Exception):
+    """Запрос, результат которого ждали, отменён - ожидающие повторяют обращение к кэшу"""
+
+
+@dataclass
+class CacheEntry:
+    """Элемент кэша"""
+    value: Any
+    expires_at: float
+    size: int
+    stale_until: float = 0.0
+    tags: Tuple[str, ...] = ()
+
+    def is_expired(self, now: float) -> bool:
+        return now >= self.expires_at
+
+    def is_stale_expired(self, now: float) -> bool:
+        """Истекло ли окно, в течение которого допускается отдавать устаревшее значение"""
+        return now >= max(self.expires_at, self.stale_until)
+
 
 class CacheService:
-    """Сервис кэширования для оптимизации производительности"""
-    
-    def __init__(self):
-        self._cache: Dict[str, Dict[str, Any]] = {}
-        self._lock = asyncio.Lock()
-    
+    """Сервис кэширования для оптимизации производительности.
+
+    Ключи хранятся в порядке последнего обращения (LRU). При превышении
+    лимита по количеству ключей или по приблизительному объёму вытесняются
+    самые давно использованные. Просроченные ключи удаляются фоновой задачей.
+
+    Попадание в кэш не ожидает блокировок: все операции над словарём
+    выполняются без переключения корутин. Записи сериализуются
+    блокировками по шардам ключей.
+
+    Опционально подключается общий бэкенд L2 (например, Redis): промахи L1
+    сначала проверяются в L2, записи дублируются в L2, а удаления и
+    инвалидации по тегам рассылаются остальным репликам.
+    При share_values=False значения в L2 не пишутся и не читаются, через
+    бэкенд идут только инвалидации.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_LIMITS["MAX_ENTRIES"],
+        max_bytes: int = CACHE_LIMITS["MAX_BYTES"],
+        sweep_interval: float = CACHE_LIMITS["SWEEP_INTERVAL"],
+        shards: int = CACHE_LIMITS["LOCK_SHARDS"],
+        backend: Optional[CacheBackend] = None,
+        share_values: bool = True,
+    ):
+        self._cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # Индекс тег -> ключи для инвалидации без перебора всего кэша
+        self._tag_index: Dict[str, Set[str]] = {}
+        # Чтение не берёт блокировок; записи сериализуются по шардам ключей
+        self._shard_locks = [asyncio.Lock() for _ in range(shards)]
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._total_bytes = 0
+        # Метрики по семействам ключей (admin_invoices, user_reconciliation, ...)
+        self._families: Dict[str, FamilyStats] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refresh_tasks: set = set()
+        self._sweeper_task: Optional[asyncio.Task] = None
+        self._backend = backend
+        self.share_values = share_values
+        self._instance_id = uuid.uuid4().hex
+
+    def _family(self, key: str) -> FamilyStats:
+        """Метрики семейства, к которому относится ключ"""
+        family = family_of(key)
+        stats = self._families.get(family)
+        if stats is None:
+            stats = self._families[family] = FamilyStats()
+        return stats
+
+    @staticmethod
+    def _now() -> float:
+        return time.monotonic()
+
+    def _lock_for(self, key: str) -> asyncio.Lock:
+        """Блокировка шарда, которому принадлежит ключ"""
+        return self._shard_locks[hash(key) % len(self._shard_locks)]
+
+    def get_nowait(self, key: str) -> Optional[Any]:
+        """Получить значение из кэша без ожидания (без блокировок)"""
+        value = self._lookup(key)
+        if value is _MISSING:
+            self._family(key).misses += 1
+            return None
+        return self._hit(key, value)
+
+    def _lookup(self, key: str) -> Any:
+        """Актуальное значение ключа (в т.ч. NEGATIVE) или _MISSING"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return _MISSING
+        now = self._now()
+        if entry.is_expired(now):
+            # Удаляем просроченный кэш, если он не нужен для stale-while-revalidate
+            if entry.is_stale_expired(now):
+                self._remove(key)
+                self._family(key).expired += 1
+            return _MISSING
+        self._cache.move_to_end(key)
+        return entry.value
+
     async def get(self, key: str) -> Optional[Any]:
         """Получить значение из кэша"""
-        async with self._lock:
-            if key in self._cache:
-                cache_item = self._cache[key]
-                if datetime.now() < cache_item['expires_at']:
-                    return cache_item['value']
-                else:
-                    # Удаляем просроченный кэш
-                    del self._cache[key]
-            return None
-    
-    async def set(self, key: str, value: Any, ttl_seconds: int = 300) -> None:
-        """Установить значение в кэш с TTL"""
-        async with self._lock:
-            self._cache[key] = {
-                'value': value,
-                'expires_at': datetime.now() + timedelta(seconds=ttl_seconds)
-            }
-    
+        return self.get_nowait(key)
+
+    async def set(
+        self, key: str, value: Any, ttl_seconds: int = 300, stale_ttl: int = 0, tags: CacheTags = None
+    ) -> None:
+        """Установить значение в кэш с TTL.
+
+        stale_ttl - окно после истечения TTL, в течение которого get_or_set
+        может отдать устаревшее значение, обновляя его в фоне.
+        tags - теги для инвалидации через invalidate_tags.
+        """
+        if callable(tags):
+            tags = tags(None if value is NEGATIVE else value)
+        tags = tuple(dict.fromkeys(tags or ()))
+        # Блокировка шарда сохраняет порядок записей одного ключа в L1 и L2
+        async with self._lock_for(key):
+            if self._set_local(key, value, ttl_seconds, stale_ttl, tags):
+                await self._call_backend("set", key, value, ttl_seconds, tags)
+            else:
+                # Слишком большое значение не кэшируется нигде, прежнее удаляется и из L2
+                await self._call_backend("delete", key)
+
+    def _set_local(self, key: str, value: Any, ttl_seconds: float, stale_ttl: int, tags: Tuple[str, ...]) -> bool:
+        """Сохранить значение только в L1; False, если значение слишком большое"""
+        # Прежнее значение удаляется в любом случае, чтобы не отдавать устаревшие данные
+        self._remove(key)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.warning(f"Cache value for key {key} is too large ({size} bytes), skipped")
+            return False
+        expires_at = self._now() + ttl_seconds
+        self._cache[key] = CacheEntry(
+            value=value, expires_at=expires_at, size=size, stale_until=expires_at + stale_ttl, tags=tags
+        )
+        self._total_bytes += size
+        family = self._family(key)
+        family.entries += 1
+        family.bytes += size
+        for tag in tags:
+            self._tag_index.setdefault(tag, set()).add(key)
+        self._evict()
+        return True
+
     async def delete(self, key: str) -> None:
         """Удалить значение из кэша"""
-        async with self._lock:
-            if key in self._cache:
-                del self._cache[key]
-    
+        async with self._lock_for(key):
+            self._remove(key)
+            await self._call_backend("delete", key)
+        await self._broadcast(keys=[key])
+
     async def clear(self) -> None:
         """Очистить весь кэш"""
-        async with self._lock:
-            self._cache.clear()
-    
-    async def get_or_set(self, key: str, getter_func, ttl_seconds: int = 300) -> Any:
-        """Получить из кэша или установить новое значение"""
-        cached_value = await self.get(key)
-        if cached_value is not None:
-            return cached_value
-        
-        # Получаем новое значение
+        self._clear_local()
+        await self._call_backend("clear")
+        await self._broadcast(clear=True)
+
+    def _clear_local(self) -> None:
+        self._cache.clear()
+        self._tag_index.clear()
+        self._total_bytes = 0
+        for family in self._families.values():
+            family.entries = 0
+            family.bytes = 0
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        """Удалить все ключи, помеченные любым из тегов"""
+        removed = self._invalidate_local_tags(tags)
+        removed = max(removed, await self._call_backend("invalidate_tags", *tags) or 0)
+        await self._broadcast(tags=list(tags))
+        if removed:
+            logger.debug(f"Cache invalidated {removed} keys by tags {tags}")
+        return removed
+
+    def _invalidate_local_tags(self, tags: Iterable[str]) -> int:
+        keys = set()
+        for tag in tags:
+            keys.update(self._tag_index.get(tag, ()))
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    async def set_backend(self, backend: CacheBackend) -> None:
+        """Подключить бэкенд L2 и подписаться на инвалидации других реплик"""
+        self._backend = backend
+        await backend.subscribe(self._on_invalidation, self._on_reconnect)
+
+    async def _call_backend(self, operation: str, *args) -> Any:
+        """Вызвать операцию L2; при недоступности L2 кэш продолжает работать только с L1"""
+        if self._backend is None or (not self.share_values and operation in _VALUE_OPERATIONS):
+            return None
+        try:
+            return await getattr(self._backend, operation)(*args)
+        except Exception as e:
+            logger.warning(f"Cache backend {operation} failed: {e}")
+            return None
+
+    async def _broadcast(self, keys: Iterable[str] = (), tags: Iterable[str] = (), clear: bool = False) -> None:
+        """Разослать инвалидацию остальным репликам"""
+        if self._backend is None:
+            return
+        message = json.dumps({
+            "origin": self._instance_id,
+            "keys": list(keys),
+            "tags": list(tags),
+            "clear": clear,
+        })
+        await self._call_backend("publish", message.encode())
+
+    async def _on_invalidation(self, message: bytes) -> None:
+        """Применить инвалидацию, полученную от другой реплики, к L1"""
+        data = json.loads(message)
+        if data.get("origin") == self._instance_id:
+            return
+        if data.get("clear"):
+            self._clear_local()
+            return
+        for key in data.get("keys", ()):
+            self._remove(key)
+        self._invalidate_local_tags(data.get("tags", ()))
+
+    async def _on_reconnect(self) -> None:
+        """Подписка на инвалидации восстановлена после обрыва: пропущенные инвалидации неизвестны, L1 сбрасывается"""
+        self._clear_local()
+        logger.warning("Cache invalidation channel reconnected, L1 cleared")
+
+    async def get_or_set(
+        self, key: str, getter_func, ttl_seconds: int = 300, stale_ttl: int = 0, tags: CacheTags = None,
+        negative_ttl: int = CACHE_TTL["NEGATIVE"], compact: bool = False
+    ) -> Any:
+        """Получить из кэша или установить новое значение.
+
+        Параллельные промахи по одному ключу объединяются: getter_func
+        выполняется один раз, остальные вызовы ждут его результат (или ошибку).
+        Если stale_ttl > 0, в течение stale_ttl секунд после истечения TTL
+        сразу возвращается устаревшее значение, а обновление идёт в фоне.
+        Результат None кэшируется как NEGATIVE на negative_ttl секунд
+        (0 - не кэшировать). При compact=True список словарей хранится
+        по столбцам (CompactRows) и возвращается в этом виде.
+        """
+        if compact:
+            getter_func = _compacting(getter_func)
+        value = self._lookup(key)
+        if value is not _MISSING:
+            return self._hit(key, value)
+
+        if stale_ttl:
+            value = self._get_stale(key)
+            if value is not _MISSING:
+                self._family(key).stale_hits += 1
+                self._schedule_refresh(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl)
+                return self._hit(key, value)
+
+        self._family(key).misses += 1
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._family(key).coalesced += 1
+            return await self._join(
+                inflight, lambda: self.get_or_set(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl)
+            )
+
+        return await self._load(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl)
+
+    async def refresh(
+        self, key: str, getter_func, ttl_seconds: int = 300, stale_ttl: int = 0, tags: CacheTags = None,
+        negative_ttl: int = CACHE_TTL["NEGATIVE"], compact: bool = False
+    ) -> Any:
+        """Принудительно обновить значение ключа, не дожидаясь истечения TTL"""
+        if compact:
+            getter_func = _compacting(getter_func)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._family(key).coalesced += 1
+            return await self._join(
+                inflight, lambda: self.refresh(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl)
+            )
+        return await self._load(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl, read_shared=False)
+
+    async def warm(
+        self, key: str, getter_func, ttl_seconds: int = 300, stale_ttl: int = 0, tags: CacheTags = None,
+        negative_ttl: int = CACHE_TTL["NEGATIVE"], compact: bool = False, min_ttl: float = 0
+    ) -> Any:
+        """Прогреть ключ: выполнить getter_func, только если значения нет ни в L1, ни в L2
+        или до истечения его TTL осталось меньше min_ttl секунд.
+
+        Реплики прогревают одни и те же ключи, поэтому значение, уже
+        обновлённое другой репликой в L2, берётся оттуда без запроса к БД.
+        """
+        if compact:
+            getter_func = _compacting(getter_func)
+        value = await self._fresh(key, min_ttl)
+        if value is not _MISSING:
+            return None if value is NEGATIVE else value
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._family(key).coalesced += 1
+            return await self._join(
+                inflight,
+                lambda: self.warm(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl, min_ttl=min_ttl)
+            )
+        return await self._load(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl, read_shared=False)
+
+    async def get_fresh(self, key: str, min_ttl: float = 0) -> Optional[Any]:
+        """Значение из L1 или L2, если до истечения его TTL осталось не меньше min_ttl секунд"""
+        value = await self._fresh(key, min_ttl)
+        return None if value is _MISSING or value is NEGATIVE else value
+
+    async def _fresh(self, key: str, min_ttl: float) -> Any:
+        """Значение с запасом TTL не меньше min_ttl (в т.ч. NEGATIVE) или _MISSING; L2 копируется в L1"""
+        entry = self._cache.get(key)
+        if entry is not None and entry.expires_at - self._now() >= min_ttl:
+            return entry.value
+        shared = await self._call_backend("get", key)
+        if shared is None:
+            return _MISSING
+        value, shared_tags, ttl_left = shared
+        if ttl_left < min_ttl:
+            return _MISSING
+        self._set_local(key, value, ttl_left, 0, tuple(shared_tags))
+        return value
+
+    @staticmethod
+    async def _join(inflight: asyncio.Future, retry) -> Any:
+        """Дождаться выполняющегося запроса; если его отменили, повторить обращение через retry()"""
+        try:
+            return await asyncio.shield(inflight)
+        except _LoadCancelled:
+            return await retry()
+
+    def _hit(self, key: str, value: Any) -> Any:
+        """Учесть попадание и вернуть значение (None для отрицательного результата)"""
+        if value is NEGATIVE:
+            self._family(key).negative_hits += 1
+            return None
+        self._family(key).hits += 1
+        return value
+
+    def _register_inflight(self, key: str) -> asyncio.Future:
+        """Зарегистрировать выполняющийся запрос по ключу"""
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    async def _load(
+        self, key: str, getter_func, ttl_seconds: int, stale_ttl: int, tags: CacheTags = None,
+        negative_ttl: int = CACHE_TTL["NEGATIVE"], future: Optional[asyncio.Future] = None,
+        read_shared: bool = True
+    ) -> Any:
+        """Выполнить getter_func и сохранить результат, передав его всем ожидающим"""
+        if future is None:
+            future = self._register_inflight(key)
         try:
-            new_value = await getter_func()
-            await self.set(key, new_value, ttl_seconds)
+            # Сначала проверяем общий кэш L2
+            shared = await self._call_backend("get", key) if read_shared else None
+            if shared is not None:
+                value, shared_tags, ttl_left = shared
+                self._set_local(key, value, ttl_left, stale_ttl, tuple(shared_tags))
+                value = None if value is NEGATIVE else value
+                future.set_result(value)
+                return value
+
+            # Получаем новое значение
+            started = time.monotonic()
+            try:
+                new_value = await getter_func()
+            except Exception:
+                self._family(key).getter_errors += 1
+                raise
+            finally:
+                self._family(key).getter_latency.observe((time.monotonic() - started) * 1000)
+            if new_value is not None:
+                await self.set(key, new_value, ttl_seconds, stale_ttl, tags)
+            elif negative_ttl:
+                await self.set(key, NEGATIVE, negative_ttl, 0, tags)
+            future.set_result(new_value)
             return new_value
+        except asyncio.CancelledError:
+            # Отмена касается только этого вызова: ожидающие не отменяются,
+            # а повторяют запрос (первый из них выполнит getter_func)
+            future.set_exception(_LoadCancelled())
+            future.exception()
+            raise
         except Exception as e:
             logger.error(f"Error in get_or_set for key {key}: {e}")
+            future.set_exception(e)
+            # Помечаем исключение как полученное, даже если ожидающих нет
+            future.exception()
             raise
-    
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _get_stale(self, key: str) -> Any:
+        """Получить устаревшее значение, если оно ещё в окне stale-while-revalidate, иначе _MISSING"""
+        entry = self._cache.get(key)
+        if entry is None or entry.is_stale_expired(self._now()):
+            return _MISSING
+        self._cache.move_to_end(key)
+        return entry.value
+
+    def _schedule_refresh(
+        self, key: str, getter_func, ttl_seconds: int, stale_ttl: int, tags: CacheTags, negative_ttl: int
+    ) -> None:
+        """Запустить фоновое обновление ключа, если оно ещё не выполняется"""
+        if key in self._inflight:
+            return
+        # Регистрируем сразу, чтобы параллельные чтения не запустили второе обновление
+        future = self._register_inflight(key)
+
+        async def _refresh():
+            try:
+                await self._load(key, getter_func, ttl_seconds, stale_ttl, tags, negative_ttl, future)
+            except Exception:
+                # Ошибка уже залогирована в _load, устаревшее значение остаётся до конца окна
+                pass
+
+        task = asyncio.create_task(_refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def _remove(self, key: str) -> Optional[CacheEntry]:
+        """Удалить ключ из хранилища"""
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._forget(key, entry)
+        return entry
+
+    def _forget(self, key: str, entry: CacheEntry) -> None:
+        """Обновить учёт объёма и индекс тегов для удалённого ключа"""
+        self._total_bytes -= entry.size
+        family = self._family(key)
+        family.entries -= 1
+        family.bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+    def _evict(self) -> None:
+        """Вытеснить самые давно использованные ключи сверх лимитов"""
+        while self._cache and (len(self._cache) > self.max_entries or self._total_bytes > self.max_bytes):
+            key, entry = self._cache.popitem(last=False)
+            self._forget(key, entry)
+            self._family(key).evictions += 1
+            logger.debug(f"Cache evicted key {key}")
+
+    async def sweep_expired(self, batch_size: int = 500) -> int:
+        """Удалить все просроченные ключи.
+
+        Проход идёт пачками с передачей управления циклу событий, чтобы
+        большая очистка не задерживала обработку апдейтов.
+        """
+        removed = 0
+        keys = list(self._cache.keys())
+        for start in range(0, len(keys), batch_size):
+            now = self._now()
+            for key in keys[start:start + batch_size]:
+                entry = self._cache.get(key)
+                if entry is not None and entry.is_stale_expired(now):
+                    self._remove(key)
+                    self._family(key).expired += 1
+                    removed += 1
+            await asyncio.sleep(0)
+        if removed:
+            logger.debug(f"Cache sweep removed {removed} expired keys")
+        return removed
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep_expired()
+            except Exception as e:
+                logger.error(f"Error in cache sweep: {e}")
+
+    def start(self) -> None:
+        """Запустить фоновую очистку просроченных ключей"""
+        if self._sweeper_task is None or self._sweeper_task.done():
+            self._sweeper_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        """Остановить фоновую очистку и закрыть бэкенд L2"""
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            try:
+                await self._sweeper_task
+            except asyncio.CancelledError:
+                pass
+            self._sweeper_task = None
+        if self._backend is not None:
+            await self._call_backend("close")
+            self._backend = None
+
+    def stats(self) -> Dict[str, int]:
+        """Сводная статистика кэша"""
+        families = self._families.values()
+        return {
+            "entries": len(self._cache),
+            "bytes": self._total_bytes,
+            "hits": sum(f.hits for f in families),
+            "negative_hits": sum(f.negative_hits for f in families),
+            "misses": sum(f.misses for f in families),
+            "evictions": sum(f.evictions for f in families),
+            "expired": sum(f.expired for f in families),
+            "coalesced": sum(f.coalesced for f in families),
+            "stale_hits": sum(f.stale_hits for f in families),
+            "inflight": len(self._inflight),
+            "tags": len(self._tag_index),
+        }
+
+    def family_stats(self) -> Dict[str, FamilyStats]:
+        """Статистика по семействам ключей"""
+        return dict(sorted(self._families.items()))
+
     def _generate_key(self, prefix: str, **kwargs) -> str:
         """Генерировать ключ кэша"""
         key_parts = [prefix]
         for k, v in sorted(kwargs.items()):
             key_parts.append(f"{k}:{v}")
         return "_".join(key_parts)
-    
+
     async def cache_invoices_by_period(self, year: int, month: int, getter_func) -> List[Dict[str, Any]]:
         """Кэшировать накладные за период"""
         key = self._generate_key("invoices", year=year, month=month)
         return await self.get_or_set(key, getter_func, ttl_seconds=600)  # 10 минут
-    
+
     async def cache_invoice_details(self, sales_id: int, getter_func) -> Optional[List[Dict[str, Any]]]:
         """Кэшировать детали накладной"""
         key = self._generate_key("invoice_details", sales_id=sales_id)
         return await self.get_or_set(key, getter_func, ttl_seconds=300)  # 5 минут
-    
+
     async def cache_reconciliation_data(self, phone: str, year: int, month: int, getter_func) -> List[Dict[str, Any]]:
         """Кэшировать данные акта сверки"""
         key = self._generate_key("reconciliation", phone=phone, year=year, month=month)
         return await self.get_or_set(key, getter_func, ttl_seconds=600)  # 10 минут
-    
+
     async def cache_sales_years(self, getter_func) -> List[int]:
         """Кэшировать список годов"""
         key = self._generate_key("sales_years")
         return await self.get_or_set(key, getter_func, ttl_seconds=3600)  # 1 час
-    
+
     async def cache_sales_months(self, year: int, getter_func) -> List[int]:
         """Кэшировать список месяцев за год"""
         key = self._generate_key("sales_months", year=year)
         return await self.get_or_set(key, getter_func, ttl_seconds=3600)  # 1 час
-    
+
     async def cache_customers_by_period(self, year: int, month: int, getter_func) -> List[Dict[str, Any]]:
         """Кэшировать список покупателей за период"""
         key = self._generate_key("customers", year=year, month=month)
@@ -96,4 +648,10 @@ class CacheService:
 
 
 # Глобальный экземпляр кэша
-cache_service = CacheService() 
\ No newline at end of file
+cache_service = CacheService()
+
+# Кэш пользователей бота (DbMiddleware): отдельный, чтобы всплески апдейтов
+# не вытесняли отчёты; только L1, через L2 рассылаются удаления
+user_cache = CacheService(
+    max_entries=USER_CACHE["MAX_ENTRIES"], max_bytes=USER_CACHE["MAX_BYTES"], share_values=False
+)
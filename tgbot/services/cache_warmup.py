@@ -0,0 +1,107 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from loguru import logger
+
+from tgbot.constants import CACHE_WARMUP
+from tgbot.services.admin_service import AdminService
+
+
+def current_and_previous_period(now: Optional[datetime] = None) -> List[Tuple[int, int]]:
+    """Текущий и предыдущий месяц в виде [(год, месяц), ...]"""
+    now = now or datetime.now()
+    if now.month == 1:
+        previous = (now.year - 1, 12)
+    else:
+        previous = (now.year, now.month - 1)
+    return [(now.year, now.month), previous]
+
+
+class CacheWarmer:
+    """Прогрев кэша данными текущего и предыдущего месяца.
+
+    Выполняется при старте бота и затем периодически, чтобы первый
+    администратор после деплоя или истечения TTL не ждал тяжёлые запросы к ERP.
+    Запрашиваются только ключи, которых нет в кэше (L1 и общем L2) или которые
+    истекут раньше чем через MIN_TTL_LEFT секунд, поэтому реплики не
+    повторяют прогрев друг за другом. Число одновременных запросов
+    ограничено, чтобы не перегружать БД.
+    """
+
+    def __init__(
+        self,
+        db_session,
+        interval: float = CACHE_WARMUP["INTERVAL"],
+        concurrency: int = CACHE_WARMUP["CONCURRENCY"],
+    ):
+        self.admin_service = AdminService(db_session, refresh_cache=True)
+        self.interval = interval
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+    def _jobs(self) -> List[Tuple[str, Callable[[], Awaitable]]]:
+        """Список задач прогрева: (название, корутина-функция)"""
+        jobs = [("sales_years", self.admin_service.get_sales_years)]
+        periods = current_and_previous_period()
+        for year in sorted({year for year, _ in periods}, reverse=True):
+            jobs.append((f"sales_months {year}", lambda year=year: self.admin_service.get_sales_months(year)))
+        for year, month in periods:
+            jobs.append((
+                f"invoices totals {month:02d}/{year}",
+                lambda year=year, month=month: self.admin_service.get_invoices_totals(year, month, allow_stale=True)
+            ))
+            jobs.append((
+                f"invoices first page {month:02d}/{year}",
+                lambda year=year, month=month: self._warm_first_page(year, month)
+            ))
+            jobs.append((
+                f"customers {month:02d}/{year}",
+                lambda year=year, month=month: self.admin_service.get_customers_by_period(year, month, allow_stale=True)
+            ))
+        return jobs
+
+    async def _warm_first_page(self, year: int, month: int) -> None:
+        """Первая страница накладных и детали её накладных (одним запросом)"""
+        invoices = await self.admin_service.get_invoices_page(year, month, allow_stale=True)
+        await self.admin_service.get_invoices_details([invoice['Код'] for invoice in invoices or ()])
+
+    async def _run_job(self, name: str, job: Callable[[], Awaitable]) -> bool:
+        async with self._semaphore:
+            try:
+                await job()
+                return True
+            except Exception as e:
+                logger.error(f"Cache warm-up failed for {name}: {e}")
+                return False
+
+    async def warm_up(self) -> int:
+        """Прогреть кэш; вернуть количество успешно выполненных задач"""
+        started = time.monotonic()
+        jobs = self._jobs()
+        results = await asyncio.gather(*(self._run_job(name, job) for name, job in jobs))
+        succeeded = sum(results)
+        elapsed = time.monotonic() - started
+        logger.info(f"Cache warm-up finished: {succeeded}/{len(jobs)} jobs in {elapsed:.1f}s")
+        return succeeded
+
+    async def _loop(self) -> None:
+        while True:
+            await self.warm_up()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Запустить прогрев при старте и по расписанию"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Остановить периодический прогрев"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,20 +1,21 @@
 import aiogram
-from typing import AsyncGenerator
 
 import aiomysql
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from tgbot.config import Config
 from tgbot.services.db_base import Base
+from tgbot.services.db_pool import InstrumentedQueuePool, prewarm_pool
+from tgbot.services.db_sessions import DbSessions
 import openpyxl
 from openpyxl.styles import Font, Alignment, Border, Side
 import tempfile
 import os
 
 
-async def create_db_session(config: Config) -> AsyncGenerator[AsyncSession, None]:
-    """Create DB session and handle database creation if needed"""
+async def create_db_session(config: Config) -> DbSessions:
+    """Create read and write session factories and handle database creation if needed"""
 
     # Database connection parameters
     auth_data = {
@@ -43,27 +44,49 @@ async def create_db_session(config: Config) -> AsyncGenerator[AsyncSession, None
         print(f"Database initialization error: {e}")
         raise
 
-    # Create async engine
-    engine = create_async_engine(
+    # Write engine: telegram_users and the bot's own tables
+    write_engine = create_engine(
         f"mysql+aiomysql://{auth_data['user']}:{auth_data['password']}@"
         f"{auth_data['host']}:{auth_data['port']}/{auth_data['database']}",
-        echo=False,
-        future=True,
-        pool_pre_ping=False
+        config, config.db.pool_size, config.db.max_overflow
+    )
+    # Read engine for ERP queries: the replica if configured, otherwise the same
+    # database through its own pool, so slow reports never take connections
+    # needed for user registration
+    read_engine = create_engine(
+        config.db.read_dsn or write_engine.url,
+        config, config.db.read_pool_size, config.db.read_max_overflow
     )
 
     # Create tables
-    async with engine.begin() as conn:
+    async with write_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-    # Create session factory
-    async_session = sessionmaker(
-        engine,
-        class_=AsyncSession,
-        expire_on_commit=False
+    # Open connections up front so the first updates don't wait for them
+    await prewarm_pool(write_engine, min(config.db.pool_prewarm, config.db.pool_size))
+    await prewarm_pool(read_engine, min(config.db.pool_prewarm, config.db.read_pool_size))
+
+    # Create session factories
+    return DbSessions(
+        write=sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False),
+        read=sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
     )
 
-    return async_session
+
+def create_engine(url, config: Config, pool_size: int, max_overflow: int) -> AsyncEngine:
+    """Create an async engine with an instrumented, configured pool"""
+    # pool_recycle меньше wait_timeout MySQL, иначе сервер закрывает простаивающие соединения
+    return create_async_engine(
+        url,
+        echo=False,
+        future=True,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=config.db.pool_recycle,
+        pool_pre_ping=config.db.pool_pre_ping,
+        pool_timeout=config.db.pool_timeout
+    )
 
 def generate_reconciliation_act_excel(summary, customer_name, period_str, company_name="AVTOLIDER"):
     wb = openpyxl.Workbook()
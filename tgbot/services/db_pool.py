@@ -0,0 +1,100 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+from loguru import logger
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from tgbot.services.cache_metrics import LatencyHistogram
+
+# Ожидание соединения дольше этого порога пишется в лог (мс)
+SLOW_ACQUIRE_MS = 500
+
+
+@dataclass
+class PoolStats:
+    """Счётчики пула соединений с БД"""
+    checkouts: int = 0
+    overflow_checkouts: int = 0  # выдачи, когда пул работал сверх pool_size
+    timeouts: int = 0
+    peak_checked_out: int = 0
+    peak_overflow: int = 0
+    acquire_latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, считающий время ожидания соединения и использование overflow"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning(f"DB pool exhausted: {self.status()}")
+            raise
+        waited_ms = (time.monotonic() - started) * 1000
+        stats = self.stats
+        stats.checkouts += 1
+        stats.acquire_latency.observe(waited_ms)
+        stats.peak_checked_out = max(stats.peak_checked_out, self.checkedout())
+        if self.overflow() > 0:
+            stats.overflow_checkouts += 1
+            stats.peak_overflow = max(stats.peak_overflow, self.overflow())
+        if waited_ms >= SLOW_ACQUIRE_MS:
+            logger.warning(f"Waited {waited_ms:.0f} ms for a DB connection: {self.status()}")
+        return record
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        # engine.dispose() пересоздаёт пул - счётчики сохраняются
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def pool_status(engine: AsyncEngine) -> Dict[str, Any]:
+    """Текущее состояние и счётчики пула движка"""
+    pool = engine.sync_engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update({
+            "checkouts": stats.checkouts,
+            "overflow_checkouts": stats.overflow_checkouts,
+            "timeouts": stats.timeouts,
+            "peak_checked_out": stats.peak_checked_out,
+            "peak_overflow": stats.peak_overflow,
+            "acquire_avg_ms": stats.acquire_latency.avg_ms,
+            "acquire_p95_ms": stats.acquire_latency.quantile(0.95),
+            "acquire_max_ms": stats.acquire_latency.max_ms,
+        })
+    return status
+
+
+async def prewarm_pool(engine: AsyncEngine, connections: int) -> int:
+    """Открыть connections соединений заранее, чтобы первые апдейты не ждали подключения к БД"""
+    if connections <= 0:
+        return 0
+    started = time.monotonic()
+    opened = await asyncio.gather(*(engine.connect().start() for _ in range(connections)), return_exceptions=True)
+    # Соединения возвращаются в пул и остаются открытыми
+    for connection in opened:
+        if not isinstance(connection, BaseException):
+            await connection.close()
+    errors = [connection for connection in opened if isinstance(connection, BaseException)]
+    if errors:
+        raise errors[0]
+    logger.info(f"DB pool pre-warmed: {connections} connections in {time.monotonic() - started:.2f}s")
+    return connections
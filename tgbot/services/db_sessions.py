@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+from typing import Dict
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+
+@dataclass(frozen=True)
+class DbSessions:
+    """Фабрики сессий: write - основная БД (telegram_users и таблицы бота),
+    read - отдельный пул для тяжёлых запросов к ERP (реплика, если настроена).
+
+    Вызов объекта возвращает сессию записи, поэтому код, принимающий
+    sessionmaker (async with db_session() as session), работает без изменений.
+    """
+    write: sessionmaker
+    read: sessionmaker
+
+    def __call__(self, **kwargs) -> AsyncSession:
+        return self.write(**kwargs)
+
+    @property
+    def engines(self) -> Dict[str, AsyncEngine]:
+        """Движки по назначению (один, если чтение и запись идут через один пул)"""
+        engines = {"write": self.write.kw["bind"]}
+        if self.read.kw["bind"] is not engines["write"]:
+            engines["read"] = self.read.kw["bind"]
+        return engines
+
+
+def read_sessions(db_session) -> sessionmaker:
+    """Фабрика сессий для запросов к ERP: пул чтения DbSessions или сама фабрика"""
+    return getattr(db_session, "read", db_session)
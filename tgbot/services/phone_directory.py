@@ -0,0 +1,154 @@
+import asyncio
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from tgbot.constants import PHONE_DIRECTORY
+
+_NON_DIGITS = re.compile(r"\D+")
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Привести номер к виду 998XXXXXXXXX; None, если цифр нет.
+
+    '+998 (90) 123-45-67' -> '998901234567', '901234567' -> '998901234567'
+    """
+    if not phone:
+        return None
+    digits = _NON_DIGITS.sub("", str(phone))
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == 9:
+        digits = PHONE_DIRECTORY["COUNTRY_CODE"] + digits
+    return digits or None
+
+
+class PhoneDirectory:
+    """Справочник: нормализованный телефон -> id покупателей из dir_customers.
+
+    Вместо сравнения телефона с четырьмя столбцами dir_customers в каждом
+    запросе телефон один раз переводится в список cstm_id, а запросы к ERP
+    фильтруют по индексированному s.sls_customer IN (...).
+
+    Справочник загружается при первом обращении и обновляется в фоне:
+    новые покупатели - инкрементально (cstm_id больше последнего загруженного),
+    изменённые телефоны - периодической полной перезагрузкой. При промахе
+    выполняется внеочередное инкрементальное обновление (не чаще
+    MISS_REFRESH_INTERVAL), чтобы только что заведённый покупатель находился сразу.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = PHONE_DIRECTORY["REFRESH_INTERVAL"],
+        full_refresh_interval: float = PHONE_DIRECTORY["FULL_REFRESH_INTERVAL"],
+        miss_refresh_interval: float = PHONE_DIRECTORY["MISS_REFRESH_INTERVAL"],
+    ):
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self._ids_by_phone: Dict[str, Tuple[int, ...]] = {}
+        self._last_id = 0
+        self._loaded = False
+        self._last_full_refresh = 0.0
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _index(rows: Iterable, target: Dict[str, Tuple[int, ...]]) -> int:
+        """Добавить строки (cstm_id, phone1..4) в индекс; вернуть максимальный cstm_id"""
+        last_id = 0
+        for customer_id, *phones in rows:
+            last_id = max(last_id, customer_id)
+            for phone in {normalize_phone(phone) for phone in phones} - {None}:
+                ids = target.get(phone, ())
+                if customer_id not in ids:
+                    target[phone] = tuple(sorted((*ids, customer_id)))
+        return last_id
+
+    async def _reload(self, db_session) -> int:
+        from tgbot.models.models import TGUser
+        rows = await TGUser.get_customer_phones(db_session)
+        ids_by_phone: Dict[str, Tuple[int, ...]] = {}
+        self._last_id = self._index(rows, ids_by_phone)
+        self._ids_by_phone = ids_by_phone
+        self._loaded = True
+        self._last_full_refresh = self._last_refresh = time.monotonic()
+        logger.info(f"Phone directory loaded: {len(ids_by_phone)} phones, {len(rows)} customers")
+        return len(ids_by_phone)
+
+    async def refresh(self, db_session) -> int:
+        """Полная перезагрузка справочника; вернуть количество телефонов"""
+        async with self._lock:
+            return await self._reload(db_session)
+
+    async def _ensure_loaded(self, db_session) -> None:
+        async with self._lock:
+            if not self._loaded:
+                await self._reload(db_session)
+
+    async def refresh_new(self, db_session) -> int:
+        """Догрузить покупателей, заведённых после последнего обновления"""
+        from tgbot.models.models import TGUser
+        await self._ensure_loaded(db_session)
+        async with self._lock:
+            rows = await TGUser.get_customer_phones(db_session, after_id=self._last_id)
+            if rows:
+                # Копия, чтобы читатели без блокировки не видели частично обновлённый словарь
+                ids_by_phone = dict(self._ids_by_phone)
+                self._last_id = max(self._last_id, self._index(rows, ids_by_phone))
+                self._ids_by_phone = ids_by_phone
+            self._last_refresh = time.monotonic()
+        if rows:
+            logger.debug(f"Phone directory: {len(rows)} new customers")
+        return len(rows)
+
+    async def customer_ids(self, db_session, phone: str) -> List[int]:
+        """id покупателей с указанным телефоном (пустой список, если не найдены)"""
+        normalized = normalize_phone(phone)
+        if normalized is None:
+            return []
+        if not self._loaded:
+            await self._ensure_loaded(db_session)
+        ids = self._ids_by_phone.get(normalized)
+        if ids is None and time.monotonic() - self._last_refresh >= self.miss_refresh_interval:
+            await self.refresh_new(db_session)
+            ids = self._ids_by_phone.get(normalized)
+        return list(ids or ())
+
+    async def _loop(self, db_session) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                if time.monotonic() - self._last_full_refresh >= self.full_refresh_interval:
+                    await self.refresh(db_session)
+                else:
+                    await self.refresh_new(db_session)
+            except Exception as e:
+                logger.error(f"Phone directory refresh failed: {e}")
+
+    async def start(self, db_session) -> None:
+        """Загрузить справочник и запустить фоновое обновление"""
+        try:
+            await self.refresh(db_session)
+        except Exception as e:
+            # Справочник загрузится при первом обращении
+            logger.error(f"Phone directory initial load failed: {e}")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(db_session))
+
+    async def stop(self) -> None:
+        """Остановить фоновое обновление"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Глобальный экземпляр справочника
+phone_directory = PhoneDirectory()
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Set, Tuple
+
+from loguru import logger
+
+from tgbot.constants import SALES_SUMMARY
+from tgbot.services.cache_service import cache_service, period_tag, sales_tag
+from tgbot.services.db_sessions import read_sessions
+
+
+def resync_start(months: int, now: Optional[datetime] = None) -> datetime:
+    """Начало периода пересчёта: первое число месяца months - 1 месяцев назад"""
+    now = now or datetime.now()
+    index = now.year * 12 + now.month - 1 - (months - 1)
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _row_key(row: Optional[Dict[str, Any]]) -> Optional[tuple]:
+    """Значения строки сводки для сравнения хранимой строки с пересчитанной"""
+    if row is None:
+        return None
+    return (
+        row["sls_datetime"], row["customer_id"], row["object_id"], row["status_id"],
+        Decimal(str(row["amount"])).quantize(Decimal("0.0001")), int(row["line_count"]),
+    )
+
+
+class SalesSummaryRefresher:
+    """Поддержание таблицы bot_sales_summary (SalesSummary) в актуальном состоянии.
+
+    Новые документы догружаются инкрементально: всё, что появилось в doc_sales
+    после high-water mark (последнего обработанного sls_id, хранится в
+    bot_sync_state), агрегируется пачками по BATCH_SIZE документов. Первое
+    заполнение - та же догрузка с нуля, поэтому её можно прервать и продолжить.
+    Она идёт в фоновой задаче и не задерживает запуск бота; пока high-water
+    mark не догнал ERP (ready = False), списки читают агрегат ERP.
+
+    В ERP нет отметки времени изменения документа, поэтому правки, удаление
+    и проведение ранее загруженных документов учитываются пересчётом
+    последних RESYNC_MONTHS месяцев раз в RESYNC_INTERVAL. Пересчитываются
+    документы, датированные этим периодом в ERP или в таблице: документ,
+    дату которого перенесли в прошлое, перечитывается по sls_id.
+
+    ERP читается через пул чтения (read_sessions), таблица и high-water mark
+    пишутся и читаются через основную БД.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = SALES_SUMMARY["REFRESH_INTERVAL"],
+        resync_interval: float = SALES_SUMMARY["RESYNC_INTERVAL"],
+        resync_months: int = SALES_SUMMARY["RESYNC_MONTHS"],
+        batch_size: int = SALES_SUMMARY["BATCH_SIZE"],
+    ):
+        self.refresh_interval = refresh_interval
+        self.resync_interval = resync_interval
+        self.resync_months = resync_months
+        self.batch_size = batch_size
+        self.ready = False
+        self._last_resync = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh_new(self, db_session) -> int:
+        """Догрузить документы после high-water mark; вернуть количество добавленных строк"""
+        from tgbot.models.models import SalesSummary, SyncState
+        erp_session = read_sessions(db_session)
+        started = time.monotonic()
+        async with self._lock:
+            after_id = await SyncState.get_value(db_session, SalesSummary.HIGH_WATER_MARK)
+            upto_id = await SalesSummary.get_erp_max_id(erp_session)
+            added = 0
+            periods: Set[Tuple[int, int]] = set()
+            while after_id < upto_id:
+                rows = await SalesSummary.get_source_range(erp_session, after_id, upto_id, self.batch_size)
+                # Неполная пачка - документов до upto_id больше нет
+                batch_upto = rows[-1]["sls_id"] if len(rows) == self.batch_size else upto_id
+                await SalesSummary.replace_range(db_session, rows, after_id, batch_upto)
+                added += len(rows)
+                periods.update((row["sls_year"], row["sls_month"]) for row in rows)
+                after_id = batch_upto
+        if periods:
+            # Новые накладные должны появиться в списках, не дожидаясь TTL кэша
+            await cache_service.invalidate_tags(*(period_tag(year, month) for year, month in sorted(periods)))
+            logger.debug(f"Sales summary: {added} new documents")
+        if not self.ready:
+            self.ready = True
+            logger.info(f"Sales summary ready: {added} new documents in {time.monotonic() - started:.1f}s")
+        return added
+
+    async def resync(self, db_session) -> int:
+        """Пересчитать документы последних resync_months месяцев; вернуть количество изменённых строк"""
+        from tgbot.models.models import SalesSummary, SyncState
+        erp_session = read_sessions(db_session)
+        since = resync_start(self.resync_months)
+        async with self._lock:
+            upto_id = await SyncState.get_value(db_session, SalesSummary.HIGH_WATER_MARK)
+            stored = await SalesSummary.get_since(db_session, since, upto_id)
+            source = {row["sls_id"]: row for row in await SalesSummary.get_source_since(erp_session, since, upto_id)}
+            # Документы периода, которых нет в выборке ERP по дате: дата перенесена
+            # в прошлое, документ удалён или распроведён - перечитываются по sls_id
+            left = [sales_id for sales_id in stored if sales_id not in source]
+            source.update(
+                (row["sls_id"], row) for row in await SalesSummary.get_source_by_ids(erp_session, left, self.batch_size)
+            )
+            # Документы, перенесённые в период из более ранних месяцев: нужен их прежний период
+            entered = [sales_id for sales_id in source if sales_id not in stored]
+            stored.update(await SalesSummary.get_by_ids(db_session, entered, self.batch_size))
+
+            changed = sorted(
+                sales_id for sales_id in stored.keys() | source.keys()
+                if _row_key(stored.get(sales_id)) != _row_key(source.get(sales_id))
+            )
+            if changed:
+                rows = [source[sales_id] for sales_id in changed if sales_id in source]
+                await SalesSummary.replace_ids(db_session, rows, changed, self.batch_size)
+            self._last_resync = time.monotonic()
+        if changed:
+            # Прежний и новый период изменённых документов, а также их детализация
+            periods = {
+                (row["sls_year"], row["sls_month"])
+                for sales_id in changed for row in (stored.get(sales_id), source.get(sales_id)) if row is not None
+            }
+            await cache_service.invalidate_tags(
+                *(period_tag(year, month) for year, month in sorted(periods)),
+                *(sales_tag(sales_id) for sales_id in changed)
+            )
+        logger.debug(f"Sales summary: {len(changed)} documents since {since:%Y-%m-%d} resynced")
+        return len(changed)
+
+    async def _loop(self, db_session) -> None:
+        while True:
+            try:
+                await self.refresh_new(db_session)
+                if time.monotonic() - self._last_resync >= self.resync_interval:
+                    await self.resync(db_session)
+            except Exception as e:
+                logger.error(f"Sales summary refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self, db_session) -> None:
+        """Запустить фоновое обновление (при первом запуске оно заполняет таблицу целиком)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(db_session))
+
+    async def stop(self) -> None:
+        """Остановить фоновое обновление"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Глобальный экземпляр
+sales_summary = SalesSummaryRefresher()
@@ -0,0 +1,121 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Type, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from tgbot.services.db_sessions import read_sessions
+
+ServiceT = TypeVar("ServiceT")
+
+
+class ScopedSession:
+    """Фабрика сессий одного апдейта: блоки async with db_session() as session
+    получают одну и ту же AsyncSession, созданную при первом обращении.
+
+    При выходе из внешнего блока сессия закрывается (соединение возвращается
+    в пул) и при следующем блоке используется снова - апдейт не держит
+    соединение, пока обработчик ждёт Telegram или собирает Excel.
+
+    AsyncSession нельзя использовать из нескольких задач одновременно, поэтому
+    другая задача (фоновое обновление кэша), вошедшая во время открытого блока,
+    а также любой блок после close() получают отдельную сессию.
+
+    Потоковые запросы (session.stream) держат курсор на сервере до конца
+    чтения, и другие запросы в той же сессии с ним конфликтуют ("commands out
+    of sync" в aiomysql), поэтому они берут отдельную сессию через isolated().
+    """
+
+    def __init__(self, factory: sessionmaker):
+        self.factory = factory
+        self._session: Optional[AsyncSession] = None
+        self._owner: Optional[asyncio.Task] = None
+        self._depth = 0
+        self._closed = False
+
+    def __call__(self, **kwargs):
+        return self._scope()
+
+    def isolated(self, **kwargs) -> AsyncSession:
+        """Отдельная сессия, не разделяемая с остальными блоками апдейта"""
+        return self.factory(**kwargs)
+
+    @asynccontextmanager
+    async def _scope(self):
+        task = asyncio.current_task()
+        if self._closed or (self._depth and task is not self._owner):
+            async with self.factory() as session:
+                yield session
+            return
+
+        if self._session is None:
+            self._session = self.factory()
+        if not self._depth:
+            self._owner = task
+        self._depth += 1
+        try:
+            yield self._session
+        finally:
+            self._depth -= 1
+            if not self._depth:
+                await self._session.close()
+
+    async def close(self) -> None:
+        """Закрыть сессию в конце апдейта"""
+        self._closed = True
+        if self._session is not None and not self._depth:
+            await self._session.close()
+
+
+class UnitOfWork:
+    """Контекст одного апдейта: сессии, результаты запросов и сервисы.
+
+    Передаётся вместо фабрики сессий (db_session) в сервисы и методы TGUser:
+    вызов возвращает сессию записи, атрибут read - сессию пула чтения ERP.
+    Повторные обращения в пределах апдейта (пользователь, сервисы)
+    выполняются один раз через memo() и service().
+    """
+
+    def __init__(self, db_session):
+        self.sessions = db_session
+        self.write = ScopedSession(db_session.write if hasattr(db_session, "write") else db_session)
+        read = read_sessions(db_session)
+        self.read = self.write if read is self.write.factory else ScopedSession(read)
+        self._memo: Dict[Hashable, Any] = {}
+        self._services: Dict[type, Any] = {}
+
+    def __call__(self, **kwargs):
+        return self.write(**kwargs)
+
+    def isolated(self, **kwargs) -> AsyncSession:
+        """Отдельная сессия записи (для потоковых запросов)"""
+        return self.write.isolated(**kwargs)
+
+    @property
+    def engines(self) -> Dict[str, AsyncEngine]:
+        """Движки пулов (для статистики пула)"""
+        return getattr(self.sessions, "engines", None) or {"write": self.write.factory.kw["bind"]}
+
+    async def memo(self, key: Hashable, getter: Callable[[], Awaitable[Any]]) -> Any:
+        """Результат getter, вычисленный один раз за апдейт"""
+        if key not in self._memo:
+            self._memo[key] = await getter()
+        return self._memo[key]
+
+    def forget(self, *keys: Hashable) -> None:
+        """Забыть запомненные результаты (после изменения данных)"""
+        for key in keys:
+            self._memo.pop(key, None)
+
+    def service(self, service_class: Type[ServiceT]) -> ServiceT:
+        """Сервис, работающий через сессии этого апдейта (один экземпляр на класс)"""
+        if service_class not in self._services:
+            self._services[service_class] = service_class(self)
+        return self._services[service_class]
+
+    async def close(self) -> None:
+        """Вернуть соединения в пул в конце апдейта"""
+        await self.write.close()
+        if self.read is not self.write:
+            await self.read.close()
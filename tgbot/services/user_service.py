@@ -2,57 +2,69 @@ from typing import List, Dict, Any, Optional
 from loguru import logger
 from tgbot.services.base_service import BaseService
 from tgbot.models.models import TGUser
-from tgbot.services.cache_service import cache_service
+from tgbot.services.cache_service import cache_service, period_tag, phone_tag
+from tgbot.constants import CACHE_STALE_TTL, CACHE_TTL
 
 
 class UserService(BaseService):
     """Сервис для пользовательских операций"""
     
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[TGUser]:
-        """Получить пользователя по Telegram ID"""
-        return await self.safe_execute(
-            "get_user_by_telegram_id",
-            TGUser.get_user,
-            self.db,
-            telegram_id
+        """Получить пользователя по Telegram ID (один раз за апдейт)"""
+        return await self.memoized(
+            TGUser.cache_key(telegram_id),
+            lambda: self.safe_execute("get_user_by_telegram_id", TGUser.get_user, self.db, telegram_id)
         )
     
     async def update_user_phone(self, telegram_id: int, phone: str) -> Optional[TGUser]:
         """Обновить номер телефона пользователя"""
-        return await self.safe_execute(
+        result = await self.safe_execute(
             "update_user_phone",
             TGUser.update_user,
             self.db,
             telegram_id,
             phone=phone
         )
+        self.forget(TGUser.cache_key(telegram_id))
+        return result
     
-    async def get_user_invoice(self, phone: str, month: str) -> List[Dict[str, Any]]:
-        """Получить накладную пользователя"""
-        cache_key = f"user_invoice_{phone}_{month}"
+    async def get_user_invoice(self, phone: str, year: int, month: int) -> List[Dict[str, Any]]:
+        """Получить накладную пользователя за месяц указанного года"""
+        year, month = int(year), int(month)
+        cache_key = f"user_invoice_{phone}_{year}_{month:02d}"
         return await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_user_invoice(self.db, phone, month),
-            ttl_seconds=600
+            lambda: self.query_by_phone(TGUser.get_user_invoice, phone, year, month),
+            ttl_seconds=600,
+            tags=[phone_tag(phone), period_tag(year, month)]
         )
     
-    async def get_user_reconciliation(self, phone: str, year: int, month: int) -> List[Dict[str, Any]]:
-        """Получить данные акта сверки пользователя"""
+    async def get_user_reconciliation(self, phone: str, year: int, month: int, allow_stale: bool = False) -> List[Dict[str, Any]]:
+        """Получить данные акта сверки пользователя
+
+        allow_stale - вернуть устаревшие данные сразу и обновить их в фоне
+        """
         cache_key = f"user_reconciliation_{phone}_{year}_{month}"
         return await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_customer_sales_summary(self.db, phone, year, month),
-            ttl_seconds=600
+            lambda: self.query_by_phone(TGUser.get_customer_sales_summary, phone, year, month),
+            ttl_seconds=600,
+            stale_ttl=CACHE_STALE_TTL["USER_RECONCILIATION"] if allow_stale else 0,
+            tags=[phone_tag(phone), period_tag(year, month)],
+            compact=True
         )
     
     async def get_customer_name(self, phone: str) -> str:
-        """Получить название покупателя по номеру телефона"""
+        """Получить название покупателя по номеру телефона (или сам номер, если покупатель не найден)"""
         cache_key = f"customer_name_{phone}"
-        return await self.get_cached_data(
+        name = await self.get_cached_data(
             cache_key,
-            lambda: TGUser.get_customer_name_by_phone(self.db, phone),
-            ttl_seconds=3600
+            lambda: self.query_by_phone(TGUser.get_customer_name, phone),
+            ttl_seconds=3600,
+            tags=[phone_tag(phone)],
+            negative_ttl=CACHE_TTL["CUSTOMER_NAME_NOT_FOUND"]
         )
+        return name or phone
     
     def format_reconciliation_summary(self, summary: List[Dict[str, Any]], phone: str, year: int, month: int) -> str:
         """Форматировать сводку акта сверки"""
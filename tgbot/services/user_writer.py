@@ -0,0 +1,107 @@
+import asyncio
+from typing import Dict, Optional
+
+from loguru import logger
+
+from tgbot.constants import USER_WRITE_BEHIND
+
+
+class UserWriteBuffer:
+    """Отложенная запись пользователей бота (write-behind).
+
+    Новые пользователи и изменённые профили Telegram не пишутся в
+    telegram_users по одному: они копятся в памяти и записываются одним
+    многострочным INSERT ... ON DUPLICATE KEY UPDATE не реже чем раз в
+    FLUSH_INTERVAL или сразу при накоплении MAX_BATCH пользователей.
+
+    До записи пользователь доступен через get(), поэтому обработчики видят
+    его сразу. При ошибке записи пользователи возвращаются в буфер и
+    записываются при следующей попытке; stop() записывает остаток буфера.
+    Пока буфер не запущен, add() пишет пользователя сразу.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = USER_WRITE_BEHIND["FLUSH_INTERVAL"],
+        max_batch: int = USER_WRITE_BEHIND["MAX_BATCH"],
+    ):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: Dict[int, "TGUser"] = {}
+        # Пользователи, которые записываются прямо сейчас
+        self._flushing: Dict[int, "TGUser"] = {}
+        self._db_session = None
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, telegram_id: int) -> Optional["TGUser"]:
+        """Пользователь, ещё не записанный в БД, или None"""
+        return self._pending.get(telegram_id) or self._flushing.get(telegram_id)
+
+    async def add(self, db_session, user: "TGUser") -> None:
+        """Поставить пользователя (новый или с изменённым профилем) в очередь на запись"""
+        if self._task is None:
+            from tgbot.models.models import TGUser
+
+            await TGUser.upsert_users(db_session, [user])
+            return
+        self._pending[user.telegram_id] = user
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Записать накопленных пользователей; вернуть их количество"""
+        from tgbot.models.models import TGUser
+
+        async with self._lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            try:
+                written = await TGUser.upsert_users(self._db_session, self._flushing.values(), self.max_batch)
+            except BaseException:
+                # В т.ч. отмена при остановке. Более новые версии пользователей, добавленные во время записи, важнее
+                for telegram_id, user in self._flushing.items():
+                    self._pending.setdefault(telegram_id, user)
+                raise
+            finally:
+                self._flushing = {}
+        logger.debug(f"User write-behind: {written} users written")
+        return written
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"User write-behind flush failed ({len(self._pending)} users pending): {e}")
+
+    def start(self, db_session) -> None:
+        """Запустить фоновую запись"""
+        self._db_session = db_session
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Остановить фоновую запись и записать остаток буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"User write-behind: {len(self._pending)} users were not written on shutdown: {e}")
+
+
+# Глобальный экземпляр буфера записи пользователей
+user_writer = UserWriteBuffer()